@@ -1,13 +1,21 @@
 """getfromjson.py module."""
 
+import codecs
+import functools
+import io
 import json
 import logging
 import re
 from typing import (
     Any,
+    Callable,
     Dict,
+    Iterable,
     List,
+    NamedTuple,
     Optional,
+    Set,
+    Tuple,
     Union,
 )
 
@@ -24,6 +32,97 @@ if not IS_LOCAL_TESTING:  # pragma: no cover
 JSON_DATA_MAX_BYTES = 4096
 SEARCH_MAX_BYTES = 256
 
+# Max number of parsed search queries to keep across warm invocations.
+SEARCH_CACHE_SIZE = 128
+
+# Number of bytes to read at a time from a json_data_source document.
+STREAM_CHUNK_SIZE = 65536
+
+# Containers up to this many characters long are skipped by decoding
+# them in one go, rather than one member at a time.
+STREAM_DECODE_MAX_CHARS = STREAM_CHUNK_SIZE
+JSON_DECODER = json.JSONDecoder()
+
+# Patterns for the streaming JSON extractor: a complete string,
+# whitespace, and a number, true, false or null.
+JSON_STRING_PATTERN = re.compile('"[^"\\\\]*(?:\\\\.[^"\\\\]*)*"', re.DOTALL)
+JSON_WHITESPACE_PATTERN = re.compile("[ \t\n\r]*")
+JSON_SCALAR_PATTERN = re.compile("[^,\\]}\\s]+")
+
+# Accepted steps in a search query include:
+#
+#   - bracket-enclosed input values represented as alphanumeric
+#     string keys (that might also contain dashes and underscores),
+#     like ["mytest"], whereas the string key itself is enclosed in
+#     double quotes, or
+#
+#   - like the above, but with single quotes wrapping the value, like
+#     ['mytest'], or
+#
+#   - integer values wrapped in brackets, like [0], or
+#
+#   - a wildcard, [*], for every value in a map or list, or
+#
+#   - a list slice, like [1:3], [-2:] or [::2], or
+#
+#   - a filter, like [?(@["name"]=="test")], for the values in a map or
+#     list for which a key/index search equals a string, integer, true,
+#     false or null.
+#
+# Any of these can be preceded by "..", like ..["mytest"], to apply
+# the step to the value and to every value nested in it.
+#
+# Each alternative has its own capturing group, so a match tells
+# which kind of step it is without matching the step a second time.
+SEARCH_STEP_PATTERN = re.compile(
+    "(?P<descent>\\.\\.)?\\[(?:"
+    "\"(?P<double_quoted_key>[a-zA-Z0-9_-]+)\""
+    "|'(?P<single_quoted_key>[a-zA-Z0-9_-]+)'"
+    "|(?P<index>[0-9]+)"
+    "|(?P<wildcard>\\*)"
+    "|(?P<start>-?[0-9]*):(?P<stop>-?[0-9]*)(?::(?P<step>-?[0-9]*))?"
+    "|\\?\\(@(?P<filter_search>(?:\\[[^\\]]+\\])+)=="
+    "(?P<filter_value>\"[^\"]*\"|'[^']*'|-?[0-9]+|true|false|null)\\)"
+    ")\\]"
+)
+
+# A step in a parsed search query that leads to one value: a map key
+# (str) or a list index (int).
+SearchStep = Union[str, int]
+
+
+class Wildcard(NamedTuple):
+    """A [*] step."""
+
+
+class Slice(NamedTuple):
+    """A [start:stop:step] step."""
+
+    start: Optional[int]
+    stop: Optional[int]
+    step: Optional[int]
+
+
+class Filter(NamedTuple):
+    """A [?(@search==value)] step."""
+
+    search: Tuple[SearchStep, ...]
+    value: Any
+
+
+class Descent(NamedTuple):
+    """A step preceded by "..", applied at every level."""
+
+    step: Any
+
+
+# Any step in a parsed search query.
+PathStep = Union[str, int, Wildcard, Slice, Filter, Descent]
+
+# An evaluator for the steps of a search query that can lead to many
+# values: it takes a value, and returns the list of values found.
+Evaluator = Callable[[Any], List[Any]]
+
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
 # LOGGER.setLevel(logging.DEBUG)
@@ -35,12 +134,27 @@ def lambda_handler(
 ) -> bool:
     """Lambda function entry-point."""
     try:
-        json_data = event["ResourceProperties"]["json_data"]
-        search = event["ResourceProperties"]["search"]
+        properties = event["ResourceProperties"]
+        # JSON data is either inline in "json_data", or read from an S3
+        # object or SSM parameter referenced by "json_data_source".
+        json_data = properties.get("json_data")
+        json_data_source = properties.get("json_data_source")
+        if (json_data is None) == (json_data_source is None):
+            raise ValueError(
+                "Exactly one of json_data and json_data_source is required."
+            )
+
+        # A map of named searches in "searches" returns each value as a
+        # separate attribute; otherwise "search" returns one value as
+        # the "Data" attribute.
+        search = properties.get("searches")
+        if search is None:
+            search = properties["search"]
 
         _validate_input(
             json_data=json_data,
             search=search,
+            json_data_source=json_data_source,
         )
 
         if not IS_LOCAL_TESTING:
@@ -49,18 +163,38 @@ def lambda_handler(
                 # Return True only if the request type is "Delete".
                 return True
 
-        response_data = {}
-        response_data["Data"] = _traverse(
-            data_from_json=json.loads(json_data),
-            search=search,
-        )
+        # Values found by searches that can match many are joined with
+        # the delimiter, ready for Fn::Split.
+        delimiter = properties.get("delimiter", ",")
+        if not isinstance(delimiter, str):
+            raise ValueError("Invalid delimiter.")
+
+        response_data: Dict[str, str] = {}
+        if json_data_source is not None:
+            response_data = _traverse_source(
+                json_data_source=json_data_source,
+                searches=search if isinstance(search, dict) else {"Data": search},
+                delimiter=delimiter,
+            )
+        elif isinstance(search, dict):
+            response_data = _traverse_many(
+                data_from_json=json.loads(json_data),
+                searches=search,
+                delimiter=delimiter,
+            )
+        else:
+            response_data["Data"] = _traverse(
+                data_from_json=json.loads(json_data),
+                search=search,
+                delimiter=delimiter,
+            )
         LOGGER.debug(response_data)
 
         if not IS_LOCAL_TESTING:
             _send_response(event, context, cfnresponse.SUCCESS, response_data)
 
         return True
-    except (IndexError, KeyError, ValueError) as invalid_input:
+    except (IndexError, KeyError, TypeError, ValueError) as invalid_input:
         message = f"Error: {str(invalid_input)}"
         LOGGER.error(message)
         if not IS_LOCAL_TESTING:
@@ -70,102 +204,626 @@ def lambda_handler(
 
 
 def _validate_input(
-    json_data: str,
-    search: str,
+    json_data: Optional[str],
+    search: Union[str, Dict[str, str]],
+    json_data_source: Optional[str] = None,
 ) -> None:
-    """Validate provided input."""
-    if len(json_data.encode()) > JSON_DATA_MAX_BYTES:
+    """Validate provided input.
+
+    search is either one search query, or a map of names to search
+    queries. JSON data read from json_data_source isn't limited in size.
+    """
+    if json_data is not None and len(json_data.encode()) > JSON_DATA_MAX_BYTES:
         raise ValueError(
             f"json_data limit ({JSON_DATA_MAX_BYTES} bytes) exceeded."
         )
 
-    if len(search.encode()) > SEARCH_MAX_BYTES:
-        raise ValueError(f"query limit ({SEARCH_MAX_BYTES} bytes) exceeded.")
-
-    # Accepted input search values include:
-    #
-    #   - bracket-enclosed input values represented as alphanumeric
-    #     string keys (that might also contain dashes and
-    #     underscores), like ["mytest"], whereas the string key itself
-    #     is enclosed in double quotes and the trailing quote is not
-    #     escaped, or
-    #
-    #   - like the above, but with single quotes wrapping the value,
-    #     like ['mytest'], or
-    #
-    #   - integer values wrapped in brackets, like [0].
-    #
-    # The following regular expression encompasses the three cases
-    # above, whereas each case is delimited by a logical OR ("|")
-    # character, and the check for the unescaped trailing quote is
-    # implemented with a negative lookbehind regex: "(?<!\\\\)".
-    search_pattern = "^((\\[\"[a-zA-Z0-9_-]+(?<!\\\\)\"\\])+)|((\\['[a-zA-Z0-9_-]+(?<!\\\\)'\\])+)|((\\[[0-9]+\\])+)$"  # noqa: E501 # pylint: disable=C0301
-
-    LOGGER.debug("search: %s", search)
-    LOGGER.debug("Validate search query against pattern: %s", search_pattern)
-    if not re.match(
-        pattern=search_pattern,
-        string=search,
-    ):
+    if json_data_source is not None:
+        _parse_json_data_source(
+            json_data_source=json_data_source,
+        )
+
+    if isinstance(search, dict):
+        if not search:
+            raise ValueError("No searches provided.")
+        searches = list(search.values())
+    else:
+        searches = [search]
+
+    for query in searches:
+        if not isinstance(query, str):
+            raise ValueError("Invalid search query.")
+
+        if len(query.encode()) > SEARCH_MAX_BYTES:
+            raise ValueError(
+                f"query limit ({SEARCH_MAX_BYTES} bytes) exceeded."
+            )
+
+        LOGGER.debug("search: %s", query)
+        _parse_search(
+            search=query,
+        )
+
+
+@functools.lru_cache(maxsize=SEARCH_CACHE_SIZE)
+def _parse_search(
+    search: str,
+) -> Tuple[PathStep, ...]:
+    """Parse and validate search, and return its steps.
+
+    For example, '["test"]['test1'][1]' has 3 steps: "test", "test1",
+    and 1. Results are cached by search string.
+    """
+    steps: List[PathStep] = []
+    position = 0
+    while position < len(search):
+        match = SEARCH_STEP_PATTERN.match(search, position)
+        if not match:
+            raise ValueError("Invalid search query.")
+        step = _parse_step(match)
+        steps.append(Descent(step) if match.group("descent") else step)
+        position = match.end()
+
+    if not steps:
         raise ValueError("Invalid search query.")
 
+    LOGGER.debug("search steps found: %s", steps)
+    return tuple(steps)
+
+
+def _parse_step(
+    match: "re.Match[str]",
+) -> PathStep:
+    """Return the step for a match of SEARCH_STEP_PATTERN."""
+    groups = match.groupdict()
+    if groups["index"] is not None:
+        return int(groups["index"])
+    if groups["wildcard"] is not None:
+        return Wildcard()
+    if groups["filter_search"] is not None:
+        # Filters search with single steps only.
+        filter_search: List[SearchStep] = []
+        for filter_step in _parse_search(search=groups["filter_search"]):
+            if not isinstance(filter_step, (str, int)):
+                raise ValueError("Invalid search query.")
+            filter_search.append(filter_step)
+        filter_value = groups["filter_value"]
+        if filter_value.startswith("'"):
+            filter_value = json.dumps(filter_value[1:-1])
+        return Filter(tuple(filter_search), json.loads(filter_value))
+    if groups["stop"] is not None:
+        start, stop, step = (
+            int(groups[name]) if groups[name] else None
+            for name in ("start", "stop", "step")
+        )
+        if step == 0:
+            raise ValueError("Invalid search query.")
+        return Slice(start, stop, step)
+    key: str = groups["double_quoted_key"] or groups["single_quoted_key"]
+    return key
+
+
+@functools.lru_cache(maxsize=SEARCH_CACHE_SIZE)
+def _compile_search(
+    search: str,
+) -> Tuple[Tuple[SearchStep, ...], Optional[Evaluator]]:
+    """Compile search into the steps that lead to one value, and an
+    evaluator for the steps after them, if any, that can lead to many.
+
+    For example, '["test"][*]["name"]' is compiled into ("test",) and
+    an evaluator for [*]["name"]. Results are cached by search string.
+    """
+    steps = _parse_search(search=search)
+    single: List[SearchStep] = []
+    for step in steps:
+        if not isinstance(step, (str, int)):
+            break
+        single.append(step)
+
+    if len(single) == len(steps):
+        return tuple(single), None
+
+    functions = [_compile_step(step) for step in steps[len(single) :]]  # noqa: E203 E501
+
+    def evaluate(value: Any) -> List[Any]:
+        values = [value]
+        for function in functions:
+            values = [found for value in values for found in function(value)]
+        return values
+
+    return tuple(single), evaluate
+
+
+def _compile_step(  # pylint: disable=R0911
+    step: PathStep,
+) -> Callable[[Any], Iterable[Any]]:
+    """Return a function that returns the values step leads to.
+
+    Unlike a traversal with single steps, a missing key or index leads
+    to no values rather than an error.
+    """
+    if isinstance(step, Descent):
+        function = _compile_step(step.step)
+        return lambda value: (
+            found for nested in _walk(value) for found in function(nested)
+        )
+    if isinstance(step, Wildcard):
+        return _children
+    if isinstance(step, Slice):
+        selection = slice(*step)
+        return lambda value: (
+            value[selection] if isinstance(value, list) else ()
+        )
+    if isinstance(step, Filter):
+        return lambda value: (
+            child
+            for child in _children(value)
+            if _filter_matches(child, step)
+        )
+    if isinstance(step, int):
+        return lambda value: (
+            (value[step],)
+            if isinstance(value, list) and step < len(value)
+            else ()
+        )
+    return lambda value: (
+        (value[step],) if isinstance(value, dict) and step in value else ()
+    )
+
+
+def _children(
+    value: Any,
+) -> Iterable[Any]:
+    """Return the values in a map or list."""
+    if isinstance(value, dict):
+        return value.values()
+    if isinstance(value, list):
+        return value
+    return ()
+
+
+def _walk(
+    value: Any,
+) -> Iterable[Any]:
+    """Yield value and every value nested in it, parents first."""
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        yield value
+        pending.extend(reversed(list(_children(value))))
+
+
+def _filter_matches(
+    value: Any,
+    step: Filter,
+) -> bool:
+    """Return whether the filter search on value finds the filter value."""
+    for search_step in step.search:
+        if isinstance(search_step, int):
+            if not isinstance(value, list) or search_step >= len(value):
+                return False
+        elif not isinstance(value, dict) or search_step not in value:
+            return False
+        value = value[search_step]
+
+    # true and 1 are different values in JSON.
+    return bool(
+        value == step.value
+        and isinstance(value, bool) == isinstance(step.value, bool)
+    )
+
+
+def _format_values(
+    value: Any,
+    evaluator: Optional[Evaluator],
+    delimiter: str,
+) -> str:
+    """Return value as a string, or the values that evaluator finds in
+    it joined with delimiter.
+    """
+    if evaluator is None:
+        return str(value)
+    return delimiter.join(str(found) for found in evaluator(value))
+
 
 def _traverse(
     data_from_json: Union[Dict[str, Any] | List[Any]],
     search: str,
+    delimiter: str = ",",
 ) -> Any:
-    """Traverses the data structure, and returns the value matching search."""
+    """Traverses the data structure, and returns the value matching search.
+
+    Searches that can match many values return them joined with
+    delimiter.
+    """
     LOGGER.debug("data_from_json: %s", data_from_json)
 
-    search_tokens = _get_search_tokens(
-        search=search,
+    steps, evaluator = _compile_search(search=search)
+    value: Any = data_from_json
+    for step in steps:
+        value = value[step]
+        LOGGER.debug("Value: %s", value)
+
+    return _format_values(value, evaluator, delimiter)
+
+
+def _traverse_many(
+    data_from_json: Union[Dict[str, Any] | List[Any]],
+    searches: Dict[str, str],
+    delimiter: str = ",",
+) -> Dict[str, str]:
+    """Traverses the data structure once for many searches.
+
+    Returns a map of each search's name to the value matching the
+    search. Searches that share leading steps, like '["a"]["b"][0]' and
+    '["a"]["b"][1]', share the traversal of those steps.
+    """
+    values: Dict[str, str] = {}
+    _resolve_search_tree(
+        tree=_search_tree(searches=searches),
+        value=data_from_json,
+        values=values,
+        delimiter=delimiter,
     )
 
-    # Used when removing quotes enclosing a token representing a map's
-    # key string: match map keys (alphanumeric characters, dashes,
-    # underscores) enclosed in quotes, whose trailing quote is not
-    # escaped.
-    search_token_map_key_pattern = "^((\"[a-zA-Z0-9_-]+(?<!\\\\)\")+)|(('[a-zA-Z0-9_-]+(?<!\\\\)')+)$"  # nosec B105 # noqa: E501 # pylint: disable=C0301
-    LOGGER.debug("search_token_pattern: %s", search_token_map_key_pattern)
-
-    value = data_from_json
-    for search_token in search_tokens:
-        if re.match(
-            pattern=search_token_map_key_pattern,
-            string=search_token,
-        ):
-            # Remove wrapping quotes.
-            search_token = search_token[
-                1 : len(search_token) - 1  # noqa: E203
-            ]
-        else:
-            # Otherwise, use as an integer for a list's index.
-            search_token = int(search_token)
-        LOGGER.debug(
-            "search_token: %s, type: %s", search_token, type(search_token)
+    LOGGER.debug("Values: %s", values)
+    return values
+
+
+def _search_tree(
+    searches: Dict[str, str],
+) -> Dict[Optional[SearchStep], Any]:
+    """Build a tree of steps from a map of names to search queries.
+
+    Each node maps a step to the node for the following steps, and None
+    to the names of searches ending there, with the evaluators for any
+    steps of theirs that can lead to many values.
+    """
+    tree: Dict[Optional[SearchStep], Any] = {}
+    for name, search in searches.items():
+        node = tree
+        steps, evaluator = _compile_search(search=search)
+        for step in steps:
+            node = node.setdefault(step, {})
+        node.setdefault(None, []).append((name, evaluator))
+
+    return tree
+
+
+def _resolve_search_tree(
+    tree: Dict[Optional[SearchStep], Any],
+    value: Any,
+    values: Dict[str, str],
+    delimiter: str,
+) -> None:
+    """Add the values for all searches in tree, starting at value."""
+    pending: List[Tuple[Dict[Optional[SearchStep], Any], Any]] = [
+        (tree, value)
+    ]
+    while pending:
+        node, value = pending.pop()
+        for key, child in node.items():
+            if key is None:
+                for name, evaluator in child:
+                    values[name] = _format_values(value, evaluator, delimiter)
+            else:
+                pending.append((child, value[key]))
+
+
+def _parse_json_data_source(
+    json_data_source: str,
+) -> Tuple[str, str, str]:
+    """Parse and validate a json_data_source reference.
+
+    Returns "s3", the bucket and the key for "s3://bucket/key", or
+    "ssm", the parameter name and an empty string for "ssm:name".
+    """
+    if not isinstance(json_data_source, str):
+        raise ValueError("Invalid json_data_source.")
+
+    if json_data_source.startswith("s3://"):
+        bucket, _, key = json_data_source[len("s3://") :].partition("/")  # noqa: E203 E501
+        if bucket and key:
+            return "s3", bucket, key
+    elif json_data_source.startswith("ssm:"):
+        name = json_data_source[len("ssm:") :]  # noqa: E203
+        if name:
+            return "ssm", name, ""
+
+    raise ValueError("Invalid json_data_source.")
+
+
+@functools.lru_cache(maxsize=None)
+def _get_client(
+    service: str,
+) -> Any:  # pragma: no cover
+    """Return a boto3 client for service, kept across warm invocations."""
+    import boto3  # type: ignore # pylint: disable=C0415
+
+    return boto3.client(service)
+
+
+def _open_json_data_source(
+    json_data_source: str,
+) -> Any:
+    """Return a file-like object to read the referenced JSON data from."""
+    service, name, key = _parse_json_data_source(
+        json_data_source=json_data_source,
+    )
+    try:
+        if service == "s3":
+            return _get_client("s3").get_object(Bucket=name, Key=key)["Body"]
+
+        parameter = _get_client("ssm").get_parameter(
+            Name=name, WithDecryption=True
         )
-        value = value[search_token]
-        LOGGER.debug("Value: %s", str(value))
+        return io.StringIO(parameter["Parameter"]["Value"])
+    except Exception as error:  # pylint: disable=W0718
+        raise ValueError(
+            f"Unable to read json_data_source: {str(error)}"
+        ) from error
 
-    return str(value)
 
+def _traverse_source(
+    json_data_source: str,
+    searches: Dict[str, str],
+    delimiter: str = ",",
+) -> Dict[str, str]:
+    """Get values for many searches from a json_data_source document.
 
-def _get_search_tokens(
-    search: str,
-) -> List[Any]:
-    """Get tokens enclosed in brackets from search."""
-    # Find all the tokens in square brackets from the search string;
-    # for example, '["test"]["test1"][1]' has 3 tokens: ["test"],
-    # ["test1"], and [1].
-    search_tokens_pattern = "\\[(['\"a-zA-Z0-9_-]+)\\]"
-    LOGGER.debug("search_tokens_pattern: %s", search_tokens_pattern)
-    search_tokens = re.findall(
-        pattern=search_tokens_pattern,
-        string=search,
+    The document is streamed rather than loaded, and reading stops as
+    soon as all searches are resolved.
+    """
+    reader = _open_json_data_source(
+        json_data_source=json_data_source,
+    )
+    try:
+        values = _traverse_stream(
+            reader=reader,
+            searches=searches,
+            delimiter=delimiter,
+        )
+    finally:
+        reader.close()
+
+    LOGGER.debug("Values: %s", values)
+    return values
+
+
+class _SearchesResolved(Exception):
+    """Raised to stop reading once every search is resolved."""
+
+
+class _JsonStream:
+    """Reads JSON text a chunk at a time from a file-like object.
+
+    Only the unread part of the current chunk is kept in memory, plus
+    the text of a value while it's being captured.
+    """
+
+    def __init__(self, reader: Any) -> None:
+        """Initialize the stream."""
+        self.reader = reader
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        self.captured: Optional[List[str]] = None
+        self.capture_start = 0
+
+    def fill(self) -> bool:
+        """Read the next chunk, and return False at the end of the data."""
+        chunk = self.reader.read(STREAM_CHUNK_SIZE)
+        text = (
+            self.decoder.decode(chunk, final=not chunk)
+            if isinstance(chunk, bytes)
+            else chunk
+        )
+        if self.captured is not None:
+            self.captured.append(self.buffer[self.capture_start : self.position])  # noqa: E203 E501
+            self.capture_start = 0
+        self.buffer = self.buffer[self.position :] + text  # noqa: E203
+        self.position = 0
+        return bool(chunk)
+
+    def match(
+        self,
+        pattern: "re.Pattern[str]",
+        partial: bool = False,
+    ) -> "Optional[re.Match[str]]":
+        """Match pattern at the current position, reading more as needed.
+
+        A match that runs to the end of the buffer is retried with more
+        data, unless partial matches are acceptable.
+        """
+        while True:
+            match = pattern.match(self.buffer, self.position)
+            if match is not None and (partial or match.end() < len(self.buffer)):
+                return match
+            if not self.fill():
+                return match
+
+    def peek(self) -> str:
+        """Skip whitespace, and return the next character."""
+        match = self.match(JSON_WHITESPACE_PATTERN)
+        assert match is not None  # nosec B101
+        self.position = match.end()
+        return self.buffer[self.position : self.position + 1]  # noqa: E203
+
+    def expect(self, character: str) -> None:
+        """Consume character, which must come next."""
+        if self.peek() != character:
+            raise ValueError("Invalid JSON data.")
+        self.position += 1
+
+    def read_string(self) -> str:
+        """Consume and return a string, which must come next."""
+        if self.peek() != '"':
+            raise ValueError("Invalid JSON data.")
+        match = self.match(JSON_STRING_PATTERN)
+        if match is None:
+            raise ValueError("Invalid JSON data.")
+        self.position = match.end()
+        value: str = json.loads(match.group())
+        return value
+
+    def skip_value(self) -> None:
+        """Consume the next value without keeping it."""
+        character = self.peek()
+        if character == '"':
+            self.read_string()
+            return
+        if character not in ("{", "["):
+            match = self.match(JSON_SCALAR_PATTERN)
+            if match is None:
+                raise ValueError("Invalid JSON data.")
+            self.position = match.end()
+            return
+
+        # Decoding a small container and dropping the result is much
+        # faster than stepping through it. A decoding error means that
+        # it's incomplete (or invalid): read more, up to a limit.
+        while True:
+            try:
+                self.position = JSON_DECODER.raw_decode(
+                    self.buffer, self.position
+                )[1]
+                return
+            except ValueError:
+                if len(self.buffer) - self.position >= STREAM_DECODE_MAX_CHARS:
+                    break
+                if not self.fill():
+                    break
+
+        # Otherwise, step through its members one at a time.
+        closing = "}" if character == "{" else "]"
+        self.position += 1
+        if self.peek() == closing:
+            self.position += 1
+            return
+        while True:
+            if character == "{":
+                self.read_string()
+                self.expect(":")
+            self.skip_value()
+            separator = self.peek()
+            self.position += 1
+            if separator == closing:
+                return
+            if separator != ",":
+                raise ValueError("Invalid JSON data.")
+
+    def read_value(self) -> Any:
+        """Consume and decode the next value."""
+        self.peek()
+        self.captured = []
+        self.capture_start = self.position
+        try:
+            self.skip_value()
+            self.captured.append(self.buffer[self.capture_start : self.position])  # noqa: E203 E501
+            return json.loads("".join(self.captured))
+        finally:
+            self.captured = None
+
+
+def _traverse_stream(
+    reader: Any,
+    searches: Dict[str, str],
+    delimiter: str = ",",
+) -> Dict[str, str]:
+    """Get values for many searches from JSON text read from reader.
+
+    Only the values that searches lead to are decoded; everything else
+    is skipped, and reading stops once every search is resolved.
+    """
+    stream = _JsonStream(reader)
+    values: Dict[str, str] = {}
+    try:
+        _extract_from_stream(
+            stream=stream,
+            tree=_search_tree(searches=searches),
+            values=values,
+            total=len(searches),
+            delimiter=delimiter,
+        )
+    except _SearchesResolved:
+        pass
+
+    return values
+
+
+def _extract_from_stream(
+    stream: _JsonStream,
+    tree: Dict[Optional[SearchStep], Any],
+    values: Dict[str, str],
+    total: int,
+    delimiter: str,
+) -> None:
+    """Add the values for all searches in tree from the next value."""
+    opening = stream.peek()
+    if None in tree or opening not in ("{", "["):
+        # A search ends here, or steps into a string or a scalar: decode
+        # this value and resolve the rest of the tree in memory.
+        _resolve_search_tree(
+            tree=tree,
+            value=stream.read_value(),
+            values=values,
+            delimiter=delimiter,
+        )
+        if len(values) == total:
+            raise _SearchesResolved()
+        return
+
+    stream.position += 1
+    closing = "}" if opening == "{" else "]"
+    found: Set[SearchStep] = set()
+    index = 0
+    if stream.peek() == closing:
+        stream.position += 1
+    else:
+        while True:
+            step: SearchStep = (
+                stream.read_string() if opening == "{" else index
+            )
+            if opening == "{":
+                stream.expect(":")
+            if step in tree and step not in found:
+                found.add(step)
+                _extract_from_stream(
+                    stream=stream,
+                    tree=tree[step],
+                    values=values,
+                    total=total,
+                    delimiter=delimiter,
+                )
+            else:
+                stream.skip_value()
+            index += 1
+
+            separator = stream.peek()
+            stream.position += 1
+            if separator == closing:
+                break
+            if separator != ",":
+                raise ValueError("Invalid JSON data.")
+
+    _check_steps_found(
+        tree=tree,
+        found=found,
+        is_list=opening == "[",
     )
-    LOGGER.debug("search tokens found: %s", search_tokens)
 
-    return search_tokens
+
+def _check_steps_found(
+    tree: Dict[Optional[SearchStep], Any],
+    found: Set[SearchStep],
+    is_list: bool,
+) -> None:
+    """Raise the error indexing would raise for a step that wasn't found."""
+    for key in tree:
+        if key not in found:
+            if isinstance(key, int) and is_list:
+                raise IndexError("list index out of range")
+            raise KeyError(key)
 
 
 def _send_response(
@@ -1,13 +1,18 @@
 """Tests for the getfromjson.py module."""
 
+import io
+import json
+import tracemalloc
 from typing import (
     Any,
     Dict,
+    List,
+    Optional,
 )
 from unittest.mock import patch
 
 import cfnresponse  # type: ignore
-from pytest import raises
+from pytest import mark, raises
 
 from .. import getfromjson
 
@@ -340,3 +345,612 @@ def test_given_response_to_send_when_sent_with_cfnresponse_then_it_should_return
         )
 
         assert value is True
+
+
+def test_given_search_with_mixed_steps_when_parsed_then_it_should_return_typed_steps() -> (  # noqa: D103 E501 # pylint: disable=C0116
+    None
+):
+    steps = getfromjson._parse_search(  # pylint: disable=W0212
+        search="[\"test\"]['test-1'][1][\"0\"]",
+    )
+
+    assert steps == ("test", "test-1", 1, "0")
+
+
+def test_given_empty_search_when_parsed_then_it_should_raise_exception() -> (  # noqa: D103 E501 # pylint: disable=C0116
+    None
+):
+    with raises(ValueError):
+        getfromjson._parse_search(  # pylint: disable=W0212
+            search="",
+        )
+
+
+def test_given_search_with_trailing_characters_when_parsed_then_it_should_raise_exception() -> (  # noqa: D103 E501 # pylint: disable=C0116
+    None
+):
+    with raises(ValueError):
+        getfromjson._parse_search(  # pylint: disable=W0212
+            search='["test"]junk',
+        )
+
+
+def test_given_same_search_when_parsed_twice_then_it_should_return_cached_steps() -> (  # noqa: D103 E501 # pylint: disable=C0116
+    None
+):
+    getfromjson._parse_search.cache_clear()  # pylint: disable=W0212
+
+    first = getfromjson._parse_search(  # pylint: disable=W0212
+        search='["test"]["test-1"][1]',
+    )
+    second = getfromjson._parse_search(  # pylint: disable=W0212
+        search='["test"]["test-1"][1]',
+    )
+
+    assert first is second
+    assert getfromjson._parse_search.cache_info().hits == 1  # noqa: E501 # pylint: disable=W0212
+
+
+def test_given_same_search_when_traversed_repeatedly_then_it_should_be_parsed_once() -> (  # noqa: D103 E501 # pylint: disable=C0116
+    None
+):
+    data_from_json = {"test": {"test-1": ["x", {"test-2": ["y", "z"]}]}}
+    search = '["test"]["test-1"][1]["test-2"][1]'
+    iterations = 2000
+    getfromjson._compile_search.cache_clear()  # pylint: disable=W0212
+    getfromjson._parse_search.cache_clear()  # pylint: disable=W0212
+
+    for _ in range(iterations):
+        value = getfromjson._traverse(  # pylint: disable=W0212
+            data_from_json=data_from_json,
+            search=search,
+        )
+
+    assert value == "z"
+    assert getfromjson._parse_search.cache_info().misses == 1  # noqa: E501 # pylint: disable=W0212
+    assert getfromjson._compile_search.cache_info().misses == 1  # noqa: E501 # pylint: disable=W0212
+    assert getfromjson._compile_search.cache_info().hits == iterations - 1  # noqa: E501 # pylint: disable=W0212
+
+
+def test_given_many_searches_when_traversed_then_it_should_return_a_value_for_each_name() -> (  # noqa: D103 E501 # pylint: disable=C0116
+    None
+):
+    data_from_json = {"test": {"test-1": ["x", "√√ y"], "test-2": 3}}
+    searches = {
+        "First": '["test"]["test-1"][0]',
+        "Second": "['test']['test-1'][1]",
+        "Third": '["test"]["test-2"]',
+        "Whole": '["test"]["test-2"]',
+    }
+
+    values = getfromjson._traverse_many(  # pylint: disable=W0212
+        data_from_json=data_from_json,
+        searches=searches,
+    )
+
+    assert values == {"First": "x", "Second": "√√ y", "Third": "3", "Whole": "3"}
+
+
+def test_given_many_searches_when_one_is_invalid_then_it_should_raise_exception() -> (  # noqa: D103 E501 # pylint: disable=C0116
+    None
+):
+    data_from_json = {"test": {"test-1": ["x", "y"]}}
+    searches = {
+        "First": '["test"]["test-1"][0]',
+        "Second": '["test"]["test-2"][1]',
+    }
+
+    with raises(KeyError):
+        getfromjson._traverse_many(  # pylint: disable=W0212
+            data_from_json=data_from_json,
+            searches=searches,
+        )
+
+
+class CountingDict(Dict[str, Any]):
+    """Map that counts lookups of its keys."""
+
+    lookups = 0
+
+    def __getitem__(self, key: Any) -> Any:
+        self.lookups += 1
+        return super().__getitem__(key)
+
+
+def test_given_searches_with_shared_steps_when_traversed_many_then_it_should_look_them_up_once() -> (  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    None
+):
+    config = {f"key{i}": {"values": list(range(20))} for i in range(20)}
+    searches = {
+        f"Value{i}": f'["config"]["key{i}"]["values"][{i}]' for i in range(20)
+    }
+
+    separate_data = CountingDict(config=config)
+    separate = {
+        name: getfromjson._traverse(  # pylint: disable=W0212
+            data_from_json=separate_data,
+            search=search,
+        )
+        for name, search in searches.items()
+    }
+    shared_data = CountingDict(config=config)
+    shared = getfromjson._traverse_many(  # pylint: disable=W0212
+        data_from_json=shared_data,
+        searches=searches,
+    )
+
+    assert shared == separate
+    assert separate_data.lookups == len(searches)
+    assert shared_data.lookups == 1
+
+
+def test_given_valid_json_data_and_searches_when_consumed_then_request_should_return_true() -> (  # noqa: D103 E501 # pylint: disable=C0116
+    None
+):
+    is_local_testing_current = getfromjson.IS_LOCAL_TESTING
+    getfromjson.IS_LOCAL_TESTING = True
+
+    event: Dict[str, Any] = {}
+    event["ResourceProperties"] = {}
+    event["ResourceProperties"]["json_data"] = '["test0", "test1", "test2"]'
+    event["ResourceProperties"]["searches"] = {"First": "[0]", "Last": "[2]"}
+
+    assert getfromjson.lambda_handler(event, None) is True
+
+    getfromjson.IS_LOCAL_TESTING = is_local_testing_current
+
+
+@mark.parametrize(
+    "searches",
+    [
+        {},
+        {"First": 0},
+        {"First": "[0]", "Second": "[" + "1" * 256 + "]"},
+        {"First": "[0]", "Second": "invalid"},
+    ],
+)
+def test_given_invalid_searches_when_consumed_then_request_should_return_false(  # noqa: D103 E501 # pylint: disable=C0116
+    searches: Dict[str, Any],
+) -> None:
+    is_local_testing_current = getfromjson.IS_LOCAL_TESTING
+    getfromjson.IS_LOCAL_TESTING = True
+
+    event: Dict[str, Any] = {}
+    event["ResourceProperties"] = {}
+    event["ResourceProperties"]["json_data"] = '["test0", "test1", "test2"]'
+    event["ResourceProperties"]["searches"] = searches
+
+    assert getfromjson.lambda_handler(event, None) is False
+
+    getfromjson.IS_LOCAL_TESTING = is_local_testing_current
+
+
+def test_given_non_delete_request_type_when_valid_searches_are_consumed_then_cfnresponse_should_be_called_with_each_value() -> (  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    None
+):
+    is_local_testing_current = getfromjson.IS_LOCAL_TESTING
+    getfromjson.IS_LOCAL_TESTING = False
+
+    event: Dict[str, Any] = {}
+    event["ResourceProperties"] = {}
+    event["ResourceProperties"]["json_data"] = '["test0", "test1", "test2"]'
+    event["ResourceProperties"]["searches"] = {"First": "[0]", "Last": "[2]"}
+    event["RequestType"] = "Create"
+
+    with patch(
+        "src.getfromjson._send_response",
+        return_value=None,
+    ) as send_response:
+        assert getfromjson.lambda_handler(event, None) is True
+
+    assert send_response.call_args.args[3] == {"First": "test0", "Last": "test2"}
+
+    getfromjson.IS_LOCAL_TESTING = is_local_testing_current
+
+
+class StubS3Client:  # pylint: disable=R0903
+    """Stub S3 client that serves objects from a map."""
+
+    def __init__(self, objects: Dict[str, bytes]) -> None:
+        self.objects = objects
+
+    def get_object(  # noqa: D102 # pylint: disable=C0103,C0116
+        self,
+        Bucket: str,  # noqa: N803
+        Key: str,  # noqa: N803
+    ) -> Dict[str, Any]:
+        return {"Body": io.BytesIO(self.objects[f"{Bucket}/{Key}"])}
+
+
+class StubSsmClient:  # pylint: disable=R0903
+    """Stub SSM client that serves parameters from a map."""
+
+    def __init__(self, parameters: Dict[str, str]) -> None:
+        self.parameters = parameters
+
+    def get_parameter(  # noqa: D102 # pylint: disable=C0103,C0116
+        self,
+        Name: str,  # noqa: N803
+        WithDecryption: bool,  # noqa: N803 # pylint: disable=W0613
+    ) -> Dict[str, Any]:
+        return {"Parameter": {"Value": self.parameters[Name]}}
+
+
+class LimitedReader(io.BytesIO):
+    """Reader that fails if more than limit bytes are read."""
+
+    def __init__(self, data: bytes, limit: int) -> None:
+        super().__init__(data)
+        self.limit = limit
+
+    def read(self, size: Optional[int] = -1) -> bytes:  # noqa: D102
+        if self.tell() >= self.limit:
+            raise AssertionError("Read past the value being searched for.")
+        return super().read(size)
+
+
+def _stub_clients(service: str) -> Any:
+    document = b'{"test": {"test-1": ["x", "y"]}, "big": [' + b"0, " * 1000 + b"1]}"
+    if service == "s3":
+        return StubS3Client({"bucket/path/to/data.json": document})
+    return StubSsmClient({"/config/data": document.decode()})
+
+
+@mark.parametrize(
+    "json_data_source",
+    [
+        "s3://bucket/path/to/data.json",
+        "ssm:/config/data",
+    ],
+)
+def test_given_json_data_source_when_consumed_then_cfnresponse_should_be_called_with_each_value(  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    json_data_source: str,
+) -> None:
+    is_local_testing_current = getfromjson.IS_LOCAL_TESTING
+    getfromjson.IS_LOCAL_TESTING = False
+
+    event: Dict[str, Any] = {}
+    event["ResourceProperties"] = {}
+    event["ResourceProperties"]["json_data_source"] = json_data_source
+    event["ResourceProperties"]["searches"] = {
+        "First": '["test"]["test-1"][0]',
+        "Last": '["big"][1000]',
+    }
+    event["RequestType"] = "Create"
+
+    with patch(
+        "src.getfromjson._send_response",
+        return_value=None,
+    ) as send_response, patch(
+        "src.getfromjson._get_client",
+        side_effect=_stub_clients,
+    ):
+        assert getfromjson.lambda_handler(event, None) is True
+
+    assert send_response.call_args.args[3] == {"First": "x", "Last": "1"}
+
+    getfromjson.IS_LOCAL_TESTING = is_local_testing_current
+
+
+def test_given_json_data_source_and_single_search_when_consumed_then_request_should_return_true() -> (  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    None
+):
+    is_local_testing_current = getfromjson.IS_LOCAL_TESTING
+    getfromjson.IS_LOCAL_TESTING = True
+
+    event: Dict[str, Any] = {}
+    event["ResourceProperties"] = {}
+    event["ResourceProperties"]["json_data_source"] = "ssm:/config/data"
+    event["ResourceProperties"]["search"] = '["test"]'
+
+    with patch(
+        "src.getfromjson._get_client",
+        side_effect=_stub_clients,
+    ):
+        assert getfromjson.lambda_handler(event, None) is True
+
+    getfromjson.IS_LOCAL_TESTING = is_local_testing_current
+
+
+@mark.parametrize(
+    "properties",
+    [
+        {"search": "[0]"},
+        {"search": "[0]", "json_data": "[1]", "json_data_source": "ssm:/a"},
+        {"search": "[0]", "json_data_source": "s3://bucket"},
+        {"search": "[0]", "json_data_source": "ssm:"},
+        {"search": "[0]", "json_data_source": "https://example.com"},
+        {"search": "[0]", "json_data_source": ["ssm:/a"]},
+        {"search": "[0]", "json_data_source": "ssm:/missing"},
+    ],
+)
+def test_given_invalid_json_data_source_when_consumed_then_request_should_return_false(  # noqa: D103 E501 # pylint: disable=C0116
+    properties: Dict[str, Any],
+) -> None:
+    is_local_testing_current = getfromjson.IS_LOCAL_TESTING
+    getfromjson.IS_LOCAL_TESTING = True
+
+    event: Dict[str, Any] = {}
+    event["ResourceProperties"] = properties
+
+    with patch(
+        "src.getfromjson._get_client",
+        side_effect=_stub_clients,
+    ):
+        assert getfromjson.lambda_handler(event, None) is False
+
+    getfromjson.IS_LOCAL_TESTING = is_local_testing_current
+
+
+@mark.parametrize("chunk_size", [1, 5, 65536])
+@mark.parametrize("decode_max_chars", [0, 65536])
+def test_given_json_stream_when_traversed_then_it_should_return_the_same_values_as_the_parsed_data(  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    chunk_size: int,
+    decode_max_chars: int,
+    monkeypatch: Any,
+) -> None:
+    monkeypatch.setattr(getfromjson, "STREAM_CHUNK_SIZE", chunk_size)
+    monkeypatch.setattr(getfromjson, "STREAM_DECODE_MAX_CHARS", decode_max_chars)
+    data_from_json = {
+        "skipped": [{"a\\\"]}": [1, {}]}, [], "√√ [{", -1.5e3, True, None],
+        "empty": {},
+        "test": {"test-1": ["x", {"test-2": ["y", "z"]}], "test-3": "abc"},
+        "list": [[], [0, [1, 2]], {"k": "v"}],
+    }
+    searches = {
+        "Nested": '["test"]["test-1"][1]["test-2"][1]',
+        "Object": '["test"]["test-1"][1]',
+        "Character": '["test"]["test-3"][1]',
+        "ListItem": '["list"][1][1][0]',
+        "Empty": '["empty"]',
+    }
+
+    values = getfromjson._traverse_stream(  # pylint: disable=W0212
+        reader=io.BytesIO(json.dumps(data_from_json, indent=1).encode()),
+        searches=searches,
+    )
+
+    assert values == getfromjson._traverse_many(  # pylint: disable=W0212
+        data_from_json=data_from_json,
+        searches=searches,
+    )
+
+
+def test_given_json_stream_when_value_is_found_then_it_should_stop_reading() -> (  # noqa: D103 E501 # pylint: disable=C0116
+    None
+):
+    document = b'{"test": "x", "rest": [' + b"0, " * 100000 + b"0]}"
+
+    values = getfromjson._traverse_stream(  # pylint: disable=W0212
+        reader=LimitedReader(document, getfromjson.STREAM_CHUNK_SIZE),
+        searches={"Data": '["test"]'},
+    )
+
+    assert values == {"Data": "x"}
+
+
+@mark.parametrize(
+    "json_data, search, exception",
+    [
+        ('{"test": [0, 1]}', '["test-1"]', KeyError),
+        ('{"test": [0, 1]}', '["test"][2]', IndexError),
+        ('{"test": []}', '["test"][0]', IndexError),
+        ('{"test": [0, 1]}', '["test"]["0"]', KeyError),
+        ('{"test": "x"}', '["test"]["0"]', TypeError),
+        ('{"test": [0, 1', '["test"][2]', ValueError),
+        ('{"skip": [0 1], "test": 1}', '["test"]', ValueError),
+        ('{"skip": [0, 1, "test": 1}', '["test"]', ValueError),
+        ('{"skip": {"a" 1}, "test": 1}', '["test"]', ValueError),
+        ('{"skip": 1 "test": 1}', '["test"]', ValueError),
+        ('{"skip": "x, "test": 1}', '["test"]', ValueError),
+        ('{"skip": [0, "x], "test": 1}', '["test"]', ValueError),
+        ('{"skip": , "test": 1}', '["test"]', ValueError),
+        ("{1: 2}", '["test"]', ValueError),
+        ('{"test" 1}', '["test"]', ValueError),
+        ('{"skip": [', '["test"]', ValueError),
+        ('{"skip": "x', '["test"]', ValueError),
+        ("", '["test"]', ValueError),
+    ],
+)
+@mark.parametrize("decode_max_chars", [0, 65536])
+def test_given_json_stream_when_traversed_with_invalid_search_or_data_then_it_should_raise_exception(  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    json_data: str,
+    search: str,
+    exception: type,
+    decode_max_chars: int,
+    monkeypatch: Any,
+) -> None:
+    monkeypatch.setattr(getfromjson, "STREAM_DECODE_MAX_CHARS", decode_max_chars)
+
+    with raises(exception):
+        getfromjson._traverse_stream(  # pylint: disable=W0212
+            reader=io.StringIO(json_data),
+            searches={"Data": search},
+        )
+
+
+def test_benchmark_traverse_stream_memory_is_independent_of_document_size(  # noqa: D103 E501 # pylint: disable=C0116
+    monkeypatch: Any,
+) -> None:
+    monkeypatch.setattr(getfromjson, "STREAM_CHUNK_SIZE", 4096)
+    monkeypatch.setattr(getfromjson, "STREAM_DECODE_MAX_CHARS", 4096)
+    item = json.dumps({"name": "item", "tags": ["a", "b"], "props": {"x": 1.5}})
+    document = ('{"items": [' + ", ".join([item] * 5000) + '], "answer": 42}').encode()
+
+    tracemalloc.start()
+    values = getfromjson._traverse_stream(  # pylint: disable=W0212
+        reader=io.BytesIO(document),
+        searches={"Data": '["answer"]'},
+    )
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert values == {"Data": "42"}
+    assert peak < len(document) / 2
+
+
+BOOKS = {
+    "store": {
+        "book": [
+            {"title": "A", "category": "fiction", "price": 8, "signed": True},
+            {"title": "B", "category": "reference", "price": 12, "signed": 1},
+            {"title": "C", "category": "fiction", "price": 9},
+        ],
+        "bike": {"price": 20},
+    }
+}
+
+
+@mark.parametrize(
+    "search, expected",
+    [
+        ('["store"]["book"][*]["title"]', "A,B,C"),
+        ('["store"]["book"][1:]["title"]', "B,C"),
+        ('["store"]["book"][:-1]["title"]', "A,B"),
+        ('["store"]["book"][::-1]["title"]', "C,B,A"),
+        ('["store"]["book"][0:3:2]["title"]', "A,C"),
+        ('..["price"]', "8,12,9,20"),
+        ('["store"]..["title"]', "A,B,C"),
+        ("..[1]['title']", "B"),
+        ('["store"]["book"][?(@["category"]=="fiction")]["title"]', "A,C"),
+        ("['store']['book'][?(@['category']=='reference')]['title']", "B"),
+        ('["store"]["book"][?(@["signed"]==true)]["title"]', "A"),
+        ('["store"]["book"][?(@["signed"]==1)]["title"]', "B"),
+        ('["store"]["book"][?(@["price"]==null)]["title"]', ""),
+        ('["store"]..[?(@["price"]==20)]["price"]', "20"),
+        ('["store"][*][*]["price"]', "8,12,9"),
+        ('["store"]["book"][*]["missing"]', ""),
+        ('["store"]["book"][*][5]', ""),
+        ('["store"]["bike"][0:1]', ""),
+        ('["store"]["bike"][?(@[0]==1)]', ""),
+        ('["store"]["book"][?(@[0]==1)]', ""),
+        ('[?(@[1]=="y")][0]', "x"),
+        ('["store"]["book"][?(@["price"][0]==1)]', ""),
+        ('["store"]["bike"]["price"][*]', ""),
+    ],
+)
+def test_given_search_with_many_value_steps_when_traversed_then_it_should_return_joined_values(  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    search: str,
+    expected: str,
+) -> None:
+    data_from_json = (
+        [["x", "y"], ["z"]] if search.startswith("[?") else BOOKS
+    )
+
+    value = getfromjson._traverse(  # pylint: disable=W0212
+        data_from_json=data_from_json,
+        search=search,
+    )
+
+    assert value == expected
+
+
+def test_given_search_with_many_value_steps_when_traversed_with_delimiter_then_it_should_join_values_with_delimiter() -> (  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    None
+):
+    value = getfromjson._traverse(  # pylint: disable=W0212
+        data_from_json=BOOKS,
+        search='["store"]["book"][*]["title"]',
+        delimiter="|",
+    )
+
+    assert value == "A|B|C"
+
+
+@mark.parametrize(
+    "search",
+    [
+        "[::0]",
+        "[?(@[*]==1)]",
+        '[?(@["a"]==maybe)]',
+        '[?(@["a"]=="\\q")]',
+        "[1:2:3:4]",
+        "...[0]",
+        "..",
+    ],
+)
+def test_given_invalid_search_with_many_value_steps_when_parsed_then_it_should_raise_exception(  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    search: str,
+) -> None:
+    with raises(ValueError):
+        getfromjson._parse_search(  # pylint: disable=W0212
+            search=search,
+        )
+
+
+def test_given_searches_with_many_value_steps_when_consumed_from_a_stream_then_it_should_return_joined_values() -> (  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    None
+):
+    searches = {
+        "Titles": '["store"]["book"][*]["title"]',
+        "Fiction": '["store"]["book"][?(@["category"]=="fiction")]["title"]',
+        "Bike": '["store"]["bike"]["price"]',
+    }
+
+    values = getfromjson._traverse_stream(  # pylint: disable=W0212
+        reader=io.StringIO(json.dumps(BOOKS)),
+        searches=searches,
+        delimiter=";",
+    )
+
+    assert values == {"Titles": "A;B;C", "Fiction": "A;C", "Bike": "20"}
+
+
+@mark.parametrize(
+    "delimiter, expected",
+    [
+        (None, True),
+        ("|", True),
+        (1, False),
+    ],
+)
+def test_given_delimiter_when_consumed_then_request_should_return_expected_result(  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    delimiter: Any,
+    expected: bool,
+) -> None:
+    is_local_testing_current = getfromjson.IS_LOCAL_TESTING
+    getfromjson.IS_LOCAL_TESTING = True
+
+    event: Dict[str, Any] = {}
+    event["ResourceProperties"] = {}
+    event["ResourceProperties"]["json_data"] = json.dumps(BOOKS)
+    event["ResourceProperties"]["search"] = '["store"]["book"][*]["title"]'
+    if delimiter is not None:
+        event["ResourceProperties"]["delimiter"] = delimiter
+
+    assert getfromjson.lambda_handler(event, None) is expected
+
+    getfromjson.IS_LOCAL_TESTING = is_local_testing_current
+
+
+def test_given_recursive_descent_when_traversed_then_work_should_be_linear_in_the_number_of_values(  # noqa: D103 E501 # pylint: disable=C0116,C0301
+    monkeypatch: Any,
+) -> None:
+    def document(size: int) -> Dict[str, Any]:
+        return {
+            "items": [
+                {"id": i, "tags": ["a", "b"], "child": {"id": -i}}
+                for i in range(size)
+            ]
+        }
+
+    calls: List[int] = []
+    children = getfromjson._children  # pylint: disable=W0212
+
+    def counting_children(value: Any) -> Any:
+        calls[-1] += 1
+        return children(value)
+
+    monkeypatch.setattr(getfromjson, "_children", counting_children)
+    getfromjson._compile_search.cache_clear()  # pylint: disable=W0212
+
+    for size in (1000, 2000, 4000):
+        calls.append(0)
+        value = getfromjson._traverse(  # pylint: disable=W0212
+            data_from_json=document(size),
+            search='..[?(@["id"]==-1)]["id"]',
+        )
+        assert value == "-1"
+
+    # Each item adds the same number of values, and so of lookups.
+    assert calls[2] - calls[1] == 2 * (calls[1] - calls[0])
@@ -1,15 +1,41 @@
 "Implements the Boto3 CloudFormation Macro"
 import os
+import re
 
 PREFIX = "Boto3::"
 
+# Resource type for a list of boto3 calls handled by one custom resource
+BATCH_TYPE = PREFIX + "Batch"
+
 LAMBDA_ARN = os.environ["LAMBDA_ARN"]
 
+# Name prefix for the batch resources created when coalescing
+GROUP_PREFIX = "Boto3Group"
+
+# ${Name} or ${Name.Attribute} in an Fn::Sub string
+SUB_RE = re.compile(r"\$\{([A-Za-z0-9]+)(\.[^}]*)?\}")
+
 def handle_template(template):
     "Handle a template, replacing any Boto3::* resources with Custom::Boto3"
 
     for _, resource in template.get("Resources", {}).items():
-        if resource["Type"].startswith(PREFIX):
+        if resource["Type"] == BATCH_TYPE:
+            properties = resource.get("Properties", {})
+            resource.update({
+                "Type": "Custom::Boto3",
+                "Version": "1.0",
+                "Properties": {
+                    "ServiceToken": LAMBDA_ARN,
+                    "Mode": resource.get("Mode", ["Create", "Update"]),
+                    "Actions": properties.get("Actions", []),
+                    "Concurrency": properties.get("Concurrency", 1),
+                },
+            })
+
+            if "Mode" in resource:
+                del resource["Mode"]
+
+        elif resource["Type"].startswith(PREFIX):
             resource.update({
                 "Type": "Custom::Boto3",
                 "Version": "1.0",
@@ -27,6 +53,214 @@ def handle_template(template):
     return template
 
 
+def as_list(value):
+    "DependsOn and Mode accept a single string or a list"
+    return value if isinstance(value, list) else [value]
+
+
+def find_references(node, names, found):
+    "Collect the resource names referenced by Ref, Fn::GetAtt and Fn::Sub"
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "Ref" and isinstance(value, str):
+                if value in names:
+                    found.add(value)
+            elif key == "Fn::GetAtt":
+                if isinstance(value, list):
+                    target = value[0]
+                else:
+                    target = str(value).split(".", maxsplit=1)[0]
+                if target in names:
+                    found.add(target)
+            elif key == "Fn::Sub":
+                text = value[0] if isinstance(value, list) else value
+                if isinstance(text, str):
+                    found.update(m.group(1) for m in SUB_RE.finditer(text) if m.group(1) in names)
+            find_references(value, names, found)
+    elif isinstance(node, list):
+        for value in node:
+            find_references(value, names, found)
+    return found
+
+
+def dependency_graph(resources):
+    "Map each resource name to the set of resources it depends on directly"
+    names = set(resources)
+    graph = {}
+    for name, resource in resources.items():
+        depends = {dep for dep in as_list(resource.get("DependsOn", [])) if dep in names}
+        graph[name] = find_references(resource, names, depends)
+    return graph
+
+
+def dependency_levels(graph):
+    """
+    Return the length of the longest chain of dependencies below each
+    resource. Every dependency has a strictly lower level than the resource
+    that depends on it, so there is never a path between two resources on
+    the same level, and merging resources that share a level cannot create
+    a cycle.
+    """
+    levels = {}
+
+    def level(name, visiting):
+        if name in levels:
+            return levels[name]
+        if name in visiting:
+            raise Exception(f"Circular dependency involving {name}")
+        visiting.add(name)
+        levels[name] = 1 + max((level(dep, visiting) for dep in graph[name]), default=-1)
+        visiting.discard(name)
+        return levels[name]
+
+    for name in graph:
+        level(name, set())
+    return levels
+
+
+def plan_groups(resources):
+    """
+    Decide which Boto3 resources to coalesce. Resources are candidates when
+    they only use Type, Mode, Properties and DependsOn. Candidates with the
+    same Mode and dependency level are independent of each other and form a
+    group. Returns a list of groups of two or more resource names, in
+    template order.
+    """
+    levels = dependency_levels(dependency_graph(resources))
+    groups = {}
+    for name, resource in resources.items():
+        if not resource["Type"].startswith(PREFIX) or resource["Type"] == BATCH_TYPE:
+            continue
+        if set(resource) - {"Type", "Mode", "Properties", "DependsOn"}:
+            continue
+        mode = tuple(sorted(as_list(resource.get("Mode", ["Create", "Update"]))))
+        groups.setdefault((mode, levels[name]), []).append(name)
+    return [names for names in groups.values() if len(names) > 1]
+
+
+def rename_get_att(value, renames):
+    "Point a Fn::GetAtt at the batch resource's attribute for the original"
+    if isinstance(value, list) and value[0] in renames:
+        return [renames[value[0]], f"{value[0]}.{value[1]}"]
+    if isinstance(value, str) and value.split(".", maxsplit=1)[0] in renames:
+        return f"{renames[value.split('.', maxsplit=1)[0]]}.{value}"
+    return value
+
+
+def rename_sub(value, renames):
+    "Point the ${} references in a Fn::Sub at the batch resources"
+    def sub(match):
+        name, attribute = match.group(1), match.group(2)
+        if name not in renames:
+            return match.group(0)
+        if attribute:
+            return "${" + renames[name] + "." + name + attribute + "}"
+        return "${" + renames[name] + "}"
+
+    if isinstance(value, str):
+        return SUB_RE.sub(sub, value)
+    if isinstance(value, list) and isinstance(value[0], str):
+        return [SUB_RE.sub(sub, value[0])] + value[1:]
+    return value
+
+
+def rename_references(node, renames):
+    "Point Ref, Fn::GetAtt, Fn::Sub and DependsOn at the batch resources"
+    if isinstance(node, list):
+        return [rename_references(value, renames) for value in node]
+    if not isinstance(node, dict):
+        return node
+
+    new_node = {}
+    for key, value in node.items():
+        if key == "Ref" and isinstance(value, str) and value in renames:
+            value = renames[value]
+        elif key == "Fn::GetAtt":
+            value = rename_get_att(value, renames)
+        elif key == "Fn::Sub":
+            value = rename_sub(value, renames)
+        elif key == "DependsOn":
+            depends = []
+            for dep in as_list(value):
+                dep = renames.get(dep, dep)
+                if dep not in depends:
+                    depends.append(dep)
+            value = depends
+        new_node[key] = rename_references(value, renames)
+    return new_node
+
+
+def coalesce_template(template, concurrency=None):
+    """
+    Replace groups of independent Boto3 resources that share a Mode with a
+    single Boto3::Batch resource. References to the original resources are
+    pointed at the batch, and the result of each call is available with
+    Fn::GetAtt <Batch>.<Original name>.Status and .Message
+    """
+    resources = template.get("Resources", {})
+    renames = {}
+    batches = {}
+    for names in plan_groups(resources):
+        index = len(batches) + 1
+        while f"{GROUP_PREFIX}{index}" in resources:
+            index += 1
+        group_name = f"{GROUP_PREFIX}{index}"
+        depends = []
+        for name in names:
+            for dep in as_list(resources[name].get("DependsOn", [])):
+                if dep not in depends:
+                    depends.append(dep)
+            renames[name] = group_name
+        batch = {
+            "Type": BATCH_TYPE,
+            "Properties": {
+                "Concurrency": concurrency or len(names),
+                "Actions": [
+                    {
+                        "Name": name,
+                        "Action": resources[name]["Type"][len(PREFIX):],
+                        "Properties": resources[name].get("Properties", {}),
+                    }
+                    for name in names
+                ],
+            },
+        }
+        if "Mode" in resources[names[0]]:
+            batch["Mode"] = resources[names[0]]["Mode"]
+        if depends:
+            batch["DependsOn"] = depends
+        batches[group_name] = batch
+
+    if not renames:
+        return template
+
+    new_resources = {}
+    for name, resource in resources.items():
+        if name in renames:
+            group_name = renames[name]
+            if group_name not in new_resources:
+                new_resources[group_name] = batches[group_name]
+        else:
+            new_resources[name] = resource
+    template["Resources"] = new_resources
+    return rename_references(template, renames)
+
+
+def coalesce_settings(template):
+    """
+    Coalescing is opt-in, with template metadata:
+
+    Metadata:
+      Boto3:
+        Coalesce: true
+        Concurrency: 4  # optional, defaults to the size of each group
+    """
+    settings = template.get("Metadata", {}).get("Boto3", {})
+    if str(settings.get("Coalesce", False)).lower() != "true":
+        return None
+    return settings
+
+
 def handler(event, _):
     "Handle a CloudFormation event"
 
@@ -34,7 +268,10 @@ def handler(event, _):
     status = "success"
 
     try:
-        fragment = handle_template(event["fragment"])
+        settings = coalesce_settings(fragment)
+        if settings is not None:
+            fragment = coalesce_template(fragment, settings.get("Concurrency"))
+        fragment = handle_template(fragment)
     except Exception:
         status = "failure"
 
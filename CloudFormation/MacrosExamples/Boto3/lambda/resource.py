@@ -1,11 +1,38 @@
 "Implements the CloudFormation resource handler for the Boto3 macro"
 
-import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
 
 from custom_response import send, FAILED, SUCCESS
-
-def execute(action, properties):
+from macro_logging import get_logger, log_payload
+
+logger = get_logger(__name__)
+
+# Upper bound for the Concurrency property of a batch resource
+MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENCY", "16"))
+
+# boto3 clients, keyed by (service, region), kept across warm invocations.
+# Clients are thread safe once created, but creating them is not
+clients = {}
+clients_lock = threading.Lock()
+
+def get_client(service, region=None):
+    "Return a cached boto3 client for the service and region"
+    region = region or os.environ.get("AWS_REGION")
+    key = (service, region)
+    client = clients.get(key)
+    if client is None:
+        with clients_lock:
+            client = clients.get(key)
+            if client is None:
+                client = boto3.client(service, region_name=region)
+                clients[key] = client
+    return client
+
+def execute(action, properties, region=None):
     "Executes the requested action"
     actions = action.split(".")
 
@@ -15,7 +42,7 @@ def execute(action, properties):
     client, function = actions[0], actions[1]
 
     try:
-        client = boto3.client(client.lower())
+        client = get_client(client.lower(), region)
     except Exception as e:
         return "FAILED", f"boto3 error: {e}"
 
@@ -36,21 +63,75 @@ def execute(action, properties):
 
     return "SUCCESS", "Completed successfully"
 
+def execute_batch(actions, concurrency=1):
+    """
+    Executes a list of actions, each a dict with an Action, optional
+    Properties, Region and Name. With a concurrency of 1 the actions run in
+    order and stop at the first failure. Otherwise up to that many run at
+    once on a thread pool and all of them are attempted.
+
+    Returns a list of (name, status, message), in the order of the actions.
+    Actions that were not run because an earlier one failed are reported
+    as SKIPPED.
+    """
+    names = [action.get("Name", str(index)) for index, action in enumerate(actions)]
+
+    def run(action):
+        return execute(action["Action"], action.get("Properties", {}), action.get("Region"))
+
+    if concurrency <= 1:
+        results = []
+        for name, action in zip(names, actions):
+            if results and results[-1][1] != "SUCCESS":
+                results.append((name, "SKIPPED", "Skipped after an earlier failure"))
+                continue
+            results.append((name, *run(action)))
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, MAX_CONCURRENCY)) as pool:
+        outcomes = list(pool.map(run, actions))
+    return [(name, *outcome) for name, outcome in zip(names, outcomes)]
+
+def handle_batch(event, context, properties):
+    "Run a batch resource and report the result of each call"
+
+    actions = properties["Actions"]
+    if not isinstance(actions, list) or \
+            any(not isinstance(action, dict) or "Action" not in action for action in actions):
+        return send(event, context, FAILED, {}, reason="Each of Actions needs an Action")
+
+    results = execute_batch(actions, int(properties.get("Concurrency", 1)))
+
+    data = {}
+    for name, status, message in results:
+        data[f"{name}.Status"] = status
+        data[f"{name}.Message"] = message
+
+    failed = [name for name, status, _ in results if status == "FAILED"]
+    if failed:
+        return send(event, context, FAILED, data,
+                    reason=f"Failed actions: {', '.join(failed)}")
+    return send(event, context, SUCCESS, data,
+                reason=f"Completed {len(results)} actions successfully")
+
 def handler(event, context):
     "Handle a CloudFormation event"
 
-    print("Received request:", json.dumps(event, indent=4))
+    log_payload(logger, "Received request", event)
 
     request = event["RequestType"]
     properties = event["ResourceProperties"]
 
-    if any(prop not in properties for prop in ("Action", "Properties")):
-        print("Bad properties", properties)
+    if "Actions" not in properties and \
+            any(prop not in properties for prop in ("Action", "Properties")):
+        log_payload(logger, "Bad properties", properties)
         return send(event, context, FAILED, {}, reason="Missing required parameters")
 
     mode = properties["Mode"]
 
     if request == mode or request in mode:
+        if "Actions" in properties:
+            return handle_batch(event, context, properties)
         status, message = execute(properties["Action"], properties["Properties"])
         return send(event, context, status, {}, reason=message)
 
@@ -0,0 +1,119 @@
+"""Tests for the custom_response.py module against a fault-injecting server."""
+
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+# The lambda modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import custom_response  # noqa: E402
+
+
+class FaultyHandler(BaseHTTPRequestHandler):
+    "Accepts PUTs, failing the first few according to the server's faults"
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        "Record the body, then reply or fail as instructed"
+        body = self.rfile.read(int(self.headers["content-length"]))
+        self.server.bodies.append(body)
+        fault = self.server.faults.pop(0) if self.server.faults else None
+        if fault == "drop":
+            self.close_connection = True
+            self.connection.close()
+            return
+        self.send_response(fault or 200)
+        self.send_header("content-length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        "Keep the test output quiet"
+
+
+@pytest.fixture(name="server")
+def fixture_server(monkeypatch):
+    "Run a local server and make the retries fast"
+    monkeypatch.setattr(custom_response, "BACKOFF_FACTOR", 0.01)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FaultyHandler)
+    httpd.faults = []
+    httpd.bodies = []
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def event_for(server):
+    "Build a CloudFormation event that responds to the server"
+    return {
+        "ResponseURL": f"http://127.0.0.1:{server.server_address[1]}/response",
+        "StackId": "stack",
+        "RequestId": "request",
+        "LogicalResourceId": "Resource",
+    }
+
+
+CONTEXT = SimpleNamespace(log_stream_name="stream")
+
+
+def test_response_is_sent_compactly(server):
+    assert custom_response.send(event_for(server), CONTEXT, "SUCCESS", {"A": "b"}, reason="ok")
+
+    body = server.bodies[0].decode()
+    assert json.loads(body)["Data"] == {"A": "b"}
+    assert "\n" not in body and ", " not in body
+
+
+def test_server_errors_are_retried_until_success(server):
+    server.faults = [503, 500]
+
+    assert custom_response.send(event_for(server), CONTEXT, "SUCCESS", {})
+    assert len(server.bodies) == 3
+
+
+def test_dropped_connections_are_retried(server):
+    server.faults = ["drop"]
+
+    assert custom_response.send(event_for(server), CONTEXT, "SUCCESS", {})
+    assert len(server.bodies) == 2
+
+
+def test_gives_up_after_max_attempts(server, monkeypatch):
+    monkeypatch.setattr(custom_response, "MAX_ATTEMPTS", 3)
+    server.faults = [503] * 10
+
+    assert not custom_response.send(event_for(server), CONTEXT, "SUCCESS", {})
+    assert len(server.bodies) == 3
+
+
+def test_client_errors_are_not_retried(server):
+    server.faults = [403]
+
+    assert not custom_response.send(event_for(server), CONTEXT, "SUCCESS", {})
+    assert len(server.bodies) == 1
+
+
+def test_large_data_is_trimmed_to_the_response_limit(server):
+    data = {"Small": "x", "Large": "y" * 5000}
+
+    assert custom_response.send(event_for(server), CONTEXT, "SUCCESS", data)
+
+    body = server.bodies[0]
+    assert len(body) <= custom_response.MAX_RESPONSE_BYTES
+    assert json.loads(body)["Data"] == {"Small": "x"}
+
+
+def test_long_reasons_are_shortened_to_the_response_limit():
+    response = {"Reason": "z" * 5000, "Data": {}}
+
+    body = custom_response.fit_response(response)
+
+    assert len(body) == custom_response.MAX_RESPONSE_BYTES
+    assert json.loads(body)["Reason"].endswith("...")
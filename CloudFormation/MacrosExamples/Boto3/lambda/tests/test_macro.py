@@ -0,0 +1,159 @@
+"""Tests for the dependency analysis in the macro.py module."""
+
+import copy
+import os
+import sys
+
+os.environ.setdefault("LAMBDA_ARN", "arn:aws:lambda:us-east-1:123456789012:function:boto3")
+
+# The lambda modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import macro  # noqa: E402
+
+
+def boto3_resource(mode="Create", **extra):
+    "Build a Boto3::SQS.send_message resource"
+    resource = {
+        "Type": "Boto3::SQS.send_message",
+        "Mode": mode,
+        "Properties": {"QueueUrl": "https://example.com/queue", "MessageBody": "hello"},
+    }
+    resource.update(extra)
+    return resource
+
+
+def test_independent_resources_with_the_same_mode_are_grouped():
+    resources = {
+        "First": boto3_resource(),
+        "Second": boto3_resource(),
+        "Third": boto3_resource(),
+    }
+
+    assert macro.plan_groups(resources) == [["First", "Second", "Third"]]
+
+
+def test_resources_with_different_modes_are_not_grouped():
+    resources = {
+        "First": boto3_resource(mode="Create"),
+        "Second": boto3_resource(mode=["Create", "Update"]),
+        "Third": boto3_resource(mode=["Update", "Create"]),
+    }
+
+    assert macro.plan_groups(resources) == [["Second", "Third"]]
+
+
+def test_resources_that_depend_on_each_other_are_not_grouped():
+    resources = {
+        "First": boto3_resource(),
+        "Second": boto3_resource(DependsOn="First"),
+        "Third": boto3_resource(
+            Properties={"QueueUrl": {"Fn::GetAtt": ["Second", "Message"]}}
+        ),
+    }
+
+    assert not macro.plan_groups(resources)
+
+
+def test_resources_linked_through_another_resource_are_not_grouped():
+    resources = {
+        "First": boto3_resource(),
+        "Queue": {
+            "Type": "AWS::SQS::Queue",
+            "Properties": {"QueueName": {"Fn::Sub": "${First}-queue"}},
+        },
+        "Second": boto3_resource(Properties={"QueueUrl": {"Ref": "Queue"}}),
+    }
+
+    assert not macro.plan_groups(resources)
+
+
+def test_levels_never_link_two_groups_both_ways():
+    # A depends on X and Y depends on B. Pairing (A, B) and (X, Y) would
+    # make the two batches depend on each other
+    resources = {
+        "A": boto3_resource(DependsOn="X"),
+        "B": boto3_resource(),
+        "X": boto3_resource(),
+        "Y": boto3_resource(DependsOn="B"),
+    }
+
+    groups = macro.plan_groups(resources)
+
+    assert sorted(map(sorted, groups)) == [["A", "Y"], ["B", "X"]]
+
+
+def test_resources_with_conditions_are_not_grouped():
+    resources = {
+        "First": boto3_resource(Condition="IsProd"),
+        "Second": boto3_resource(),
+    }
+
+    assert not macro.plan_groups(resources)
+
+
+def test_coalesce_template_rewrites_references_to_the_batch():
+    template = {
+        "Resources": {
+            "Queue": {"Type": "AWS::SQS::Queue"},
+            "First": boto3_resource(DependsOn="Queue"),
+            "Second": boto3_resource(Properties={"QueueUrl": {"Ref": "Queue"}}),
+            "Consumer": {
+                "Type": "AWS::SNS::Topic",
+                "DependsOn": ["First", "Second"],
+                "Properties": {
+                    "DisplayName": {"Fn::Sub": "${First.Status}-${Second}"},
+                    "TopicName": {"Fn::GetAtt": "Second.Message"},
+                },
+            },
+        },
+        "Outputs": {"Status": {"Value": {"Fn::GetAtt": ["First", "Status"]}}},
+    }
+
+    result = macro.coalesce_template(template)
+
+    assert list(result["Resources"]) == ["Queue", "Boto3Group1", "Consumer"]
+    batch = result["Resources"]["Boto3Group1"]
+    assert batch["Type"] == "Boto3::Batch"
+    assert batch["DependsOn"] == ["Queue"]
+    assert [action["Name"] for action in batch["Properties"]["Actions"]] == ["First", "Second"]
+    assert batch["Properties"]["Actions"][0]["Action"] == "SQS.send_message"
+
+    consumer = result["Resources"]["Consumer"]
+    assert consumer["DependsOn"] == ["Boto3Group1"]
+    assert consumer["Properties"]["DisplayName"] == {
+        "Fn::Sub": "${Boto3Group1.First.Status}-${Boto3Group1}"
+    }
+    assert consumer["Properties"]["TopicName"] == {
+        "Fn::GetAtt": "Boto3Group1.Second.Message"
+    }
+    assert result["Outputs"]["Status"]["Value"] == {
+        "Fn::GetAtt": ["Boto3Group1", "First.Status"]
+    }
+
+
+def test_handler_only_coalesces_when_enabled_in_metadata():
+    resources = {"First": boto3_resource(), "Second": boto3_resource()}
+
+    plain = macro.handler(
+        {"requestId": "1", "fragment": {"Resources": copy.deepcopy(resources)}}, None
+    )
+    coalesced = macro.handler(
+        {
+            "requestId": "2",
+            "fragment": {
+                "Metadata": {"Boto3": {"Coalesce": True}},
+                "Resources": copy.deepcopy(resources),
+            },
+        },
+        None,
+    )
+
+    assert plain["status"] == coalesced["status"] == "success"
+    assert sorted(plain["fragment"]["Resources"]) == ["First", "Second"]
+    assert list(coalesced["fragment"]["Resources"]) == ["Boto3Group1"]
+    properties = coalesced["fragment"]["Resources"]["Boto3Group1"]["Properties"]
+    assert properties["Mode"] == "Create"
+    assert properties["Concurrency"] == 2
+    assert len(properties["Actions"]) == 2
@@ -0,0 +1,86 @@
+"""Tests for the client cache and batches in the resource.py module."""
+
+import os
+import sys
+
+import pytest
+from botocore.stub import Stubber
+
+# The lambda modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+# The handler module shadows the standard library's resource module
+import resource  # noqa: E402  # pylint: disable=wrong-import-order
+
+REGIONS = ["us-east-1", "eu-west-1", "ap-southeast-2"]
+
+
+@pytest.fixture(name="stubbers")
+def fixture_stubbers(monkeypatch):
+    "Stub an SQS client in each region, so that batches can run concurrently"
+    monkeypatch.setattr(resource, "clients", {})
+    stubbers = {region: Stubber(resource.get_client("sqs", region)) for region in REGIONS}
+    for stubber in stubbers.values():
+        stubber.activate()
+    yield stubbers
+    for stubber in stubbers.values():
+        stubber.deactivate()
+
+
+def batch(regions):
+    "Build a batch of SQS.list_queues actions, one for each region"
+    return [{"Name": f"List{index}", "Action": "SQS.list_queues", "Region": region}
+            for index, region in enumerate(regions)]
+
+
+def test_clients_are_reused_for_each_service_and_region(monkeypatch):
+    monkeypatch.setattr(resource, "clients", {})
+    created = []
+    client = resource.boto3.client
+    monkeypatch.setattr(resource.boto3, "client",
+                        lambda *args, **kwargs: created.append(args) or client(*args, **kwargs))
+
+    sqs = resource.get_client("sqs", "us-east-1")
+    assert resource.get_client("sqs", "us-east-1") is sqs
+    assert resource.get_client("sqs", "eu-west-1") is not sqs
+    assert resource.get_client("sns", "us-east-1") is not sqs
+    assert resource.get_client("sqs", "eu-west-1") is resource.get_client("sqs", "eu-west-1")
+    assert created == [("sqs",), ("sqs",), ("sns",)]
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_batch_results_are_in_the_order_of_the_actions(stubbers, concurrency):
+    for stubber in stubbers.values():
+        stubber.add_response("list_queues", {})
+
+    results = resource.execute_batch(batch(REGIONS), concurrency)
+
+    assert results == [(f"List{index}", "SUCCESS", "Completed successfully") for index in range(3)]
+
+
+def test_concurrent_batches_report_a_failed_call_alongside_the_others(stubbers, monkeypatch):
+    stubbers["us-east-1"].add_response("list_queues", {})
+    stubbers["eu-west-1"].add_client_error("list_queues", "AccessDenied", "Not allowed")
+    stubbers["ap-southeast-2"].add_response("list_queues", {})
+    sent = []
+    monkeypatch.setattr(resource, "send", lambda event, context, status, data, reason=None:
+                        sent.append((status, data, reason)))
+
+    resource.handle_batch({}, None, {"Actions": batch(REGIONS), "Concurrency": 3})
+
+    assert len(sent) == 1
+    status, data, reason = sent[0]
+    assert (status, reason) == ("FAILED", "Failed actions: List1")
+    assert [data[f"List{index}.Status"] for index in range(3)] == ["SUCCESS", "FAILED", "SUCCESS"]
+    assert "AccessDenied" in data["List1.Message"]
+
+
+def test_sequential_batches_skip_the_calls_after_a_failure(stubbers):
+    stubbers["us-east-1"].add_response("list_queues", {})
+    stubbers["eu-west-1"].add_client_error("list_queues", "AccessDenied", "Not allowed")
+
+    results = resource.execute_batch(batch(REGIONS), 1)
+
+    assert [status for _, status, _ in results] == ["SUCCESS", "FAILED", "SKIPPED"]
+    stubbers["ap-southeast-2"].assert_no_pending_responses()
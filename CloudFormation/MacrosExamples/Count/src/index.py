@@ -1,26 +1,31 @@
 "Lambda implementation for the Count macro"
-import copy
 import json
 
+DECIMAL_PLACEHOLDER = '%d'
+STRING_PLACEHOLDER = '%s'
+
+# Plan marker for a string leaf that contains at least one placeholder
+PLACEHOLDER_LEAF = 'leaf'
+
 def process_template(template,parameters):
     "Process the template to multiply resources"
 
-    # Make a copy of the template to modify
-    new_template = copy.deepcopy(template)
+    # Copy on write: only the top level and the Resources section are copied,
+    # everything else is shared with the original template
+    new_template = dict(template)
+    new_template['Resources'] = dict(template['Resources'])
     status = 'success'
 
     for name, resource in template['Resources'].items():
         if 'Count' in resource:
-            if isinstance(new_template['Resources'][name]['Count'], dict):
+            if isinstance(resource['Count'], dict):
                 # Check if the value of Count is referenced to a parameter passed in the template
-                refValue = new_template['Resources'][name]['Count'].pop('Ref')
+                refValue = resource['Count']['Ref']
                 # Convert referenced parameter to an integer value
                 count_str = str(parameters[refValue])
-                # Remove the Count property from this resource
-                new_template['Resources'][name].pop('Count')
             else:
                 # Use literal value
-                count_str = str(new_template['Resources'][name].pop('Count'))
+                count_str = str(resource['Count'])
 
             if count_str.isnumeric():
                 count = int(count_str)
@@ -30,67 +35,132 @@ def process_template(template,parameters):
                 count = [count_str]
 
             print(f"Found 'Count' property with value {count} in '{name}' resource....multiplying!")
-            # Remove the original resource from the template but take a local copy of it
-            resourceToMultiply = new_template['Resources'].pop(name)
-            # Create a new block of the resource multiplied with names ending in the
-            # iterator and the placeholders substituted
-            resourcesAfterMultiplication = multiply(name, resourceToMultiply, count)
-            if not set(resourcesAfterMultiplication.keys()) & set(new_template['Resources'].keys()):
-                new_template['Resources'].update(resourcesAfterMultiplication)
-            else:
-                status = 'failed'
-                return status, template
+            # Remove the original resource from the template, and take a shallow copy of it
+            # without the Count property
+            new_template['Resources'].pop(name)
+            resourceToMultiply = {k: v for k, v in resource.items() if k != 'Count'}
+            # Stream the copies of the resource, with names ending in the iterator and the
+            # placeholders substituted, straight into the new template. The Resources
+            # section doubles as the name index, so a collision stops the expansion at
+            # the first conflicting name without building the remaining copies
+            for new_name, new_resource in iter_multiplied(name, resourceToMultiply, count):
+                if new_name in new_template['Resources']:
+                    print(f"Multiplied resource name '{new_name}' conflicts with an " +
+                          "existing resource")
+                    status = 'failed'
+                    return status, template
+                new_template['Resources'][new_name] = new_resource
         else:
             print(f"Did not find 'Count' property in '{name}' resource....Nothing to do!")
     return status, new_template
 
-def update_placeholder(resource_structure, iteration, value=None):
-    "Update the placeholders in the resource structure"
-
-    # Convert the json into a string
-    resource_string = json.dumps(resource_structure)
-    # Count the number of times the placeholder is found in the string
-    decimal_placeholder_count = resource_string.count('%d')
-    string_placeholder_count = 0 if value is None else resource_string.count('%s')
-
-    # If the decimal placeholder is found then replace it
-    if decimal_placeholder_count > 0:
-        print(f"Found {decimal_placeholder_count} occurrences of decimal placeholder in JSON, " +
-              f"replacing with iterator {iteration}")
-        # Replace the decimal placeholders
-        resource_string = resource_string.replace('%d', str(iteration))
-
-    # If the string placeholder is found then replace it
-    if string_placeholder_count > 0:
-        print(f"Found {string_placeholder_count} occurrences of string placeholder in JSON, " +
-              f"replacing with value {value}")
-        # Replace the string placeholders
-        resource_string = resource_string.replace('%s', str(value))
-
-    if decimal_placeholder_count > 0 or string_placeholder_count > 0:
-        # Convert the string back to json and return it
-        return json.loads(resource_string)
-    
-    print("No occurences of decimal placeholder found in JSON, " + 
-            "therefore nothing will be replaced")
-    return resource_structure
+def has_placeholder(text):
+    "Check whether a string contains a decimal or string placeholder"
 
-def multiply(resource_name, resource_structure, count):
-    "Multiply the resource structure by the count"
+    return DECIMAL_PLACEHOLDER in text or STRING_PLACEHOLDER in text
+
+def compile_placeholders(resource_structure):
+    """Find the placeholder sites in a resource structure
+
+    Returns None when there is nothing to substitute, PLACEHOLDER_LEAF for a
+    string containing a placeholder, or a (rename_keys, children) tuple for a
+    dict or list, where children maps each key or index that contains a
+    placeholder to its own plan and rename_keys is set when any dict key
+    contains a placeholder.
+    """
+
+    if isinstance(resource_structure, str):
+        return PLACEHOLDER_LEAF if has_placeholder(resource_structure) else None
+    if isinstance(resource_structure, dict):
+        items = resource_structure.items()
+        rename_keys = any(isinstance(key, str) and has_placeholder(key)
+                          for key in resource_structure)
+    elif isinstance(resource_structure, list):
+        items = enumerate(resource_structure)
+        rename_keys = False
+    else:
+        return None
+
+    children = {}
+    for key, value in items:
+        plan = compile_placeholders(value)
+        if plan is not None:
+            children[key] = plan
+    if not children and not rename_keys:
+        return None
+    return rename_keys, children
+
+def count_placeholder_sites(plan):
+    "Count the number of string leaves in a placeholder plan"
+
+    if plan is None:
+        return 0
+    if plan == PLACEHOLDER_LEAF:
+        return 1
+    return sum(count_placeholder_sites(child) for child in plan[1].values())
+
+def substitute(text, iteration, value):
+    "Replace the placeholders in a single string"
+
+    text = text.replace(DECIMAL_PLACEHOLDER, iteration)
+    if value is not None:
+        text = text.replace(STRING_PLACEHOLDER, value)
+    return text
+
+def render_placeholders(resource_structure, plan, iteration, value=None):
+    """Produce a copy of the resource structure with the placeholders filled in
+
+    Only the containers on the path to a placeholder are copied, all other
+    subtrees are shared with the original structure. The iteration and value
+    must already be strings.
+    """
+
+    if plan is None:
+        return resource_structure
+    if plan == PLACEHOLDER_LEAF:
+        return substitute(resource_structure, iteration, value)
+
+    rename_keys, children = plan
+    if rename_keys:
+        return {
+            (substitute(key, iteration, value) if isinstance(key, str) else key):
+                render_placeholders(child, children.get(key), iteration, value)
+            for key, child in resource_structure.items()
+        }
+    new_structure = resource_structure.copy()
+    for key, child_plan in children.items():
+        new_structure[key] = render_placeholders(
+            resource_structure[key], child_plan, iteration, value)
+    return new_structure
+
+def iter_multiplied(resource_name, resource_structure, count):
+    "Yield the (name, resource) pairs of the multiplied resource one at a time"
+
+    # Find the placeholders once, each copy then only patches those leaves
+    plan = compile_placeholders(resource_structure)
+    placeholder_sites = count_placeholder_sites(plan)
+    if placeholder_sites > 0:
+        print(f"Found {placeholder_sites} string(s) with placeholders in '{resource_name}'")
+    else:
+        print(f"No placeholders found in '{resource_name}', " +
+              "therefore nothing will be replaced")
 
-    resources = {}
     # Loop according to the number of times we want to multiply, creating a new resource each time
     if isinstance(count, int):
+        print(f"Multiplying '{resource_name}' {count} times")
         for iteration in range(1, (count + 1)):
-            print(f"Multiplying '{resource_name}', iteration count {iteration}")
-            multiplied_resource_structure = update_placeholder(resource_structure,iteration)
-            resources[resource_name+str(iteration)] = multiplied_resource_structure
+            yield resource_name+str(iteration), render_placeholders(
+                resource_structure, plan, str(iteration))
     else:
+        print(f"Multiplying '{resource_name}' {len(count)} times")
         for iteration, value in enumerate(count):
-            print(f"Multiplying '{resource_name}', iteration count {iteration}")
-            multiplied_resource_structure = update_placeholder(resource_structure,iteration,value)
-            resources[resource_name+str(iteration)] = multiplied_resource_structure
-    return resources
+            yield resource_name+str(iteration), render_placeholders(
+                resource_structure, plan, str(iteration), str(value))
+
+def multiply(resource_name, resource_structure, count):
+    "Multiply the resource structure by the count"
+
+    return dict(iter_multiplied(resource_name, resource_structure, count))
 
 def handler(event, _):
     "Lambda handler"
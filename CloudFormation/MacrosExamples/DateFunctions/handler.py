@@ -1,15 +1,23 @@
 "Handler lambda code for date function macro"
+import logging
+import os
 import traceback
 import datetime
 import time
 
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+
 
 def handler(event, _):
     """
     Lambda handler function
     """
     
-    print("Received event: " + str(event))
+    # The event holds the whole template, so it is only logged in full, and
+    # only formatted, when LOG_LEVEL is DEBUG
+    logger.info("Received request %s", event["requestId"])
+    logger.debug("Received event: %s", event)
 
     response = {"requestId": event["requestId"], "status": "success"}
     try:
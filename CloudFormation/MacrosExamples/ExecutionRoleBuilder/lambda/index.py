@@ -3,47 +3,124 @@
 #pylint: disable=broad-exception-raised
 #pylint: disable=unused-wildcard-import
 
+import hashlib
 import json
-import uuid
+import logging
+import os
+import re
 
 #pylint: disable=wildcard-import
 from policytemplates import *
+from macro_logging import get_logger, log_payload
+
+logger = get_logger(__name__)
 
 # Variable for the default role path, if a role path is not provided
 defaultrolepath = "/boundedexecutionroles/"
 
+# Substitution tokens used in the templates, e.g. <RESOURCE>
+TOKEN_RE = re.compile(r"<([A-Z]+)>")
+
+# Characters that must be escaped in a JSON string
+JSON_ESCAPE_RE = re.compile(r'["\\\x00-\x1f]')
+
+# Merge the statements of all policies on a role and pack them into as few
+# inline policies as possible. Disable to keep one policy per permission
+PACK_INLINE_POLICIES = os.environ.get("PACK_INLINE_POLICIES", "true").lower() == "true"
+
+# IAM quota for the aggregate size of a role's inline policy documents, in
+# characters without whitespace
+MAX_ROLE_INLINE_POLICY_SIZE = int(os.environ.get("MAX_ROLE_INLINE_POLICY_SIZE", "10240"))
+
+
+class PolicyTemplate:
+    """
+    A template from policytemplates.py, parsed once and split at its
+    substitution slots.
+
+    The template is checked and re-serialized as compact JSON when it is
+    parsed, and split into literal and token segments. Filling it escapes
+    each value as the contents of a JSON string, joins the segments and
+    decodes the result, so ARNs with quotes or backslashes cannot break the
+    template, and the copy is made by the C JSON decoder rather than by
+    walking the structure in Python.
+    """
+
+    def __init__(self, text):
+        self.segments = TOKEN_RE.split(json.dumps(json.loads(text), separators=(",", ":")))
+        self.slots = set(self.segments[1::2])
+        self.positions = [
+            (index, self.segments[index]) for index in range(1, len(self.segments), 2)
+        ]
+
+    def fill(self, **values):
+        "Return a new structure with every slot filled from the keyword arguments"
+        missing = self.slots - values.keys()
+        if missing:
+            raise Exception(f"Missing values for policy template slots: {sorted(missing)}")
+        escaped = {}
+        for slot in self.slots:
+            value = values[slot]
+            if not isinstance(value, str):
+                raise Exception(f"Policy template slot {slot} must be a string, " +
+                                f"got {type(value).__name__}")
+            escaped[slot] = json.dumps(value)[1:-1] if JSON_ESCAPE_RE.search(value) else value
+        parts = self.segments.copy()
+        for index, slot in self.positions:
+            parts[index] = escaped[slot]
+        return json.loads("".join(parts))
+
+
+# Parse the templates once, when the Lambda container starts
+compiledroletemplate = PolicyTemplate(roletemplate)
+compiledpolicytemplates = {
+    service: {
+        actiongroup: PolicyTemplate(template)
+        for actiongroup, template in templates.items()
+    }
+    for service, templates in policytemplates.items()
+}
+
 
 # Core function handler
 def handler(event, _):
     "Lambda handler"
 
-    return {
-        "requestId": event["requestId"],
-        "status": "success",
-        "fragment": convert_template(event["fragment"]),
-    }
+    try:
+        return {
+            "requestId": event["requestId"],
+            "status": "success",
+            "fragment": convert_template(event["fragment"]),
+        }
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.exception("Failed to expand the roles")
+        return {
+            "requestId": event["requestId"],
+            "status": "failure",
+            "errorMessage": str(e),
+        }
 
 
 # Function to convert/expand the template
 def convert_template(fragment):
     "Convert the template fragment"
 
-    print(f"This was the fragment: {fragment}")
+    log_payload(logger, "This was the fragment", fragment)
 
     # Loop through each resource in the template
     resources = fragment["Resources"]
     for resource in resources:
-        print(f"Determining if {resource} is an IAM role")
+        logger.debug("Determining if %s is an IAM role", resource)
         resourcejson = resources[resource]
         # If the resource is an IAM Role, expand the shorthand notation to the proper
         # CloudFormation using the function below, otherwise leave the resource as is
         if resourcejson["Type"] == "AWS::IAM::Role":
-            print(f"Found a role: {resource}")
+            logger.info("Found a role: %s", resource)
             # Expanding role
             resources[resource] = expand_role(resourcejson)
 
     # Debug output
-    print(f"This is the transformed fragment: {fragment}")
+    log_payload(logger, "This is the transformed fragment", fragment, logging.DEBUG)
     # Return the converted/expanded template fragment
     return fragment
 
@@ -52,20 +129,19 @@ def expand_role(rolefragment):
     "Function to expand shorthand role definitions into proper CloudFormation"
 
     # Debug output
-    print(f"This is the role fragment: {rolefragment}")
+    log_payload(logger, "This is the role fragment", rolefragment, logging.DEBUG)
 
     # Extract shorthand properties for role type, name, and desired permissions
     roletype = rolefragment["Properties"]["Type"]
     rolename = rolefragment["Properties"]["Name"]
     permissions = rolefragment["Properties"]["Permissions"]
 
-    # Get the basic role template (from policytemplates.py) and do a simple
-    # string replace to set the name and the AWS service principal for the
-    # trust policy (e.g. lambda)
-    returnval = roletemplate.replace("<ROLETYPE>", roletype.lower())
-    returnval = returnval.replace("<ROLENAME>", rolename)
-    # Load this as json to form the initial basis of the function return value
-    returnvaljson = json.loads(returnval)
+    # Fill the basic role template (from policytemplates.py) with the name
+    # and the AWS service principal for the trust policy (e.g. lambda) to
+    # form the initial basis of the function return value
+    returnvaljson = compiledroletemplate.fill(
+        ROLETYPE=roletype.lower(), ROLENAME=rolename
+    )
 
     # If the shorthand notation included a list of managed policy ARNs pass
     # those though as-is
@@ -90,45 +166,49 @@ def expand_role(rolefragment):
     # Loop through each of the short hand permissions
     for permission in permissions:
         # Debug output
-        print(f"permission: {permission}")
+        logger.debug("permission: %s", permission)
         # Split each shorthand permission into an action group (e.g. ReadOnly)
         # and the associated Resource
         for actiongroup, resource in permission.items():
-            print(f"actiongroup: {actiongroup}, resource: {resource}")
+            logger.debug("actiongroup: %s, resource: %s", actiongroup, resource)
             # Use the function below to extract the service (e.g. S3) from the resource ARN
             service = servicefromresource(resource)
-            print(f"service: {service}")
+            logger.debug("service: %s", service)
             # Lookup the given policy snippet from policytemplates.py based on
             # the service & action group If the necessary snippet isn't
             # included in policytemplates.py err out
-            if service in policytemplates and actiongroup in policytemplates[service]:
-                policytemplate = policytemplates[service][actiongroup]
+            if service in compiledpolicytemplates and \
+                    actiongroup in compiledpolicytemplates[service]:
+                policytemplate = compiledpolicytemplates[service][actiongroup]
             else:
                 raise Exception(f"No policy template found for service: {service} " + 
                                 f"and actiongroup: {actiongroup}")
-            # Substitute the placeholder in the template for the actual resource
-            policytemplate = policytemplate.replace("<RESOURCE>", resource)
-            # Policy names must be unique, appending a UUID is a simple way to
-            # guarantee that
-            uuidval = str(uuid.uuid4())
-            policytemplate = policytemplate.replace("<UUID>", uuidval)
-            # Convert the policy snippet to json and add it as an inline policy
-            # to the overall return values
-            policytemplatejson = json.loads(policytemplate)
-            print(f"adding policy: {policytemplate}")
+            # Fill the template with the actual resource. Policy names must be
+            # unique, so the <UUID> slot is filled with a hash of the content,
+            # which also keeps the output identical between runs
+            policytemplatejson = policytemplate.fill(
+                RESOURCE=resource, UUID=short_digest(service, actiongroup, resource)
+            )
+            # Add the policy snippet as an inline policy to the overall return values
+            logger.debug("adding policy: %s", policytemplatejson)
             returnvaljson["Properties"]["Policies"].append(policytemplatejson)
 
     # In addition to the permissions in the shorthand notation add the
     # 'allroles' policy template This template is used to provide permissions
     # like CloudWatchLogs instead of forcing each developer to repeatedly
     # specify common permissions
-    uuidval = str(uuid.uuid4())
-    allrolespolicytemplate = policytemplates["allroles"]["default"]
-    allrolespolicytemplate = allrolespolicytemplate.replace("<UUID>", uuidval)
-    allrolespolicytemplatejson = json.loads(allrolespolicytemplate)
-    print(f"adding policy: {allrolespolicytemplate}")
+    allrolespolicytemplate = compiledpolicytemplates["allroles"]["default"]
+    allrolespolicytemplatejson = allrolespolicytemplate.fill(UUID=short_digest("allroles"))
+    logger.debug("adding policy: %s", allrolespolicytemplatejson)
     returnvaljson["Properties"]["Policies"].append(allrolespolicytemplatejson)
 
+    policies = returnvaljson["Properties"]["Policies"]
+    if PACK_INLINE_POLICIES:
+        returnvaljson["Properties"]["Policies"] = pack_policies(policies)
+    else:
+        returnvaljson["Properties"]["Policies"] = dedupe_policies(policies)
+    check_inline_policy_size(rolename, returnvaljson["Properties"]["Policies"])
+
     # Return the expanded proper CloudFormation
     return returnvaljson
 
@@ -136,3 +216,110 @@ def expand_role(rolefragment):
 def servicefromresource(resource):
     "Simple function to return the AWS service (e.g. S3) from a given resource ARN"
     return resource.split(":")[2]
+
+
+def compact_json(value):
+    "Serialize a value the way IAM counts policy size, without whitespace"
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def short_digest(*parts):
+    "Short, stable hash of some strings, used to name policies"
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def as_list(value):
+    "IAM accepts a single string or a list for Action and Resource"
+    return value if isinstance(value, list) else [value]
+
+
+def from_list(values):
+    "Collapse a single-element list back into a plain string"
+    return values[0] if len(values) == 1 else values
+
+
+def merge_statements(statements):
+    """
+    Merge policy statements without changing what they allow.
+
+    Identical statements are dropped. Simple statements (only Effect, Action
+    and Resource) with the same effect and actions are combined by joining
+    their resources, then those with the same effect and resources are
+    combined by joining their actions. Anything else, such as statements
+    with conditions, is kept as it is. The result is in order of first
+    appearance, so the same input always gives the same output.
+    """
+    by_actions = {}
+    others = []
+    for statement in statements:
+        if set(statement) != {"Effect", "Action", "Resource"}:
+            if statement not in others:
+                others.append(statement)
+            continue
+        key = (statement["Effect"], tuple(sorted(set(as_list(statement["Action"])))))
+        resources = by_actions.setdefault(key, [])
+        for resource in as_list(statement["Resource"]):
+            if resource not in resources:
+                resources.append(resource)
+
+    by_resources = {}
+    for (effect, actions), resources in by_actions.items():
+        if "*" in resources:
+            resources = ["*"]
+        merged = by_resources.setdefault((effect, tuple(resources)), [])
+        for action in actions:
+            if action not in merged:
+                merged.append(action)
+
+    merged_statements = [
+        {
+            "Effect": effect,
+            "Action": from_list(sorted(actions)),
+            "Resource": from_list(list(resources)),
+        }
+        for (effect, resources), actions in by_resources.items()
+    ]
+    return merged_statements + others
+
+
+def pack_policies(policies):
+    """
+    Merge the statements of a role's policies into a single inline policy.
+    IAM limits the total size of a role's inline policies rather than the
+    size of each one, so splitting them up never lets a role hold more.
+    The policy is named after a hash of its content.
+    """
+    document = {
+        "Version": "2012-10-17",
+        "Statement": merge_statements(
+            [
+                statement
+                for policy in policies
+                for statement in as_list(policy["PolicyDocument"]["Statement"])
+            ]
+        ),
+    }
+    return [
+        {
+            "PolicyName": f"Policy-{short_digest(compact_json(document))}",
+            "PolicyDocument": document,
+        }
+    ]
+
+
+def check_inline_policy_size(rolename, policies):
+    "Fail the macro if a role's inline policies exceed the IAM quota"
+    size = sum(len(compact_json(policy["PolicyDocument"])) for policy in policies)
+    if size > MAX_ROLE_INLINE_POLICY_SIZE:
+        raise Exception(f"The inline policies of role {rolename} total {size} characters, " +
+                        f"more than the IAM quota of {MAX_ROLE_INLINE_POLICY_SIZE}. " +
+                        "Use fewer permissions or managed policies")
+
+
+def dedupe_policies(policies):
+    "Drop policies that are identical to an earlier one"
+    unique = []
+    for policy in policies:
+        if policy not in unique:
+            unique.append(policy)
+    return unique
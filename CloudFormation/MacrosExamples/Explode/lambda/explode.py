@@ -12,33 +12,6 @@ EXPLODE_RE = re.compile(r"(?i)!Explode (?P<explode_key>\w+)")
 logger = logging.getLogger(__name__)
 
 
-def walk_resource(resource, map_data):
-    """Recursively process a resource."""
-    if isinstance(resource, dict):
-        new_resource = {}
-        for key, value in resource.items():
-            if isinstance(value, (dict, list)):
-                new_resource[key] = walk_resource(value, map_data)
-            elif isinstance(value, str):
-                new_resource[key] = replace_explode_in_string(value, map_data)
-            else:
-                new_resource[key] = value
-    elif isinstance(resource, list):
-        new_resource = []
-        for value in resource:
-            if isinstance(value, (dict, list)):
-                new_resource.append(walk_resource(value, map_data))
-            elif isinstance(value, str):
-                new_resource.append(replace_explode_in_string(value, map_data))
-            else:
-                new_resource.append(value)
-
-    else:
-        # if the resource is of type string
-        new_resource = replace_explode_in_string(resource, map_data)
-    return new_resource
-
-
 def replace_explode_in_string(value, map_data):
     """Recursively process and replace Explode instances in a string."""
     match = EXPLODE_RE.search(value)
@@ -62,6 +35,77 @@ def replace_explode_in_string(value, map_data):
     return value
 
 
+def compile_resource(resource):
+    """Walk a resource once and record where its !Explode tokens live.
+
+    The returned plan mirrors the resource: container plans are dicts keyed
+    by the dict key or list index of each child that contains a token, and
+    string leaves are compiled into the tuple produced by splitting on
+    EXPLODE_RE (literals at even positions, mapping keys at odd positions).
+    Returns None if the resource contains no tokens at all.
+    """
+    if isinstance(resource, dict):
+        items = resource.items()
+    elif isinstance(resource, list):
+        items = enumerate(resource)
+    elif isinstance(resource, str):
+        segments = tuple(EXPLODE_RE.split(resource))
+        return segments if len(segments) > 1 else None
+    else:
+        return None
+    plan = {}
+    for key, value in items:
+        child_plan = compile_resource(value)
+        if child_plan is not None:
+            plan[key] = child_plan
+    return plan or None
+
+
+def render_string(value, segments, map_data):
+    """Fill a compiled string leaf with values from one mapping entry."""
+    parts = []
+    nested = False
+    for index, segment in enumerate(segments):
+        if index % 2 == 0:
+            parts.append(segment)
+            continue
+        try:
+            replace_value = map_data[segment]
+        except KeyError as exc:
+            d = json.dumps(map_data, indent=4)
+            raise Exception(
+                f"Missing item {segment} in mapping while processing: " +
+                f"{value}\nMap Data:\n{d}"
+            ) from exc
+        if isinstance(replace_value, int):
+            # No further explosion is possible on an int
+            return replace_value
+        nested = nested or "!" in replace_value
+        parts.append(replace_value)
+    new_value = "".join(parts)
+    if nested:
+        # A mapped value may itself contain !Explode tokens
+        new_value = replace_explode_in_string(new_value, map_data)
+    return new_value
+
+
+def render_resource(resource, plan, map_data):
+    """Produce one instance of a resource from its compiled plan.
+
+    Only the containers on the path to a token are copied; every other
+    subtree is shared with the original resource and the other instances,
+    so it must not be changed in place.
+    """
+    if plan is None:
+        return resource
+    if isinstance(plan, tuple):
+        return render_string(resource, plan, map_data)
+    new_resource = resource.copy()
+    for key, child_plan in plan.items():
+        new_resource[key] = render_resource(resource[key], child_plan, map_data)
+    return new_resource
+
+
 def handle_section_transform(section, mappings):
     """Go through template and explode objects in the section."""
     new_section = {}
@@ -82,11 +126,13 @@ def handle_section_transform(section, mappings):
             raise Exception(
                 f"Unable to find mapping for exploding object {resource_name}"
             ) from exc
-        resource_instances = explode_map_data.keys()
-        for resource_instance in resource_instances:
-            new_resource = walk_resource(resource, explode_map_data[resource_instance])
-            if "ResourceName" in explode_map_data[resource_instance]:
-                new_resource_name = explode_map_data[resource_instance]["ResourceName"]
+        # An empty plan still copies the top level, so that every instance
+        # is a dict of its own even if the resource has no tokens
+        plan = compile_resource(resource) or {}
+        for resource_instance, instance_data in explode_map_data.items():
+            new_resource = render_resource(resource, plan, instance_data)
+            if "ResourceName" in instance_data:
+                new_resource_name = instance_data["ResourceName"]
             else:
                 new_resource_name = resource_name + resource_instance
             new_section[new_resource_name] = new_resource
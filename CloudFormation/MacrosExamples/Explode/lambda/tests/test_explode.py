@@ -0,0 +1,131 @@
+"""Tests for the compiled plans in the explode.py module."""
+
+import copy
+import json
+import os
+import sys
+
+import pytest
+
+# The macro is a single top-level module
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import explode  # noqa: E402
+
+MAPPING = {
+    "Monthly": {"Name": "monthly", "Retention": 30, "Prefix": "!Explode Name-logs"},
+    "Yearly": {"ResourceName": "Archive", "Name": "yearly", "Retention": 365,
+               "Prefix": "!Explode Name-archive"},
+}
+
+RESOURCE = {
+    "Type": "AWS::S3::Bucket",
+    "Properties": {
+        "BucketName": "bucket-!Explode Name-!explode Name",
+        "LifecycleConfiguration": {
+            "Rules": [
+                {"Id": "expire", "Status": "Enabled", "ExpirationInDays": "!Explode Retention"},
+                {"Id": "keep", "Status": "Enabled", "Prefix": "!Explode Prefix"},
+            ]
+        },
+        "Tags": [{"Key": "Team", "Value": "storage"}, {"Key": "Enabled", "Value": True}],
+        "Retained": ["!Explode Retention", None, 1.5],
+    },
+}
+
+
+def walk_resource(resource, map_data):
+    "The walker that compiled plans replaced, copying the whole resource"
+    if isinstance(resource, dict):
+        return {key: walk_resource(value, map_data) for key, value in resource.items()}
+    if isinstance(resource, list):
+        return [walk_resource(value, map_data) for value in resource]
+    if isinstance(resource, str):
+        return explode.replace_explode_in_string(resource, map_data)
+    return resource
+
+
+def test_plans_cover_only_the_paths_to_tokens():
+    rules = RESOURCE["Properties"]["LifecycleConfiguration"]["Rules"]
+
+    assert explode.compile_resource(RESOURCE) == {
+        "Properties": {
+            "BucketName": ("bucket-", "Name", "-", "Name", ""),
+            "LifecycleConfiguration": {"Rules": {
+                0: {"ExpirationInDays": ("", "Retention", "")},
+                1: {"Prefix": ("", "Prefix", "")},
+            }},
+            "Retained": {0: ("", "Retention", "")},
+        }
+    }
+    assert explode.compile_resource(rules[0]["Id"]) is None
+    assert explode.compile_resource({"Tags": RESOURCE["Properties"]["Tags"]}) is None
+
+
+@pytest.mark.parametrize(
+    "value",
+    ["!Explode Name", "a-!Explode Name-b-!Explode Name", "!Explode Retention days",
+     "x-!Explode Prefix", "!EXPLODE Name and !Explode Prefix"],
+)
+@pytest.mark.parametrize("entry", list(MAPPING))
+def test_strings_render_as_the_walker_replaced_them(value, entry):
+    segments = explode.compile_resource(value)
+
+    rendered = explode.render_string(value, segments, MAPPING[entry])
+
+    assert rendered == explode.replace_explode_in_string(value, MAPPING[entry])
+
+
+def test_missing_mapping_keys_are_reported():
+    value = "!Explode Missing"
+
+    with pytest.raises(Exception, match="Missing item Missing in mapping"):
+        explode.render_string(value, explode.compile_resource(value), MAPPING["Monthly"])
+
+
+@pytest.mark.parametrize("entry", list(MAPPING))
+def test_resources_render_as_the_walker_copied_them(entry):
+    original = copy.deepcopy(RESOURCE)
+
+    rendered = explode.render_resource(RESOURCE, explode.compile_resource(RESOURCE), MAPPING[entry])
+
+    assert rendered == walk_resource(RESOURCE, MAPPING[entry])
+    assert RESOURCE == original
+
+
+@pytest.mark.parametrize("resource", [RESOURCE, {"Type": "AWS::SNS::Topic"}])
+def test_instances_can_be_changed_without_changing_the_others(resource):
+    section = explode.handle_section_transform(
+        {"Bucket": dict(copy.deepcopy(resource), ExplodeMap="Buckets")}, {"Buckets": MAPPING}
+    )
+    expected = walk_resource(resource, MAPPING["Yearly"])
+
+    # Later changes to the top level of an instance, or to what was rendered
+    monthly = section["BucketMonthly"]
+    monthly["DependsOn"] = "Archive"
+    if "Properties" in monthly:
+        monthly["Properties"]["BucketName"] = "changed"
+        monthly["Properties"]["LifecycleConfiguration"]["Rules"][1]["Prefix"] = "changed"
+
+    assert section["Archive"] == expected
+    assert "DependsOn" not in section["Archive"]
+
+
+def test_fragments_serialize_as_the_walker_output():
+    fragment = {
+        "Mappings": {"Buckets": MAPPING},
+        "Resources": {"Bucket": dict(copy.deepcopy(RESOURCE), ExplodeMap="Buckets")},
+        "Outputs": {"Name": {"ExplodeMap": "Buckets", "Value": "!Explode Name"}},
+    }
+
+    result = explode.handler({"requestId": "1", "fragment": copy.deepcopy(fragment)}, None)
+
+    assert result["status"] == "success"
+    assert json.dumps(result["fragment"]["Resources"]) == json.dumps({
+        "BucketMonthly": walk_resource(RESOURCE, MAPPING["Monthly"]),
+        "Archive": walk_resource(RESOURCE, MAPPING["Yearly"]),
+    })
+    assert result["fragment"]["Outputs"] == {
+        "NameMonthly": {"Value": "monthly"}, "Archive": {"Value": "yearly"}
+    }
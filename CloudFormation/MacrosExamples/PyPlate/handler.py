@@ -8,8 +8,115 @@ this file to replace the !Rain::Embed directive in the template)
 
 #pylint: disable=exec-used
 
+import ast
+import functools
+import hashlib
+import logging
+import multiprocessing
+import os
+import random
+import time
 import traceback
 import json
+from collections import OrderedDict, deque
+from multiprocessing.connection import wait
+
+CODE_CACHE_SIZE = int(os.environ.get("PYPLATE_CODE_CACHE_SIZE", "256"))
+
+# "serial" runs every snippet in document order in one shared namespace,
+# "parallel" runs independent snippets concurrently in child processes
+EXECUTION_MODE = os.environ.get("PYPLATE_EXECUTION_MODE", "serial")
+MAX_WORKERS = int(os.environ.get("PYPLATE_MAX_WORKERS", str(os.cpu_count() or 1)))
+SNIPPET_TIMEOUT = float(os.environ.get("PYPLATE_SNIPPET_TIMEOUT", "60"))
+
+# Names provided by the macro itself. Only changes to them, and not reads,
+# make snippets dependent, and output is reset for every snippet
+BUILTIN_NAMES = {"params", "account_id", "region", "output"}
+
+# Methods that change a dict or list in place, such as params or a list in it
+MUTATING_METHODS = {
+    "append", "extend", "insert", "remove", "sort", "reverse",
+    "update", "pop", "popitem", "setdefault", "clear",
+}
+
+# Logging configuration, matching macro_logging.py in the other macros. This
+# handler is embedded into the template as a single file, so it carries its
+# own copy of the payload helpers
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+PREVIEW_CHARS = int(os.environ.get("LOG_PREVIEW_CHARS", "2048"))
+FULL_PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_FULL_PAYLOAD_SAMPLE_RATE", "0"))
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+
+class Preview:
+    "JSON rendering of a payload, computed lazily and capped at a length"
+
+    __slots__ = ("payload", "limit")
+
+    def __init__(self, payload, limit=PREVIEW_CHARS):
+        self.payload = payload
+        self.limit = limit
+
+    def __str__(self):
+        encoder = json.JSONEncoder(default=str)
+        if self.limit is None:
+            return encoder.encode(self.payload)
+        chunks = []
+        size = 0
+        for chunk in encoder.iterencode(self.payload):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.limit:
+                return "".join(chunks)[: self.limit] + f"... (truncated, limit {self.limit})"
+        return "".join(chunks)
+
+
+def log_payload(message, payload, level=logging.INFO):
+    "Log a capped preview of a payload, or all of it for a sampled fraction of calls"
+    if not logger.isEnabledFor(level):
+        return
+    if FULL_PAYLOAD_SAMPLE_RATE > 0 and random.random() < FULL_PAYLOAD_SAMPLE_RATE:
+        logger.log(level, "%s (full): %s", message, Preview(payload, None))
+    else:
+        logger.log(level, "%s: %s", message, Preview(payload))
+
+
+class CodeCache:
+    """
+    LRU cache of compiled PyPlate snippets, keyed by the SHA-256 of the
+    snippet source. It lives at module level so that it survives warm
+    invocations of the Lambda function.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._codes = OrderedDict()
+
+    def get(self, source):
+        "Return the compiled code object for a snippet, compiling it on a miss"
+        key = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        code = self._codes.get(key)
+        if code is not None:
+            self._codes.move_to_end(key)
+            self.hits += 1
+            return code
+        self.misses += 1
+        code = compile(source, "<PyPlate>", "exec")
+        self._codes[key] = code
+        if len(self._codes) > self.maxsize:
+            self._codes.popitem(last=False)
+        return code
+
+    def stats(self):
+        "Return the cache counters"
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._codes)}
+
+
+CODE_CACHE = CodeCache(CODE_CACHE_SIZE)
 
 
 def obj_iterate(obj, params):
@@ -23,17 +130,194 @@ def obj_iterate(obj, params):
     elif isinstance(obj, str):
         if obj.startswith("#!PyPlate"):
             params["output"] = None
-            exec(obj, params)
+            exec(CODE_CACHE.get(obj), params)
             obj = params["output"]
     return obj
 
 
+def collect_snippets(obj, snippets):
+    "Record the location of every PyPlate directive in document order"
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, list):
+        items = enumerate(obj)
+    else:
+        return snippets
+    for k, v in items:
+        if isinstance(v, str):
+            if v.startswith("#!PyPlate"):
+                snippets.append((obj, k, v))
+        else:
+            collect_snippets(v, snippets)
+    return snippets
+
+
+@functools.lru_cache(maxsize=CODE_CACHE_SIZE)
+def analyze_snippet(source):
+    """
+    Return the global names a snippet may store and load, and whether it
+    must run in the shared namespace. This over-approximates: every name
+    bound or read anywhere in the snippet counts, except that a snippet's
+    reads of names it binds itself are not treated as loads.
+    """
+    stores, loads, imports, modified = set(), set(), set(), set()
+    shared = False
+    for node in ast.walk(ast.parse(source)):
+        # Assignments into a value, such as params["x"] = 1, and calls such
+        # as params.update(...) change the value the later snippets see
+        if isinstance(node, (ast.Subscript, ast.Attribute)) and \
+                not isinstance(node.ctx, ast.Load):
+            modified.add(root_name(node))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and \
+                node.func.attr in MUTATING_METHODS:
+            modified.add(root_name(node.func.value))
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loads.add(node.id)
+            else:
+                stores.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            stores.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                imports.add((alias.asname or alias.name).split(".")[0])
+        elif isinstance(node, ast.Global):
+            stores.update(node.names)
+    # Snippets that read the template see the results of earlier snippets,
+    # and introspection of the namespace cannot be analysed
+    if loads & {"template", "globals", "locals", "vars", "exec", "eval"}:
+        shared = True
+    # Names a snippet binds itself, including the modules it imports, are
+    # treated as its own rather than taken from earlier snippets. Changes to
+    # the macro's names count as stores of them, which snippets reading the
+    # names after it depend on
+    changed = (modified | stores) & (BUILTIN_NAMES - {"output"})
+    stores = (stores | imports) - BUILTIN_NAMES
+    loads = loads - stores - {"output"}
+    return frozenset(stores | changed), frozenset(loads), shared
+
+
+def root_name(node):
+    "Return the name a chain of subscripts and attributes starts from, if any"
+    while isinstance(node, (ast.Subscript, ast.Attribute)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def find_independent(snippets):
+    """
+    Return the indexes of the snippets that neither read a name stored by an
+    earlier snippet nor store a name read by a later one.
+    """
+    analysis = [analyze_snippet(source) for _, _, source in snippets]
+    dependent = set()
+    for i, (_, loads_i, shared_i) in enumerate(analysis):
+        if shared_i:
+            dependent.add(i)
+        for j in range(i):
+            if analysis[j][0] & loads_i:
+                dependent.update((i, j))
+    return [i for i in range(len(snippets)) if i not in dependent]
+
+
+def run_snippet(code, params, conn):
+    "Run one snippet in a child process and send its output back to the parent"
+    try:
+        params["output"] = None
+        exec(code, params)
+        conn.send((True, params["output"]))
+    except Exception as e:
+        conn.send((False, f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def run_parallel(codes, params, max_workers, timeout):
+    """
+    Run code objects, given as a dict keyed by snippet index, concurrently.
+    Each runs in its own forked process (and so its own copy of the
+    namespace), with a wall-clock timeout per snippet. Returns a dict of the
+    outputs keyed by snippet index.
+
+    Processes and pipes are used directly because Lambda does not provide
+    the shared memory that multiprocessing pools and queues rely on.
+    """
+    ctx = multiprocessing.get_context("fork")
+    outputs = {}
+    pending = deque(sorted(codes.items()))
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < max_workers:
+                index, code = pending.popleft()
+                parent_conn, child_conn = ctx.Pipe(duplex=False)
+                process = ctx.Process(
+                    target=run_snippet, args=(code, params, child_conn), daemon=True
+                )
+                process.start()
+                child_conn.close()
+                running[parent_conn] = (index, process, time.monotonic() + timeout)
+
+            next_deadline = min(deadline for _, _, deadline in running.values())
+            for conn in wait(list(running), max(0, next_deadline - time.monotonic())):
+                index, process, _ = running.pop(conn)
+                try:
+                    ok, value = conn.recv()
+                except EOFError:
+                    ok, value = False, "process exited without a result"
+                conn.close()
+                process.join()
+                if not ok:
+                    raise Exception(f"PyPlate snippet {index} failed: {value}")
+                outputs[index] = value
+
+            now = time.monotonic()
+            for index, _, deadline in running.values():
+                if deadline <= now:
+                    raise Exception(
+                        f"PyPlate snippet {index} timed out after {timeout} seconds"
+                    )
+    finally:
+        for conn, (_, process, _) in running.items():
+            process.terminate()
+            process.join()
+            conn.close()
+    return outputs
+
+
+def obj_iterate_parallel(obj, params, max_workers=MAX_WORKERS, timeout=SNIPPET_TIMEOUT):
+    """
+    Execute PyPlate directives, running the independent ones concurrently.
+
+    Independent snippets run first, each in a private copy of the namespace.
+    Then, in document order, their outputs are spliced back in and the
+    remaining snippets run in the shared namespace, so that a snippet that
+    reads the template sees the same template as it would in serial mode.
+    """
+    snippets = collect_snippets(obj, [])
+    codes = [CODE_CACHE.get(source) for _, _, source in snippets]
+    independent = find_independent(snippets)
+
+    outputs = run_parallel(
+        {i: codes[i] for i in independent}, params, max_workers, timeout
+    )
+    for i, (container, key, _) in enumerate(snippets):
+        if i in outputs:
+            container[key] = outputs[i]
+        else:
+            params["output"] = None
+            exec(codes[i], params)
+            container[key] = params["output"]
+    return obj
+
+
 def handler(event, _):
     "Lambda handler"
 
-    print(json.dumps(event))
+    log_payload("Received event", event)
 
     macro_response = {"requestId": event["requestId"], "status": "success"}
+    cache_before = CODE_CACHE.stats()
     try:
         params = {
             "params": event["templateParameterValues"],
@@ -42,9 +326,20 @@ def handler(event, _):
             "region": event["region"],
         }
         response = event["fragment"]
-        macro_response["fragment"] = obj_iterate(response, params)
+        if EXECUTION_MODE == "parallel":
+            macro_response["fragment"] = obj_iterate_parallel(response, params)
+        else:
+            macro_response["fragment"] = obj_iterate(response, params)
     except Exception as e:
         traceback.print_exc()
         macro_response["status"] = "failure"
         macro_response["errorMessage"] = str(e)
+    cache_after = CODE_CACHE.stats()
+    macro_response["metadata"] = {
+        "codeCache": {
+            "hits": cache_after["hits"] - cache_before["hits"],
+            "misses": cache_after["misses"] - cache_before["misses"],
+            "size": cache_after["size"],
+        }
+    }
     return macro_response
@@ -0,0 +1,75 @@
+"""Tests for running PyPlate snippets in parallel mode."""
+
+import copy
+import os
+import sys
+
+# The handler is a single top-level module
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import handler  # noqa: E402
+
+
+def run_both(fragment):
+    "Run the snippets in a fragment serially and in parallel"
+    params = {"params": {}, "account_id": "123456789012", "region": "us-east-1"}
+    serial = copy.deepcopy(fragment)
+    parallel = copy.deepcopy(fragment)
+    handler.obj_iterate(serial, dict(copy.deepcopy(params), template=serial))
+    handler.obj_iterate_parallel(
+        parallel, dict(copy.deepcopy(params), template=parallel), max_workers=2
+    )
+    return serial, parallel
+
+
+def test_template_reader_sees_later_snippets_unevaluated():
+    fragment = {
+        "Resources": {
+            "Reader": {"Value": "#!PyPlate\noutput = template['Resources']['Later']['Value']"},
+            "Later": {"Value": "#!PyPlate\noutput = 'evaluated'"},
+        }
+    }
+
+    serial, parallel = run_both(fragment)
+
+    assert parallel == serial
+    assert parallel["Resources"]["Reader"]["Value"].startswith("#!PyPlate")
+    assert parallel["Resources"]["Later"]["Value"] == "evaluated"
+
+
+def test_template_reader_sees_earlier_snippets_evaluated():
+    fragment = {
+        "Resources": {
+            "Earlier": {"Value": "#!PyPlate\noutput = 'evaluated'"},
+            "Reader": {"Value": "#!PyPlate\noutput = template['Resources']['Earlier']['Value']"},
+        }
+    }
+
+    serial, parallel = run_both(fragment)
+
+    assert parallel == serial
+    assert parallel["Resources"]["Reader"]["Value"] == "evaluated"
+
+
+def test_changes_to_params_are_seen_by_later_snippets():
+    fragment = {
+        "Resources": {
+            "Reader": {"Value": "#!PyPlate\noutput = params.get('Cidr', 'unset')"},
+            "Writer": {"Value": "#!PyPlate\nparams['Cidr'] = '10.0.0.0/16'\noutput = 'set'"},
+            "Updater": {
+                "Value": "#!PyPlate\nparams.update(Subnets=['10.0.0.0/24'])\noutput = 'set'"
+            },
+            "Later": {"Value": "#!PyPlate\noutput = [params['Cidr']] + params['Subnets']"},
+            "Other": {"Value": "#!PyPlate\noutput = region"},
+        }
+    }
+    names = list(fragment["Resources"])
+
+    # Reader runs before the changes, so only it and Other run on their own
+    independent = handler.find_independent(handler.collect_snippets(fragment, []))
+    assert [names[i] for i in independent] == ["Reader", "Other"]
+    serial, parallel = run_both(fragment)
+    assert parallel == serial
+    assert parallel["Resources"]["Reader"]["Value"] == "unset"
+    assert parallel["Resources"]["Later"]["Value"] == ["10.0.0.0/16", "10.0.0.0/24"]
@@ -1,15 +1,82 @@
 """
 Custom resource cfn-response module.
+
+Responses are sent over a shared keep-alive connection pool with connect and
+read timeouts, retried with exponential backoff on server errors and
+connection failures, and trimmed to fit the size CloudFormation accepts.
 """
 
-from __future__ import print_function
 import json
+import os
+import time
+
 import urllib3
 
+from macro_logging import get_logger, log_payload
+
+logger = get_logger(__name__)
+
 SUCCESS = "SUCCESS"
 FAILED = "FAILED"
 
-http = urllib3.PoolManager()
+# CloudFormation rejects response bodies larger than this
+MAX_RESPONSE_BYTES = 4096
+
+CONNECT_TIMEOUT = float(os.environ.get("RESPONSE_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("RESPONSE_READ_TIMEOUT", "15"))
+MAX_ATTEMPTS = int(os.environ.get("RESPONSE_MAX_ATTEMPTS", "5"))
+BACKOFF_FACTOR = float(os.environ.get("RESPONSE_BACKOFF_FACTOR", "0.5"))
+
+# The pool outlives the invocation, so warm invocations reuse the connection
+http = urllib3.PoolManager(
+    maxsize=2,
+    timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT),
+    headers={"Connection": "keep-alive"},
+)
+
+
+def retry_policy():
+    "Return the retry policy for a response, built from the current settings"
+    return urllib3.Retry(
+        total=MAX_ATTEMPTS - 1,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(["PUT"]),
+        raise_on_status=False,
+    )
+
+
+def fit_response(response_body, limit=MAX_RESPONSE_BYTES):
+    """
+    Return the response serialised as JSON, dropping the largest Data
+    attributes (and then shortening the Reason) until it fits in limit
+    bytes. A response that is too large would be rejected outright and the
+    stack would wait for a response until the resource timed out.
+    """
+    encoded = json.dumps(response_body, separators=(",", ":")).encode()
+    if len(encoded) <= limit:
+        return encoded
+
+    data = dict(response_body["Data"])
+    sizes = {key: len(json.dumps({key: value})) for key, value in data.items()}
+    dropped = 0
+    while data and len(encoded) > limit:
+        del data[max(data, key=sizes.__getitem__)]
+        dropped += 1
+        response_body = dict(response_body, Data=data)
+        encoded = json.dumps(response_body, separators=(",", ":")).encode()
+
+    if dropped:
+        logger.warning("Dropped %d Data attributes to fit the response limit", dropped)
+
+    if len(encoded) > limit:
+        excess = len(encoded) - limit
+        reason = response_body["Reason"]
+        keep = max(len(reason) - excess - 3, 0)
+        response_body = dict(response_body, Reason=reason[:keep] + "...")
+        encoded = json.dumps(response_body, separators=(",", ":")).encode()
+
+    return encoded
 
 
 # pylint: disable=too-many-arguments,too-many-locals
@@ -22,10 +89,12 @@ def send(
     no_echo=False,
     reason=None,
 ):
-    "Send a response to CloudFormation regarding the status of the custom resource."
-    response_url = event["ResponseURL"]
+    """
+    Send a response to CloudFormation regarding the status of the custom resource.
 
-    print(response_url)
+    Returns True if CloudFormation accepted the response.
+    """
+    response_url = event["ResponseURL"]
 
     default_reason = "See the details in CloudWatch Log Stream: {}"
 
@@ -40,18 +109,25 @@ def send(
         "Data": response_data,
     }
 
-    json_response_body = json.dumps(response_body)
+    body = fit_response(response_body)
 
-    print("Response body:")
-    print(json_response_body)
+    if not no_echo:
+        log_payload(logger, "Response body", response_body)
 
-    headers = {"content-type": "", "content-length": str(len(json_response_body))}
+    headers = {"content-type": "", "content-length": str(len(body))}
 
+    start = time.monotonic()
     try:
         response = http.request(
-            "PUT", response_url, headers=headers, body=json_response_body
+            "PUT", response_url, headers=headers, body=body, retries=retry_policy()
         )
-        print("Status code:", response.status)
-
     except Exception as e:
-        print("send(..) failed executing http.request(..):", e)
+        logger.error("Failed to send response after %.0fms: %s",
+                     (time.monotonic() - start) * 1000, e)
+        return False
+
+    attempts = len(response.retries.history) + 1 if response.retries else 1
+    logger.info("Sent response in %.0fms: status %d after %d attempt(s)",
+                (time.monotonic() - start) * 1000, response.status, attempts)
+
+    return response.status < 300
@@ -4,15 +4,49 @@ import os
 
 import boto3
 
+from macro_logging import get_logger
+
+logger = get_logger(__name__)
+
 LAMBDA_ARN = os.environ["LAMBDA_ARN"]
 
 s3_client = boto3.client("s3")
 
 
+def object_set_resource(props):
+    "Return the custom resource that replaces an AWS::S3::ObjectSet"
+
+    if len([prop for prop in props if prop in ["Objects", "Source"]]) != 1:
+        raise Exception("You must specify exactly one of: Objects, Source")
+
+    for key, source in props.get("Objects", {}).items():
+        if len([prop for prop in source if prop in ["Body", "URL", "Base64Body", "Source"]]) != 1:
+            raise Exception(
+                f"Object {key}: you must specify exactly one of: Body, URL, Base64Body, Source"
+            )
+
+    resource_props = {
+        "ServiceToken": LAMBDA_ARN,
+        "Target": props["Target"],
+        "ServiceTimeout": 900,
+    }
+
+    if "Objects" in props:
+        resource_props["Objects"] = props["Objects"]
+    else:
+        resource_props["Source"] = props["Source"]
+
+    return {
+        "Type": "Custom::S3ObjectSet",
+        "Version": "1.0",
+        "Properties": resource_props,
+    }
+
+
 def handle_template(request_id, template):
     "Process the template and modify instances of AWS::S3::Object"
 
-    print(request_id)
+    logger.info("Processing request %s", request_id)
 
     new_resources = {}
 
@@ -61,6 +95,9 @@ def handle_template(request_id, template):
                 "Properties": resource_props,
             }
 
+        elif resource["Type"] == "AWS::S3::ObjectSet":
+            new_resources[name] = object_set_resource(resource["Properties"])
+
     for name, resource in list(new_resources.items()):
         template["Resources"][name] = resource
 
@@ -0,0 +1,71 @@
+"""
+Logging helpers shared by the macro and custom resource handlers.
+
+Template fragments and events can be several megabytes, so payloads are
+only serialized when a log record is actually emitted, and then only up to
+a size cap. A configurable fraction of payloads is logged in full.
+
+Environment variables:
+
+LOG_LEVEL: logging level name (default: INFO)
+LOG_PREVIEW_CHARS: maximum length of a payload preview (default: 2048)
+LOG_FULL_PAYLOAD_SAMPLE_RATE: fraction of payloads logged in full, between
+    0 and 1 (default: 0)
+"""
+
+import json
+import logging
+import os
+import random
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+PREVIEW_CHARS = int(os.environ.get("LOG_PREVIEW_CHARS", "2048"))
+FULL_PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_FULL_PAYLOAD_SAMPLE_RATE", "0"))
+
+
+def get_logger(name):
+    "Return a logger set to the configured level"
+    logger = logging.getLogger(name)
+    logger.setLevel(LOG_LEVEL)
+    return logger
+
+
+class Preview:
+    """
+    JSON rendering of a payload that is only computed when formatted.
+
+    With a limit, encoding stops as soon as the limit is reached, so the
+    cost does not depend on the size of the payload.
+    """
+
+    __slots__ = ("payload", "limit")
+
+    def __init__(self, payload, limit=PREVIEW_CHARS):
+        self.payload = payload
+        self.limit = limit
+
+    def __str__(self):
+        encoder = json.JSONEncoder(default=str)
+        if self.limit is None:
+            return encoder.encode(self.payload)
+        chunks = []
+        size = 0
+        for chunk in encoder.iterencode(self.payload):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.limit:
+                return "".join(chunks)[: self.limit] + f"... (truncated, limit {self.limit})"
+        return "".join(chunks)
+
+
+def log_payload(logger, message, payload, level=logging.INFO):
+    """
+    Log a payload as a size-capped preview, or in full for a sampled
+    fraction of calls. Nothing is serialized if the level is disabled.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if FULL_PAYLOAD_SAMPLE_RATE > 0 and random.random() < FULL_PAYLOAD_SAMPLE_RATE:
+        logger.log(level, "%s (full): %s", message, Preview(payload, None))
+    else:
+        logger.log(level, "%s: %s", message, Preview(payload))
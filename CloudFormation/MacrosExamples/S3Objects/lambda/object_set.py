@@ -0,0 +1,154 @@
+"""
+Handler for Custom::S3ObjectSet, which writes many objects in one invocation.
+
+The objects are written concurrently, and the keys of the set are recorded,
+by bucket, in a manifest object. The manifest is written before the objects
+so that it covers any that are written before a failure. Update removes keys
+that are no longer part of the set, from the buckets they were written to,
+and Delete removes exactly the keys in the manifest.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from upload import write_object
+
+OBJECT_SET_CONCURRENCY = int(os.environ.get("OBJECT_SET_CONCURRENCY", "16"))
+
+# delete_objects accepts at most this many keys per request
+DELETE_BATCH_SIZE = 1000
+
+
+def manifest_location(event):
+    "Return the bucket and key of the manifest for this resource"
+    if event["RequestType"] != "Create" and event.get("PhysicalResourceId", "").startswith("s3://"):
+        bucket, _, key = event["PhysicalResourceId"][len("s3://"):].partition("/")
+        return bucket, key
+    target = event["ResourceProperties"]["Target"]
+    prefix = target.get("Prefix", "")
+    return target["Bucket"], f"{prefix}.manifest/{event['LogicalResourceId']}.json"
+
+
+def read_manifest(s3_client, bucket, key):
+    """
+    Return a dict of bucket to the list of keys in it from a manifest, or an
+    empty dict if there isn't one
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return {}
+    manifest = json.loads(response["Body"].read())
+    if "Buckets" in manifest:
+        return manifest["Buckets"]
+    # Manifests written before sets could move between buckets
+    return {manifest.get("Bucket", bucket): manifest["Keys"]}
+
+
+def write_manifest(s3_client, bucket, key, objects):
+    "Write a manifest of a dict of bucket to the list of keys in it"
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps({"Buckets": {name: keys for name, keys in objects.items() if keys}}),
+        ContentType="application/json",
+    )
+
+
+def plan_objects(s3_client, properties):
+    """
+    Return a list of (target key, source) pairs for the set, where source
+    is a dict as accepted by write_object.
+    """
+    target = properties["Target"]
+    prefix = target.get("Prefix", "")
+
+    if "Objects" in properties:
+        return [(prefix + key, source) for key, source in properties["Objects"].items()]
+
+    source = properties["Source"]
+    source_prefix = source.get("Prefix", "")
+    plan = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=source["Bucket"], Prefix=source_prefix):
+        for item in page.get("Contents", []):
+            plan.append((
+                prefix + item["Key"][len(source_prefix):],
+                {"Source": {"Bucket": source["Bucket"], "Key": item["Key"]}},
+            ))
+    return plan
+
+
+def write_objects(s3_client, target, plan, skip_unchanged=False,
+                  concurrency=OBJECT_SET_CONCURRENCY):
+    """
+    Write every object in the plan with a bounded thread pool. Returns the
+    number of objects that were left alone because they were unchanged.
+    """
+
+    def write(item):
+        key, source = item
+        return write_object(s3_client, dict(target, Key=key), source,
+                            skip_unchanged=skip_unchanged)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Consuming the results surfaces the first exception, if any
+        return sum(1 for written in pool.map(write, plan) if not written)
+
+
+def delete_keys(s3_client, bucket, keys):
+    "Delete keys in batches of up to 1000, raising if any of them fail"
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start:start + DELETE_BATCH_SIZE]
+        response = s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+        )
+        if response.get("Errors"):
+            error = response["Errors"][0]
+            raise Exception(f"Failed to delete {error['Key']}: {error['Message']}")
+
+
+def handle_object_set(s3_client, event):
+    """
+    Handle a Custom::S3ObjectSet event. Returns the physical resource id,
+    which is the location of the manifest, and the response data.
+    """
+    request = event["RequestType"]
+    properties = event["ResourceProperties"]
+    manifest_bucket, manifest_key = manifest_location(event)
+    physical_id = f"s3://{manifest_bucket}/{manifest_key}"
+    old_objects = {} if request == "Create" else \
+        read_manifest(s3_client, manifest_bucket, manifest_key)
+
+    if request == "Delete":
+        for bucket, keys in old_objects.items():
+            delete_keys(s3_client, bucket, keys)
+        delete_keys(s3_client, manifest_bucket, [manifest_key])
+        return physical_id, {"Count": sum(len(keys) for keys in old_objects.values())}
+
+    target = properties["Target"]
+    bucket = target["Bucket"]
+    params = {k: v for k, v in target.items() if k != "Prefix"}
+    plan = plan_objects(s3_client, properties)
+    keys = [key for key, _ in plan]
+
+    # Record the new keys with the old ones first, so that objects written
+    # before a failure are removed by the rollback or the delete
+    pending = {name: list(old_keys) for name, old_keys in old_objects.items()}
+    pending[bucket] = sorted(set(pending.get(bucket, [])) | set(keys))
+    write_manifest(s3_client, manifest_bucket, manifest_key, pending)
+
+    unchanged = write_objects(s3_client, params, plan,
+                              skip_unchanged=request == "Update")
+
+    # Remove objects that were part of the set before this update but aren't now
+    for old_bucket, old_keys in old_objects.items():
+        current = set(keys) if old_bucket == bucket else set()
+        delete_keys(s3_client, old_bucket, sorted(set(old_keys) - current))
+    write_manifest(s3_client, manifest_bucket, manifest_key, {bucket: keys})
+
+    return physical_id, {"Bucket": bucket, "Prefix": target.get("Prefix", ""),
+                         "Count": len(keys), "Unchanged": unchanged,
+                         "Manifest": manifest_key}
@@ -1,33 +1,45 @@
 "S3Object macro custom resource lambda handler"
 
-import base64
-import json
-import urllib
 import boto3
+from botocore.config import Config
 from custom_response import send, FAILED, SUCCESS
+from macro_logging import get_logger, log_payload
+from object_set import OBJECT_SET_CONCURRENCY, handle_object_set
+from upload import write_object
 
-s3_client = boto3.client("s3")
+logger = get_logger(__name__)
+
+# Enough connections for every object set worker to have one of its own
+s3_client = boto3.client(
+    "s3", config=Config(max_pool_connections=max(OBJECT_SET_CONCURRENCY, 10))
+)
 
 def handler(event, context):
     "Lambda handler"
     try:
         return handle_event(event, context)
     except Exception as e:
-        print(str(e))
-        return send(event, context, FAILED, {}, str(e))
+        logger.error("%s", e)
+        # Keep the physical id, so that a rollback or delete finds the resource
+        return send(event, context, FAILED, {}, event.get("PhysicalResourceId"), reason=str(e))
 
 def handle_event(event, context):
     "Handle the event from CloudFormation"
 
-    print("Received request:", json.dumps(event, indent=4))
+    log_payload(logger, "Received request", event)
 
     request = event["RequestType"]
     properties = event["ResourceProperties"]
 
+    if event["ResourceType"] == "Custom::S3ObjectSet":
+        physical_id, data = handle_object_set(s3_client, event)
+        return send(event, context, SUCCESS, data, physical_id, reason=f"{request} complete")
+
     if "Target" not in properties or all(
         prop not in properties for prop in ["Body", "URL", "Base64Body", "Source"]
     ):
-        return send(event, context, FAILED, {}, "Missing required parameters")
+        return send(event, context, FAILED, {}, event.get("PhysicalResourceId"),
+                    reason="Missing required parameters")
 
     target = properties["Target"]
 
@@ -37,52 +49,18 @@ def handle_event(event, context):
     }
 
     if request in ("Create", "Update"):
-        if "Body" in properties:
-            target.update(
-                {
-                    "Body": properties["Body"],
-                }
-            )
-
-            s3_client.put_object(**target)
-
-        elif "URL" in properties:
-            with urllib.request.urlopen(properties["URL"]) as f:
-                content = f.read().decode("utf-8")
-
-            target.update(
-                {
-                    "Body": content,
-                }
-            )
-
-            s3_client.put_object(**target)
-
-        elif "Base64Body" in properties:
-            try:
-                body = base64.b64decode(properties["Base64Body"])
-            except Exception:
-                return send(event, context, FAILED, {}, "Malformed Base64Body")
-
-            target.update({"Body": body})
-
-            s3_client.put_object(**target)
-
-        elif "Source" in properties:
-            source = properties["Source"]
-
-            s3_client.copy_object(
-                CopySource=source,
-                Bucket=target["Bucket"],
-                Key=target["Key"],
-                MetadataDirective="COPY",
-                TaggingDirective="COPY",
-            )
-
-        else:
-            return send(event, context, FAILED, {}, "Malformed body")
-
-        return send(event, context, SUCCESS, data, "Created")
+        try:
+            written = write_object(s3_client, target, properties,
+                                   skip_unchanged=request == "Update")
+        except ValueError as e:
+            return send(event, context, FAILED, {}, event.get("PhysicalResourceId"),
+                        reason=str(e))
+
+        # The physical id must not change on Update, or CloudFormation would
+        # treat it as a replacement and delete the object with the old id
+        data["Unchanged"] = "false" if written else "true"
+        return send(event, context, SUCCESS, data, event.get("PhysicalResourceId", "Created"),
+                    reason=f"{request} complete" if written else "Content unchanged")
 
     if request == "Delete":
         s3_client.delete_object(
@@ -92,4 +70,5 @@ def handle_event(event, context):
 
         return send(event, context, SUCCESS, data, "Deleted")
 
-    return send(event, context, FAILED, {}, f"Unexpected: {request}")
+    return send(event, context, FAILED, {}, event.get("PhysicalResourceId"),
+                reason=f"Unexpected: {request}")
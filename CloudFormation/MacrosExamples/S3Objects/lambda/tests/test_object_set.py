@@ -0,0 +1,125 @@
+"""Tests for the manifest handling in the object_set.py module."""
+
+import io
+import json
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import object_set  # noqa: E402
+
+
+class NoSuchKey(Exception):
+    "Raised for objects that don't exist"
+
+
+class NotFound(Exception):
+    "Raised by head_object for objects that don't exist"
+    response = {"Error": {"Code": "404"}}
+
+
+class FakeS3:
+    "Keeps objects in memory, and fails to write the keys in fail"
+
+    exceptions = SimpleNamespace(NoSuchKey=NoSuchKey, ClientError=NotFound)
+
+    def __init__(self, fail=()):
+        self.objects = {}
+        self.fail = set(fail)
+        self.lock = threading.Lock()
+
+    def get_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        "Return an object's body"
+        if (Bucket, Key) not in self.objects:
+            raise NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)].encode())}
+
+    def head_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        "Return no metadata, so that every object is written again"
+        if (Bucket, Key) not in self.objects:
+            raise NotFound(Key)
+        return {}
+
+    def put_object(self, Bucket, Key, Body, **_):  # pylint: disable=invalid-name
+        "Store an object, unless it is one that fails"
+        if Key in self.fail:
+            raise RuntimeError(f"Failed to write {Key}")
+        with self.lock:
+            self.objects[(Bucket, Key)] = Body
+
+    def delete_objects(self, Bucket, Delete):  # pylint: disable=invalid-name
+        "Remove objects"
+        with self.lock:
+            for item in Delete["Objects"]:
+                self.objects.pop((Bucket, item["Key"]), None)
+        return {}
+
+    def keys(self, bucket):
+        "Return the keys in a bucket, other than manifests"
+        return sorted(
+            key for name, key in self.objects if name == bucket and ".manifest/" not in key
+        )
+
+
+def event(request, bucket, objects, physical_id=None):
+    "Build an event for an object set with Body objects"
+    return {
+        "RequestType": request,
+        "LogicalResourceId": "Set",
+        "PhysicalResourceId": physical_id,
+        "ResourceProperties": {
+            "Target": {"Bucket": bucket},
+            "Objects": {key: {"Body": key} for key in objects},
+        },
+    }
+
+
+def test_changing_the_bucket_removes_the_objects_from_the_old_bucket():
+    s3 = FakeS3()
+    s3.objects[("new", "a")] = "someone else's"
+    physical_id, _ = object_set.handle_object_set(s3, event("Create", "old", ["a", "b"]))
+
+    object_set.handle_object_set(s3, event("Update", "new", ["b"], physical_id))
+
+    assert s3.keys("old") == []
+    assert s3.keys("new") == ["a", "b"]
+    assert s3.objects[("new", "a")] == "someone else's"
+
+    object_set.handle_object_set(s3, event("Delete", "new", ["b"], physical_id))
+
+    assert s3.keys("new") == ["a"]
+    assert [key for name, key in s3.objects if name == "old"] == []
+
+
+def test_objects_written_before_a_failure_are_removed_on_delete():
+    s3 = FakeS3(fail=["c"])
+
+    with pytest.raises(RuntimeError):
+        object_set.handle_object_set(s3, event("Create", "bucket", ["a", "b", "c"]))
+    assert s3.keys("bucket") == ["a", "b"]
+
+    # A failed create has no physical id, so the manifest is found from the properties
+    object_set.handle_object_set(s3, event("Delete", "bucket", ["a", "b", "c"], "log-stream"))
+
+    assert not s3.objects
+
+
+def test_objects_written_before_a_failed_update_are_removed_on_rollback():
+    s3 = FakeS3()
+    physical_id, _ = object_set.handle_object_set(s3, event("Create", "bucket", ["a"]))
+    s3.fail = {"c"}
+
+    with pytest.raises(RuntimeError):
+        object_set.handle_object_set(s3, event("Update", "bucket", ["a", "b", "c"], physical_id))
+    s3.fail = set()
+    object_set.handle_object_set(s3, event("Update", "bucket", ["a"], physical_id))
+
+    assert s3.keys("bucket") == ["a"]
+    manifest = json.loads(s3.objects[("bucket", ".manifest/Set.json")])
+    assert manifest == {"Buckets": {"bucket": ["a"]}}
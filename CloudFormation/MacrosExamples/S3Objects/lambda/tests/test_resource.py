@@ -0,0 +1,92 @@
+"""Tests for the physical ids reported by the resource.py module."""
+
+import os
+import sys
+from types import SimpleNamespace
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import resource  # noqa: E402
+
+
+class NotFound(Exception):
+    "Raised by head_object for objects that don't exist"
+    response = {"Error": {"Code": "404"}}
+
+
+class FakeS3:
+    "Keeps objects and their metadata in memory"
+
+    exceptions = SimpleNamespace(ClientError=NotFound)
+
+    def __init__(self):
+        self.objects = {}
+
+    def head_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        "Return an object's metadata"
+        if (Bucket, Key) not in self.objects:
+            raise NotFound(Key)
+        return {"Metadata": self.objects[(Bucket, Key)][1]}
+
+    def put_object(self, Bucket, Key, Body, Metadata=None, **_):  # pylint: disable=invalid-name
+        "Store an object"
+        self.objects[(Bucket, Key)] = (Body, Metadata or {})
+
+    def delete_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        "Remove an object"
+        self.objects.pop((Bucket, Key), None)
+
+
+def deploy(monkeypatch, s3, request, body, physical_id=None):
+    """
+    Send a request as CloudFormation would, and the Delete of the old
+    physical id that follows an Update that changes it. Returns the
+    responses sent.
+    """
+    responses = []
+    monkeypatch.setattr(resource, "s3_client", s3)
+    monkeypatch.setattr(
+        resource, "send",
+        lambda event, context, status, data, physical_resource_id=None, reason=None:
+        responses.append((status, data, physical_resource_id, reason)),
+    )
+    event = {
+        "RequestType": request,
+        "ResourceType": "Custom::S3Object",
+        "ResourceProperties": {"Target": {"Bucket": "bucket", "Key": "key"}, "Body": body},
+    }
+    if physical_id:
+        event["PhysicalResourceId"] = physical_id
+    resource.handler(event, None)
+    if request == "Update" and responses[-1][2] != physical_id:
+        resource.handler(dict(event, RequestType="Delete"), None)
+    return responses
+
+
+def test_unchanged_updates_keep_the_physical_id_and_the_object(monkeypatch):
+    s3 = FakeS3()
+    physical_id = deploy(monkeypatch, s3, "Create", "content")[0][2]
+
+    responses = deploy(monkeypatch, s3, "Update", "content", physical_id)
+    assert [(status, data["Unchanged"], new_id) for status, data, new_id, _ in responses] == [
+        ("SUCCESS", "true", physical_id)
+    ]
+    responses = deploy(monkeypatch, s3, "Update", "changed", physical_id)
+    assert [(status, data["Unchanged"], new_id) for status, data, new_id, _ in responses] == [
+        ("SUCCESS", "false", physical_id)
+    ]
+    assert s3.objects[("bucket", "key")][0] == "changed"
+
+
+def test_failures_keep_the_physical_id_and_report_the_reason(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(resource, "write_object", lambda *_, **__: (_ for _ in ()).throw(
+        ValueError("Malformed Base64Body")))
+
+    responses = deploy(monkeypatch, s3, "Update", "content", "Created")
+
+    assert [(status, physical_id, reason) for status, _, physical_id, reason in responses] == [
+        ("FAILED", "Created", "Malformed Base64Body")
+    ]
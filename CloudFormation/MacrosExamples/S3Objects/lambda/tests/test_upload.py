@@ -0,0 +1,120 @@
+"""Tests for the streaming uploads in the upload.py module."""
+
+import base64
+import io
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import upload  # noqa: E402
+
+TARGET = {"Bucket": "bucket", "Key": "key"}
+
+
+class FakeS3:
+    "Records the uploads it receives and how many parts were in flight at once"
+
+    def __init__(self, fail_part=None):
+        self.fail_part = fail_part
+        self.calls = []
+        self.parts = {}
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.lock = threading.Lock()
+
+    def put_object(self, Body, **_):  # pylint: disable=invalid-name
+        "Record a single upload"
+        self.calls.append(("put_object", len(Body)))
+
+    def create_multipart_upload(self, **_):
+        "Start a multipart upload"
+        self.calls.append(("create_multipart_upload",))
+        return {"UploadId": "upload"}
+
+    def upload_part(self, PartNumber, Body, **_):  # pylint: disable=invalid-name
+        "Keep a part, after a pause so that others can start meanwhile"
+        with self.lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        if PartNumber == self.fail_part:
+            raise IOError("Connection reset")
+        self.parts[PartNumber] = Body
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, MultipartUpload, **_):  # pylint: disable=invalid-name
+        "Record the parts the upload was completed with"
+        self.calls.append(("complete_multipart_upload", MultipartUpload["Parts"]))
+
+    def abort_multipart_upload(self, **_):
+        "Record that the upload was abandoned"
+        self.calls.append(("abort_multipart_upload",))
+
+
+@pytest.mark.parametrize(
+    "size, part_sizes", [(9, None), (10, [10]), (25, [10, 10, 5]), (30, [10, 10, 10])]
+)
+def test_content_is_split_into_parts_on_part_boundaries(size, part_sizes):
+    s3 = FakeS3()
+    content = bytes(range(size))
+
+    upload.stream_to_s3(s3, TARGET, io.BytesIO(content), part_size=10)
+
+    if part_sizes is None:
+        assert s3.calls == [("put_object", size)]
+        return
+    assert [len(s3.parts[number]) for number in sorted(s3.parts)] == part_sizes
+    assert b"".join(s3.parts[number] for number in sorted(s3.parts)) == content
+    assert s3.calls[-1] == ("complete_multipart_upload", [
+        {"PartNumber": number, "ETag": f'"{number}"'} for number in range(1, len(part_sizes) + 1)
+    ])
+
+
+def test_parts_in_flight_are_bounded_by_the_concurrency():
+    s3 = FakeS3()
+
+    upload.stream_to_s3(s3, TARGET, io.BytesIO(bytes(200)), part_size=10, concurrency=3)
+
+    assert len(s3.parts) == 20
+    assert 1 < s3.most_in_flight <= 3
+
+
+def test_failed_parts_abort_the_upload():
+    s3 = FakeS3(fail_part=2)
+
+    with pytest.raises(IOError):
+        upload.stream_to_s3(s3, TARGET, io.BytesIO(bytes(50)), part_size=10, concurrency=2)
+
+    assert s3.calls[-1] == ("abort_multipart_upload",)
+    assert "complete_multipart_upload" not in [call[0] for call in s3.calls]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5, 7, 64, 1000])
+@pytest.mark.parametrize(
+    "text",
+    [
+        base64.b64encode(bytes(range(256)) * 3).decode(),
+        # Wrapped at 76 characters, as by base64 and openssl
+        base64.encodebytes(bytes(range(256)) * 3).decode(),
+        " " + base64.encodebytes(b"odd length content").decode().replace("\n", "\r\n\t"),
+    ],
+)
+def test_base64_is_decoded_across_read_boundaries(text, size):
+    reader = upload.Base64Reader(text)
+
+    decoded = b"".join(iter(lambda: reader.read(size), b""))
+
+    assert decoded == base64.b64decode(text)
+
+
+def test_malformed_base64_is_rejected():
+    with pytest.raises(ValueError, match="Malformed Base64Body"):
+        upload.read_part(upload.Base64Reader("QUJDR"), 100)
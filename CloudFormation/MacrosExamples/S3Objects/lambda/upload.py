@@ -0,0 +1,215 @@
+"""
+Streaming uploads to S3 for the S3Objects custom resource.
+
+Content is read from a file-like source in parts and sent with a multipart
+upload, with a bounded number of parts in flight, so memory use depends on
+the part size and concurrency rather than on the size of the object.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# S3 requires every part except the last to be at least 5 MiB
+PART_SIZE = max(int(os.environ.get("PART_SIZE_MB", "8")), 5) * 1024 * 1024
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))
+
+# User metadata that records the digest of what was written to an object
+DIGEST_METADATA = "cfn-content-sha256"
+
+NON_BASE64_RE = re.compile(r"[^A-Za-z0-9+/=]")
+
+
+class Base64Reader:
+    "File-like reader that decodes a base64 string a slice at a time"
+
+    def __init__(self, text):
+        self.text = text
+        self.position = 0
+
+    def read(self, size=-1):
+        "Return up to size decoded bytes"
+        # Four base64 characters decode to three bytes
+        wanted = len(self.text) if size is None or size < 0 else max(size // 3, 1) * 4
+        chunk = self.text[self.position:self.position + wanted]
+        self.position += len(chunk)
+        try:
+            return base64.b64decode(chunk, validate=True)
+        except binascii.Error:
+            pass
+
+        # Skip characters outside the alphabet, such as line breaks, as
+        # b64decode does without validate, and read on to keep slices aligned
+        chunk = NON_BASE64_RE.sub("", chunk)
+        while len(chunk) < wanted and self.position < len(self.text):
+            more = self.text[self.position:self.position + wanted - len(chunk)]
+            self.position += len(more)
+            chunk += NON_BASE64_RE.sub("", more)
+        try:
+            return base64.b64decode(chunk)
+        except binascii.Error as e:
+            raise ValueError("Malformed Base64Body") from e
+
+
+def read_part(reader, size):
+    "Read exactly size bytes, or fewer at the end of the stream"
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = reader.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def stream_to_s3(s3_client, target, reader,
+                 part_size=PART_SIZE, concurrency=UPLOAD_CONCURRENCY):
+    """
+    Upload everything read from reader to the object described by target
+    (Bucket, Key and any other put_object parameters except Body).
+
+    Content that fits in one part is sent with a single put_object.
+    Anything larger uses a multipart upload with up to concurrency parts
+    uploading at once, which is aborted if anything fails.
+    """
+    part = read_part(reader, part_size)
+    if len(part) < part_size:
+        return s3_client.put_object(Body=part, **target)
+
+    upload_id = s3_client.create_multipart_upload(**target)["UploadId"]
+    bucket, key = target["Bucket"], target["Key"]
+
+    def upload_part(number, body):
+        response = s3_client.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    parts = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            in_flight = set()
+            number = 1
+            while part:
+                if len(in_flight) >= concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    parts.extend(future.result() for future in done)
+                in_flight.add(pool.submit(upload_part, number, part))
+                # Drop the reference so the part can be freed once uploaded
+                part = None
+                part = read_part(reader, part_size)
+                number += 1
+            parts.extend(future.result() for future in wait(in_flight).done)
+    except BaseException:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+    parts.sort(key=lambda p: p["PartNumber"])
+    return s3_client.complete_multipart_upload(
+        Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+    )
+
+
+def content_digest(target, source):
+    """
+    Return a hex SHA-256 digest of the content that source would write and
+    of the other put_object parameters in target, or None if the content
+    can't be known without fetching it.
+    """
+    digest = hashlib.sha256()
+    params = {k: v for k, v in target.items() if k not in ("Bucket", "Key")}
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    digest.update(b"\0")
+
+    if "Body" in source:
+        digest.update(source["Body"].encode())
+    elif "Base64Body" in source:
+        reader = Base64Reader(source["Base64Body"])
+        for chunk in iter(lambda: reader.read(1024 * 1024), b""):
+            digest.update(chunk)
+    else:
+        return None
+
+    return digest.hexdigest()
+
+
+def head(s3_client, bucket, key):
+    "Return the head_object response for an object, or None if it doesn't exist"
+    try:
+        return s3_client.head_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+
+def is_unchanged(s3_client, target, source, digest):
+    """
+    Return True if the object described by target already holds what source
+    would write: the same content digest in its metadata or, for a copy, the
+    same ETag as the source object.
+    """
+    if "Source" in source:
+        copied = head(s3_client, source["Source"]["Bucket"], source["Source"]["Key"])
+        existing = head(s3_client, target["Bucket"], target["Key"])
+        return copied is not None and existing is not None and \
+            copied["ETag"] == existing["ETag"]
+
+    if digest is None:
+        return False
+    existing = head(s3_client, target["Bucket"], target["Key"])
+    return existing is not None and \
+        existing.get("Metadata", {}).get(DIGEST_METADATA) == digest
+
+
+def write_object(s3_client, target, source, skip_unchanged=False):
+    """
+    Create the object described by target from a source, a dict with one of
+    Body, URL, Base64Body or Source (a bucket and key to copy from).
+
+    Content that can be hashed up front is stored with its digest in the
+    object metadata. With skip_unchanged, the object is left alone if it
+    already holds the same content. Returns False if the write was skipped.
+
+    Raises ValueError if the source is malformed.
+    """
+    if all(prop not in source for prop in ("Body", "URL", "Base64Body", "Source")):
+        raise ValueError("Malformed body")
+
+    digest = content_digest(target, source)
+    if skip_unchanged and is_unchanged(s3_client, target, source, digest):
+        return False
+
+    if digest is not None:
+        metadata = dict(target.get("Metadata", {}), **{DIGEST_METADATA: digest})
+        target = dict(target, Metadata=metadata)
+
+    if "Body" in source:
+        s3_client.put_object(Body=source["Body"], **target)
+
+    elif "URL" in source:
+        # Stream the response straight into S3, so binary content is kept
+        # intact and the object size isn't limited by the function's memory
+        with urllib.request.urlopen(source["URL"]) as f:
+            stream_to_s3(s3_client, target, f)
+
+    elif "Base64Body" in source:
+        stream_to_s3(s3_client, target, Base64Reader(source["Base64Body"]))
+
+    else:
+        s3_client.copy_object(
+            CopySource=source["Source"],
+            Bucket=target["Bucket"],
+            Key=target["Key"],
+            MetadataDirective="COPY",
+            TaggingDirective="COPY",
+        )
+
+    return True
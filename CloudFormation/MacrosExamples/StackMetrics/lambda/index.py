@@ -1,10 +1,104 @@
 "Macro handler"
 
+import json
+from json.encoder import ESCAPE_ASCII, encode_basestring_ascii
+
+
+def json_size(value):
+    "Return the length of a scalar value in compact JSON"
+    if isinstance(value, str):
+        # Most strings need no escaping, so avoid encoding them
+        if ESCAPE_ASCII.search(value) is None:
+            return len(value) + 2
+        return len(encode_basestring_ascii(value))
+    if value is True or value is None:
+        return 4
+    if value is False:
+        return 5
+    if isinstance(value, int):
+        return len(str(value))
+    return len(json.dumps(value))
+
+
+def intrinsic_name(key):
+    """
+    Return the name to count an intrinsic function under. The metrics are
+    passed in resource properties, where keys such as Ref and Fn::Sub would
+    be resolved as intrinsic functions, so they are renamed to Reference and
+    Sub.
+    """
+    return "Reference" if key == "Ref" else key[len("Fn::"):]
+
+
+def template_metrics(template):
+    """
+    Walk the template once and return a compact summary of its complexity:
+    resource counts by type, intrinsic function usage, nesting depth,
+    compact JSON size and parameter and output counts.
+
+    The walk uses an explicit stack rather than recursion, and sizes are
+    added up as it goes rather than by serialising the template.
+    """
+    resources = template.get("Resources", {})
+    types = {}
+    for resource in resources.values():
+        resource_type = resource.get("Type", "") if isinstance(resource, dict) else ""
+        types[resource_type] = types.get(resource_type, 0) + 1
+
+    intrinsics = {}
+    # Keys repeat a lot, so remember their sizes
+    key_sizes = {}
+    size = 0
+    max_depth = 0
+    stack = [(template, 1)]
+
+    while stack:
+        value, depth = stack.pop()
+        max_depth = max(max_depth, depth)
+
+        if isinstance(value, dict):
+            # Braces, plus a colon per entry and commas between entries
+            size += 1 + 2 * len(value) if value else 2
+            for key in value:
+                key_size = key_sizes.get(key)
+                if key_size is None:
+                    key_size = key_sizes[key] = json_size(key)
+                size += key_size
+            if len(value) == 1:
+                # Intrinsic functions are always the only key in their mapping
+                key = next(iter(value))
+                if key == "Ref" or key.startswith("Fn::"):
+                    name = intrinsic_name(key)
+                    intrinsics[name] = intrinsics.get(name, 0) + 1
+            children = value.values()
+        else:
+            size += 1 + len(value) if value else 2
+            children = value
+
+        for child in children:
+            if isinstance(child, (dict, list)):
+                stack.append((child, depth + 1))
+            else:
+                size += json_size(child)
+
+    return {
+        "ResourceCount": len(resources),
+        "ResourceTypes": types,
+        "Intrinsics": intrinsics,
+        "MaxDepth": max_depth,
+        "TemplateBytes": size,
+        "ParameterCount": len(template.get("Parameters", {})),
+        "OutputCount": len(template.get("Outputs", {})),
+    }
+
+
 def handler(event, _):
     "Process the template fragment"
 
     template = event["fragment"]
 
+    metrics = template_metrics(template)
+
     template["Resources"]["StackMetrics"] = {
         "Type": "Custom::StackMetrics",
         "Properties": {
@@ -14,7 +108,8 @@ def handler(event, _):
             "StackName": {
                 "Ref": "AWS::StackName",
             },
-            "ResourceCount": len(template["Resources"].keys()),
+            "ResourceCount": metrics["ResourceCount"],
+            "TemplateMetrics": metrics,
             "ServiceTimeout": 120
         },
     }
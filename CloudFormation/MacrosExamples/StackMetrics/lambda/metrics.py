@@ -0,0 +1,97 @@
+"""
+Buffered CloudWatch metrics for the StackMetrics resource handler.
+
+Datums are collected for the whole invocation and then either sent with as
+few put_metric_data calls as possible or, in "emf" mode, written to the log
+in CloudWatch Embedded Metric Format so that no API calls are made at all.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+# "api" sends datums with put_metric_data, "emf" writes them to the log
+METRICS_MODE = os.environ.get("METRICS_MODE", "api").lower()
+
+NAMESPACE = "CloudFormation"
+
+# put_metric_data accepts at most this many datums per call
+MAX_DATUMS_PER_CALL = 1000
+
+
+class MetricsBuffer:
+    "Collects metric datums that share a namespace and timestamp"
+
+    def __init__(self, namespace=NAMESPACE, timestamp=None):
+        self.namespace = namespace
+        self.timestamp = timestamp or datetime.now(timezone.utc)
+        self.datums = []
+
+    def add(self, metric, value, unit="Count", dimensions=None):
+        "Add a datum, with dimensions given as a dict of name to value"
+        self.datums.append((metric, value, unit, tuple(sorted((dimensions or {}).items()))))
+
+    def flush(self, client=None, mode=None):
+        """
+        Publish and clear the buffered datums. Returns the number of
+        put_metric_data calls made.
+        """
+        datums, self.datums = self.datums, []
+        if (mode or METRICS_MODE) == "emf":
+            for record in self.emf_records(datums):
+                print(json.dumps(record, separators=(",", ":")))
+            return 0
+
+        metric_data = [
+            {
+                "MetricName": metric,
+                "Unit": unit,
+                "Value": value,
+                "Timestamp": self.timestamp,
+                **({"Dimensions": [{"Name": name, "Value": dim_value}
+                                   for name, dim_value in dimensions]}
+                   if dimensions else {}),
+            }
+            for metric, value, unit, dimensions in datums
+        ]
+
+        calls = 0
+        for start in range(0, len(metric_data), MAX_DATUMS_PER_CALL):
+            client.put_metric_data(
+                Namespace=self.namespace,
+                MetricData=metric_data[start:start + MAX_DATUMS_PER_CALL],
+            )
+            calls += 1
+        return calls
+
+    def emf_records(self, datums):
+        """
+        Return Embedded Metric Format records for the datums, one for each
+        set of dimension values.
+        """
+        groups = {}
+        for metric, value, unit, dimensions in datums:
+            metrics, values = groups.setdefault(dimensions, ({}, {}))
+            metrics[metric] = unit
+            values.setdefault(metric, []).append(value)
+
+        timestamp = int(self.timestamp.timestamp() * 1000)
+        records = []
+        for dimensions, (metrics, values) in groups.items():
+            record = {
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [[name for name, _ in dimensions]],
+                        "Metrics": [{"Name": name, "Unit": unit} for name, unit in metrics.items()],
+                    }],
+                },
+            }
+            record.update(dict(dimensions))
+            record.update({
+                name: metric_values[0] if len(metric_values) == 1 else metric_values
+                for name, metric_values in values.items()
+            })
+            records.append(record)
+        return records
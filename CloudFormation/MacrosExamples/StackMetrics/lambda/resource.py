@@ -1,61 +1,65 @@
 "StackMetrics lambda handler"
 
-from datetime import datetime
-import json
 import boto3
 
 from custom_response import SUCCESS, FAILED, send
+from macro_logging import get_logger, log_payload
+from metrics import METRICS_MODE, MetricsBuffer
 
-client = boto3.client("cloudwatch")
-
-def log(stack, metric, value):
-    "Put metrics into CloudWatch"
-
-    client.put_metric_data(
-        Namespace="CloudFormation",
-        MetricData=[
-            {
-                "MetricName": metric,
-                "Unit": "Count",
-                "Value": value,
-                "Timestamp": datetime.now(),
-                "Dimensions": [
-                    {
-                        "Name": "By Stack Name",
-                        "Value": stack,
-                    },
-                ],
-            },
-        ],
-    )
-
-    client.put_metric_data(
-        Namespace="CloudFormation",
-        MetricData=[
-            {
-                "MetricName": metric,
-                "Unit": "Count",
-                "Value": value,
-                "Timestamp": datetime.now(),
-            },
-        ],
-    )
+logger = get_logger(__name__)
+
+# Embedded Metric Format output doesn't call the CloudWatch API at all
+client = boto3.client("cloudwatch") if METRICS_MODE != "emf" else None
+
+def log(metrics, stack, metric, value, unit="Count"):
+    "Add a metric for the stack and for all stacks to the buffer"
+
+    metrics.add(metric, value, unit, dimensions={"By Stack Name": stack})
+    metrics.add(metric, value, unit)
+
+def log_template(metrics, stack, template, created):
+    """
+    Add the template complexity metrics computed by the macro. Counts by
+    resource type are only added when the stack is created, like
+    ResourceCount.
+    """
+
+    # CloudFormation passes numbers in resource properties as strings
+    log(metrics, stack, "TemplateBytes", int(template["TemplateBytes"]), "Bytes")
+    for name in ("MaxDepth", "ParameterCount", "OutputCount"):
+        log(metrics, stack, name, int(template[name]))
+    log(metrics, stack, "IntrinsicCount",
+        sum(int(count) for count in template["Intrinsics"].values()))
+
+    if created:
+        for resource_type, count in template["ResourceTypes"].items():
+            metrics.add("ResourceCount", int(count),
+                        dimensions={"By Resource Type": resource_type})
 
 def handler(event, context):
     "Lambda handler"
 
-    print("Received request:", json.dumps(event, indent=4))
+    log_payload(logger, "Received request", event)
 
     action = event["RequestType"]
 
     stack = event["ResourceProperties"]["StackName"]
     resources = int(event["ResourceProperties"]["ResourceCount"])
 
+    metrics = MetricsBuffer()
+
     try:
-        log(stack, action, 1)
+        log(metrics, stack, action, 1)
 
         if action == "Create":
-            log(stack, "ResourceCount", resources)
+            log(metrics, stack, "ResourceCount", resources)
+
+        # Stacks using an older version of the macro don't have these
+        if action != "Delete" and "TemplateMetrics" in event["ResourceProperties"]:
+            log_template(metrics, stack, event["ResourceProperties"]["TemplateMetrics"],
+                         action == "Create")
+
+        metrics.flush(client)
 
         send(event, context, SUCCESS, {}, f"{stack} metrics")
     except Exception as e:
@@ -0,0 +1,44 @@
+"""Tests for the template metrics in the index.py module."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import index  # noqa: E402
+
+
+def keys(value):
+    "Yield every mapping key in a value"
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield key
+            yield from keys(child)
+    elif isinstance(value, list):
+        for child in value:
+            yield from keys(child)
+
+
+def test_emitted_properties_contain_no_intrinsic_function_names():
+    template = {
+        "Resources": {
+            "Bucket": {
+                "Type": "AWS::S3::Bucket",
+                "Properties": {
+                    "BucketName": {"Fn::Sub": "${AWS::StackName}-bucket"},
+                    "Tags": [{"Key": "Stack", "Value": {"Ref": "AWS::StackName"}}],
+                },
+            },
+        },
+        "Outputs": {"Arn": {"Value": {"Fn::GetAtt": ["Bucket", "Arn"]}}},
+    }
+
+    result = index.handler({"requestId": "1", "fragment": template}, None)
+
+    properties = result["fragment"]["Resources"]["StackMetrics"]["Properties"]
+    assert properties["TemplateMetrics"]["Intrinsics"] == {"Sub": 1, "Reference": 1, "GetAtt": 1}
+    # ServiceToken and StackName are the only intrinsic functions the macro adds
+    added = ("ServiceToken", "StackName")
+    emitted = list(keys({k: v for k, v in properties.items() if k not in added}))
+    assert not [key for key in emitted if key == "Ref" or key.startswith("Fn::")]
@@ -6,6 +6,11 @@ import os
 import sys
 import json
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
 import cfnresponse
 import boto3
 from botocore.exceptions import ClientError
@@ -13,73 +18,153 @@ from botocore.exceptions import ClientError
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-session = boto3.session.Session()
 region = os.environ["AWS_REGION"]
-partition = session.get_partition_for_region(region)
-c = session.client("greengrass")
-iam = session.client("iam")
 role_name = f"greengrass_cfn_{os.environ['STACK_NAME']}_ServiceRole"
 
+# How many groups to look up at the same time when searching for a thing
+LOOKUP_CONCURRENCY = int(os.environ.get("LOOKUP_CONCURRENCY", "8"))
 
-def find_group(thingName):
-    "Find the group based on the name"
+# Thing name to group id, kept across warm invocations
+group_index = {}
 
-    response_auth = ""
+# Clients are created on first use, since most requests only need greengrass
+clients = {}
+clients_lock = threading.Lock()
 
-    response = c.list_groups()
-    for group in response["Groups"]:
-        thingfound = False
-        group_version = c.get_group_version(
-            GroupId=group["Id"], GroupVersionId=group["LatestVersion"]
-        )
 
-        core_arn = group_version["Definition"].get("CoreDefinitionVersionArn", "")
-        if core_arn:
-            core_id = core_arn[
-                core_arn.index("/cores/") + 7 : core_arn.index("/versions/")
-            ]
-            core_version_id = core_arn[
-                core_arn.index("/versions/") + 10 : len(core_arn)
-            ]
-            thingfound = False
-            response_core_version = c.get_core_definition_version(
-                CoreDefinitionId=core_id, CoreDefinitionVersionId=core_version_id
-            )
-            if "Cores" in response_core_version["Definition"]:
-                for thing_arn in response_core_version["Definition"]["Cores"]:
-                    if thingName == thing_arn["ThingArn"].split("/")[1]:
-                        thingfound = True
-                        break
-        if thingfound:
-            logger.info(f"found thing: {thingName}, group id is: {group['Id']}")
-            response_auth = group["Id"]
-            return response_auth
+@lru_cache(maxsize=None)
+def session():
+    "Return the boto3 session, created on first use"
+    return boto3.session.Session()
+
+
+def get_client(service):
+    "Return a client for the service, created on first use"
+    client = clients.get(service)
+    if client is None:
+        with clients_lock:
+            client = clients.get(service)
+            if client is None:
+                client = clients[service] = session().client(service)
+    return client
+
+
+def core_things(group_id, group_version_id):
+    "Return the names of the core things in a version of a group"
+
+    group_version = get_client("greengrass").get_group_version(
+        GroupId=group_id, GroupVersionId=group_version_id
+    )
+
+    core_arn = group_version["Definition"].get("CoreDefinitionVersionArn", "")
+    if not core_arn:
+        return []
+    core_id = core_arn[core_arn.index("/cores/") + 7 : core_arn.index("/versions/")]
+    core_version_id = core_arn[core_arn.index("/versions/") + 10 : len(core_arn)]
+    response_core_version = get_client("greengrass").get_core_definition_version(
+        CoreDefinitionId=core_id, CoreDefinitionVersionId=core_version_id
+    )
+    return [
+        thing_arn["ThingArn"].split("/")[1]
+        for thing_arn in response_core_version["Definition"].get("Cores", [])
+    ]
+
 
+def group_things(group):
+    "Return the core things of the latest version of a group"
+
+    if not group.get("LatestVersion"):
+        return []
+    return core_things(group["Id"], group["LatestVersion"])
+
+
+def indexed_group(thingName):
+    "Return the indexed group of a thing if it is still the group of the thing"
+
+    group_id = group_index.get(thingName)
+    if not group_id:
+        return ""
+    try:
+        group = get_client("greengrass").get_group(GroupId=group_id)
+        if group.get("LatestVersion") and thingName in core_things(
+            group_id, group["LatestVersion"]
+        ):
+            return group_id
+    except ClientError as e:
+        logger.info(f"Indexed group {group_id} is no longer available: {e}")
+    group_index.pop(thingName, None)
     return ""
 
 
+def find_group(thingName):
+    """
+    Find the group based on the name
+
+    Groups that were looked up by earlier invocations are indexed by their
+    core things, so that only a miss scans the groups. The scan goes through
+    every page of groups and looks up LOOKUP_CONCURRENCY of them at a time.
+    The lookups are checked in list order, so the scan stops at, and
+    returns, the first group that has the thing, as a scan of one group at a
+    time would.
+    """
+
+    group_id = indexed_group(thingName)
+    if group_id:
+        logger.info(f"found thing: {thingName} in index, group id is: {group_id}")
+        return group_id
+
+    groups = (
+        group
+        for page in get_client("greengrass").get_paginator("list_groups").paginate()
+        for group in page["Groups"]
+    )
+    scanned = {}
+    with ThreadPoolExecutor(max_workers=LOOKUP_CONCURRENCY) as executor:
+        lookups = deque()
+        while True:
+            for group in islice(groups, LOOKUP_CONCURRENCY - len(lookups)):
+                lookups.append((group["Id"], executor.submit(group_things, group)))
+            if not lookups:
+                break
+            lookup_id, future = lookups.popleft()
+            things = future.result()
+            # A thing in several groups is indexed by the first of them
+            for thing in things:
+                scanned.setdefault(thing, lookup_id)
+            if thingName in things:
+                group_id = lookup_id
+                break
+        for _, future in lookups:
+            future.cancel()
+    group_index.update(scanned)
+
+    if group_id:
+        logger.info(f"found thing: {thingName}, group id is: {group_id}")
+    return group_id
+
+
 def manage_greengrass_role(cmd):
     "Greengrass role"
 
     if cmd == "CREATE":
-        r = iam.create_role(
+        r = get_client("iam").create_role(
             RoleName=role_name,
             AssumeRolePolicyDocument='{"Version": "2012-10-17","Statement": [{"Effect": "Allow","Principal": {"Service": "greengrass.amazonaws.com"},"Action": "sts:AssumeRole"}]}',
             Description="Role for CloudFormation blog post",
         )
         role_arn = r["Role"]["Arn"]
-        iam.attach_role_policy(
+        get_client("iam").attach_role_policy(
             RoleName=role_name,
-            PolicyArn=f"arn:{partition}:iam::policy/service-role/AWSGreengrassResourceAccessRolePolicy",
+            PolicyArn=f"arn:{session().get_partition_for_region(region)}:iam::policy/service-role/AWSGreengrassResourceAccessRolePolicy",
         )
-        c.associate_service_role_to_account(RoleArn=role_arn)
+        get_client("greengrass").associate_service_role_to_account(RoleArn=role_arn)
         logger.info(f"Created and associated role {role_name}")
     else:
         try:
-            r = iam.get_role(RoleName=role_name)
+            r = get_client("iam").get_role(RoleName=role_name)
             role_arn = r["Role"]["Arn"]
-            c.disassociate_service_role_from_account()
-            iam.delete_role(RoleName=role_name)
+            get_client("greengrass").disassociate_service_role_from_account()
+            get_client("iam").delete_role(RoleName=role_name)
             logger.info(f"Disassociated and deleted role {role_name}")
         except ClientError:
             return
@@ -95,7 +180,7 @@ def handler(event, context):
         thingName = event["ResourceProperties"]["ThingName"]
         if event["RequestType"] == "Create":
             try:
-                c.get_service_role_for_account()
+                get_client("greengrass").get_service_role_for_account()
                 result = cfnresponse.SUCCESS
             except ClientError:
                 manage_greengrass_role("CREATE")
@@ -105,7 +190,7 @@ def handler(event, context):
             group_id = find_group(thingName)
             logger.info(f"Group id to delete: {group_id}")
             if group_id:
-                c.reset_deployments(Force=True, GroupId=group_id)
+                get_client("greengrass").reset_deployments(Force=True, GroupId=group_id)
                 result = cfnresponse.SUCCESS
                 logger.info("Forced reset of Greengrass deployment")
                 manage_greengrass_role("DELETE")
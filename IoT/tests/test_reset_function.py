@@ -0,0 +1,170 @@
+"""Tests for the group lookup in the reset_function.py module."""
+
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+from botocore.stub import Stubber
+
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("STACK_NAME", "test")
+
+# cfnresponse is only available to inline Lambda code deployed by CloudFormation
+sys.modules.setdefault(
+    "cfnresponse",
+    types.SimpleNamespace(SUCCESS="SUCCESS", FAILED="FAILED", send=None),
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import reset_function  # noqa: E402
+
+CORE_ARN = "arn:aws:greengrass:us-east-1:123456789012:/greengrass/definition/cores/{}/versions/v1"
+THING_ARN = "arn:aws:iot:us-east-1:123456789012:thing/{}"
+
+
+@pytest.fixture(name="stubber")
+def fixture_stubber(monkeypatch):
+    "Stub the greengrass client and start from an empty index"
+    monkeypatch.setattr(reset_function, "LOOKUP_CONCURRENCY", 1)
+    monkeypatch.setattr(reset_function, "group_index", {})
+    monkeypatch.setattr(reset_function, "clients", {})
+    with Stubber(reset_function.get_client("greengrass")) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def add_group_lookup(stubber, group_id, thing):
+    "Expect the version lookups of a group with one core thing"
+    thing_arn = THING_ARN.format(thing)
+    stubber.add_response(
+        "get_group_version",
+        {"Definition": {"CoreDefinitionVersionArn": CORE_ARN.format(f"core-{group_id}")}},
+        {"GroupId": group_id, "GroupVersionId": "v1"},
+    )
+    stubber.add_response(
+        "get_core_definition_version",
+        {"Definition": {"Cores": [{"Id": "1", "CertificateArn": "c", "ThingArn": thing_arn}]}},
+        {"CoreDefinitionId": f"core-{group_id}", "CoreDefinitionVersionId": "v1"},
+    )
+
+
+def test_groups_on_later_pages_are_found(stubber):
+    stubber.add_response(
+        "list_groups", {"Groups": [{"Id": "g1", "LatestVersion": "v1"}], "NextToken": "t"}, {}
+    )
+    add_group_lookup(stubber, "g1", "other")
+    stubber.add_response(
+        "list_groups", {"Groups": [{"Id": "g2", "LatestVersion": "v1"}]}, {"NextToken": "t"}
+    )
+    add_group_lookup(stubber, "g2", "thing")
+
+    assert reset_function.find_group("thing") == "g2"
+
+
+def test_scan_stops_at_the_first_match(stubber):
+    stubber.add_response(
+        "list_groups",
+        {
+            "Groups": [{"Id": "g1", "LatestVersion": "v1"}, {"Id": "g2", "LatestVersion": "v1"}],
+            "NextToken": "t",
+        },
+        {},
+    )
+    add_group_lookup(stubber, "g1", "thing")
+
+    # Neither g2 nor the next page is looked up
+    assert reset_function.find_group("thing") == "g1"
+
+
+def test_repeat_lookups_use_the_index(stubber):
+    stubber.add_response("list_groups", {"Groups": [{"Id": "g1", "LatestVersion": "v1"}]}, {})
+    add_group_lookup(stubber, "g1", "thing")
+    assert reset_function.find_group("thing") == "g1"
+
+    # The indexed group is checked rather than scanning the groups again
+    stubber.add_response("get_group", {"Id": "g1", "LatestVersion": "v1"}, {"GroupId": "g1"})
+    add_group_lookup(stubber, "g1", "thing")
+    assert reset_function.find_group("thing") == "g1"
+
+
+def test_stale_index_entries_fall_back_to_a_scan(stubber):
+    reset_function.group_index["thing"] = "gone"
+    stubber.add_client_error(
+        "get_group", "IdNotFoundException", expected_params={"GroupId": "gone"}
+    )
+    stubber.add_response("list_groups", {"Groups": [{"Id": "g2", "LatestVersion": "v1"}]}, {})
+    add_group_lookup(stubber, "g2", "thing")
+
+    assert reset_function.find_group("thing") == "g2"
+
+
+class SlowGreengrass:
+    "Answers lookups slowly and records how many run at the same time"
+
+    def __init__(self, groups, thing_groups, delays=None):
+        self.groups = groups
+        self.thing_groups = thing_groups
+        self.delays = delays or {}
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.lookups = 0
+
+    def get_paginator(self, _):
+        "Return all of the groups on one page"
+        return types.SimpleNamespace(paginate=lambda: [{"Groups": self.groups}])
+
+    def get_group_version(self, GroupId, GroupVersionId):  # pylint: disable=invalid-name,unused-argument
+        "Return a group version whose core definition is named after the group"
+        with self.lock:
+            self.running += 1
+            self.lookups += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delays.get(GroupId, 0.01))
+        with self.lock:
+            self.running -= 1
+        return {"Definition": {"CoreDefinitionVersionArn": CORE_ARN.format(GroupId)}}
+
+    def get_core_definition_version(self, CoreDefinitionId, CoreDefinitionVersionId):  # pylint: disable=invalid-name,unused-argument
+        "Return the core thing of the group"
+        thing = "thing" if CoreDefinitionId in self.thing_groups else f"core-{CoreDefinitionId}"
+        return {"Definition": {"Cores": [{"ThingArn": THING_ARN.format(thing)}]}}
+
+
+def test_lookups_run_concurrently_and_stop_early(monkeypatch):
+    groups = [{"Id": f"g{i}", "LatestVersion": "v1"} for i in range(1000)]
+    client = SlowGreengrass(groups, {"g99"})
+    monkeypatch.setattr(reset_function, "clients", {"greengrass": client})
+    monkeypatch.setattr(reset_function, "LOOKUP_CONCURRENCY", 8)
+    monkeypatch.setattr(reset_function, "group_index", {})
+
+    assert reset_function.find_group("thing") == "g99"
+
+    assert client.max_running == 8
+    assert client.lookups < 100 + 8
+
+
+def test_the_first_of_several_matching_groups_is_found(monkeypatch):
+    groups = [{"Id": f"g{i}", "LatestVersion": "v1"} for i in range(4)]
+    # g2 also has the thing, and its lookup finishes last
+    client = SlowGreengrass(groups, {"g1", "g2"}, delays={"g2": 0.1})
+    monkeypatch.setattr(reset_function, "clients", {"greengrass": client})
+    monkeypatch.setattr(reset_function, "LOOKUP_CONCURRENCY", 4)
+    monkeypatch.setattr(reset_function, "group_index", {})
+
+    assert reset_function.find_group("thing") == "g1"
+    assert reset_function.group_index["thing"] == "g1"
+
+
+def test_clients_are_created_on_first_use_and_reused(monkeypatch):
+    monkeypatch.setattr(reset_function, "clients", {})
+
+    greengrass = reset_function.get_client("greengrass")
+
+    assert reset_function.get_client("greengrass") is greengrass
+    assert list(reset_function.clients) == ["greengrass"]
@@ -6,11 +6,17 @@ http://aws.amazon.com/agreement or other written agreement between Customer and
 Amazon Web Services, Inc. or Amazon Web Services EMEA SARL or both.
 """
 
+from __future__ import annotations
+
 import json
 import logging
 import os
+import re
+import time
+from typing import TYPE_CHECKING
 
 import boto3
+from botocore.exceptions import ClientError
 from crhelper import CfnResource
 
 # Setup Default Logger
@@ -18,8 +24,29 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.setLevel(os.environ.get("LOG_LEVEL", logging.ERROR))
 
-# Initialize the helper
-helper = CfnResource(json_logging=False, log_level="DEBUG", boto_level="CRITICAL")
+# Minutes between polls of the directory stage while it is created or deleted
+POLL_INTERVAL_MINUTES = 1
+
+# Seconds before the first directory stage check, doubling up to the maximum between later checks
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 240
+
+# Seconds to reuse a secret for, across warm invocations
+SECRET_CACHE_TTL = int(os.environ.get("SECRET_CACHE_TTL", "300"))
+
+# Directory stages that the directory doesn't recover from
+FAILED_STAGES = ("Failed", "Inoperable", "RestoreFailed")
+
+DIRECTORY_ID_PATTERN = re.compile(r"d-[0-9a-f]{10}")
+
+# Initialize the helper, without sleeping on delete since the log group is retained
+helper = CfnResource(
+    json_logging=False,
+    log_level="DEBUG",
+    boto_level="CRITICAL",
+    polling_interval=POLL_INTERVAL_MINUTES,
+    sleep_on_delete=0,
+)
 
 try:
     ds_client = boto3.client("ds")
@@ -27,6 +54,76 @@ try:
 except Exception as error:
     helper.init_failure(error)
 
+if TYPE_CHECKING:
+    from typing import Dict, Tuple, Union
+
+# Secret ID to expiry time and secret
+secret_cache: Dict[str, Tuple[float, dict]] = {}
+
+
+def get_secret(secret_id: str) -> dict:
+    """Get a secret from Secrets Manager, reusing it for SECRET_CACHE_TTL seconds.
+
+    Args:
+        secret_id: Secret ID
+
+    Returns:
+        Secret
+    """
+    now = time.monotonic()
+    cached = secret_cache.get(secret_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    response = secretsmanager_client.get_secret_value(SecretId=secret_id)
+    secret = json.loads(response["SecretString"])
+    secret_cache[secret_id] = (now + SECRET_CACHE_TTL, secret)
+    return secret
+
+
+def get_directory_stage(directory_id: str) -> Tuple[str, str]:
+    """Get the stage of a directory, and the reason for it.
+
+    Args:
+        directory_id: Directory ID
+
+    Returns:
+        Directory stage, "Deleted" if the directory doesn't exist, and the stage reason
+    """
+    if not DIRECTORY_ID_PATTERN.fullmatch(directory_id or ""):
+        return "Deleted", ""
+    try:
+        response = ds_client.describe_directories(DirectoryIds=[directory_id])
+    except ClientError as error:
+        if error.response["Error"]["Code"] == "EntityDoesNotExistException":
+            return "Deleted", ""
+        raise
+    for directory in response["DirectoryDescriptions"]:
+        return directory["Stage"], directory.get("StageReason", "")
+    return "Deleted", ""
+
+
+def stage_check_due(started: float, now: float) -> bool:
+    """Check whether to check the directory stage on this poll.
+
+    Polls come every POLL_INTERVAL_MINUTES, but the stage is checked after BACKOFF_BASE_SECONDS and
+    then at doubling intervals up to BACKOFF_MAX_SECONDS. The poll events can't carry state between
+    polls, so the check times are worked out from the start time.
+
+    Args:
+        started: Time the directory was requested to be created or deleted
+        now: Current time
+
+    Returns:
+        Whether a check time has passed since the previous poll
+    """
+    elapsed = now - started
+    check_time = 0.0
+    wait = BACKOFF_BASE_SECONDS
+    while check_time + wait <= elapsed:
+        check_time += wait
+        wait = min(wait * 2, BACKOFF_MAX_SECONDS)
+    return check_time > 0 and elapsed - check_time < POLL_INTERVAL_MINUTES * 60
+
 
 def get_adconnector_parameters(params: dict) -> dict:
     """Creates a parameters dictionary for the ds:connect_directory API call to create AD Connector.
@@ -38,10 +135,7 @@ def get_adconnector_parameters(params: dict) -> dict:
         ADConnector Parameters
     """
     # Get AD Domain Join Credentials from Secrets Manager
-    response = secretsmanager_client.get_secret_value(
-        SecretId=params["DOMAIN_JOIN_SECRET_ID"]
-    )
-    secret = json.loads(response["SecretString"])
+    secret = get_secret(params["DOMAIN_JOIN_SECRET_ID"])
     # Create DNS Servers List
 
     return {
@@ -71,15 +165,46 @@ def create(event, _) -> str:
         context: runtime information
 
     Returns:
-        ADConnectorDirectoryResourceID
+        ADConnectorDirectoryResourceID, which poll_create waits for to become Active
     """
     logger.info("Create Event")
     logger.info(f"REQUEST RECEIVED: {json.dumps(event, default=str)}")
     adconnector_params = get_adconnector_parameters(event["ResourceProperties"])
     response = ds_client.connect_directory(**adconnector_params)
     logger.info(f"connect_directory_response = {json.dumps(response, default=str)}")
-    helper.PhysicalResourceId = response["DirectoryId"]
-    return helper.PhysicalResourceId
+    helper.Data["PollStartTime"] = time.time()
+    return response["DirectoryId"]
+
+
+@helper.poll_create
+def poll_create(event, _) -> Union[str, None]:
+    """Poll for the directory to become Active.
+
+    Args:
+        event: event data
+        context: runtime information
+
+    Raises:
+        RuntimeError: The directory could not be created.
+
+    Returns:
+        ADConnectorDirectoryResourceID once the directory is Active, None to keep polling
+    """
+    directory_id: str = event["CrHelperData"]["PhysicalResourceId"]
+    if not stage_check_due(event["CrHelperData"]["PollStartTime"], time.time()):
+        logger.info("Directory stage check skipped, backing off")
+        return None
+    stage, reason = get_directory_stage(directory_id)
+    logger.info(f"directory_id = {directory_id} --- stage = {stage}")
+    if stage == "Active":
+        helper.Data.pop("PollStartTime", None)
+        return directory_id
+    if stage in FAILED_STAGES or stage == "Deleted":
+        helper.Data.pop("PollStartTime", None)
+        # Keep the directory ID, so that the directory is deleted on rollback
+        helper.PhysicalResourceId = directory_id
+        raise RuntimeError(f"Directory '{directory_id}' is {stage}: {reason}")
+    return None
 
 
 @helper.update
@@ -103,14 +228,42 @@ def delete(event, _):
         event: event data
         context: runtime information
 
+    Returns:
+        ADConnectorDirectoryResourceID, which poll_delete waits for to be deleted
     """
     logger.info("Delete Event")
     logger.info(f"REQUEST RECEIVED: {json.dumps(event, default=str)}")
-    helper.PhysicalResourceId = event.get("PhysicalResourceId")
-    directory_id = helper.PhysicalResourceId
+    directory_id = event.get("PhysicalResourceId")
     logger.info(f"directory_id = {directory_id}")
+    helper.Data["PollStartTime"] = time.time()
+    if get_directory_stage(directory_id)[0] in ("Deleting", "Deleted"):
+        return directory_id
     response = ds_client.delete_directory(DirectoryId=directory_id)
     logger.info(f"delete_directory_response = {json.dumps(response, default=str)}")
+    return directory_id
+
+
+@helper.poll_delete
+def poll_delete(event, _) -> Union[str, None]:
+    """Poll for the directory to be deleted.
+
+    Args:
+        event: event data
+        context: runtime information
+
+    Returns:
+        ADConnectorDirectoryResourceID once the directory is deleted, None to keep polling
+    """
+    directory_id: str = event["PhysicalResourceId"]
+    if not stage_check_due(event["CrHelperData"]["PollStartTime"], time.time()):
+        logger.info("Directory stage check skipped, backing off")
+        return None
+    stage, _reason = get_directory_stage(directory_id)
+    logger.info(f"directory_id = {directory_id} --- stage = {stage}")
+    if stage == "Deleted":
+        helper.Data.pop("PollStartTime", None)
+        return directory_id
+    return None
 
 
 def lambda_handler(event, context):
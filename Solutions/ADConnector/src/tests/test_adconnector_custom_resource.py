@@ -0,0 +1,60 @@
+"""Tests for the secret cache and directory polling in the adconnector_custom_resource.py module."""
+
+import json
+import os
+import sys
+
+import pytest
+from botocore.stub import Stubber
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import adconnector_custom_resource as resource  # noqa: E402
+
+DIRECTORY_ID = "d-0123456789"
+
+
+def test_secrets_are_reused_until_they_expire(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(resource.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(resource, "secret_cache", {})
+    response = {"SecretString": json.dumps({"username": "join", "password": "secret"})}
+
+    with Stubber(resource.secretsmanager_client) as secretsmanager:
+        secretsmanager.add_response("get_secret_value", response, {"SecretId": "secret"})
+        assert resource.get_secret("secret")["password"] == "secret"
+        clock[0] += resource.SECRET_CACHE_TTL - 1
+        assert resource.get_secret("secret")["password"] == "secret"
+
+        secretsmanager.add_response("get_secret_value", response, {"SecretId": "secret"})
+        clock[0] += 1
+        assert resource.get_secret("secret")["password"] == "secret"
+        secretsmanager.assert_no_pending_responses()
+
+
+@pytest.mark.parametrize(
+    "elapsed, due",
+    [(30, False), (60, True), (120, False), (180, True), (300, False), (420, True), (800, False)],
+)
+def test_stage_checks_back_off(elapsed, due):
+    assert resource.stage_check_due(1000, 1000 + elapsed) is due
+
+
+@pytest.mark.parametrize("stage, result", [("Creating", None), ("Active", DIRECTORY_ID)])
+def test_create_polling_completes_when_the_directory_is_active(stage, result, monkeypatch):
+    monkeypatch.setattr(resource.time, "time", lambda: 1000 + 60)
+    event = {
+        "RequestType": "Create",
+        "PhysicalResourceId": DIRECTORY_ID,
+        "CrHelperData": {"PhysicalResourceId": DIRECTORY_ID, "PollStartTime": 1000},
+    }
+
+    with Stubber(resource.ds_client) as ds:
+        ds.add_response(
+            "describe_directories",
+            {"DirectoryDescriptions": [{"DirectoryId": DIRECTORY_ID, "Stage": stage}]},
+            {"DirectoryIds": [DIRECTORY_ID]},
+        )
+        assert resource.poll_create(event, None) == result
@@ -13,6 +13,8 @@ from __future__ import annotations
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import TYPE_CHECKING
 
 import boto3
@@ -33,8 +35,14 @@ try:
 except Exception as error:
     helper.init_failure(error)
 
+# Maximum number of directories, and of Directory Service API calls for a directory, to handle at the same time
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "4"))
+
+# Per-directory results are replaced by counts above this size, to fit the custom resource response
+MAX_RESULTS_BYTES = 2048
+
 if TYPE_CHECKING:
-    from typing import List, Tuple, Union
+    from typing import Any, Callable, Dict, List, Tuple, Union
 
 
 def get_directory_alias_and_sso_enabled_status(directory_id: str) -> Union[Tuple[str, bool], None]:
@@ -46,11 +54,9 @@ def get_directory_alias_and_sso_enabled_status(directory_id: str) -> Union[Tuple
     Returns:
         existing directory alias and current directory SSO state
     """
-    paginator = ds_client.get_paginator("describe_directories")
-    page_iterator = paginator.paginate(DirectoryIds=[directory_id])
-    for page in page_iterator:
-        for directory in page["DirectoryDescriptions"]:
-            return directory["Alias"], directory["SsoEnabled"]
+    response = ds_client.describe_directories(DirectoryIds=[directory_id])
+    for directory in response["DirectoryDescriptions"]:
+        return directory["Alias"], directory["SsoEnabled"]
     return None
 
 
@@ -70,28 +76,76 @@ def get_registered_topics(directory_id: str) -> List[str]:
     return registered_topics
 
 
-def register_directory_monitoring_topic(directory_id: str, topic: str) -> None:
+@dataclass(frozen=True)
+class DirectorySnapshot:
+    """Directory alias, SSO state, and registered SNS topics, fetched once per invocation."""
+
+    directory_id: str
+    alias: str
+    sso_enabled: bool
+    topics: List[str]
+
+    @classmethod
+    def fetch(cls, directory_id: str) -> DirectorySnapshot:
+        """Fetch the directory and its registered SNS topics at the same time.
+
+        Args:
+            directory_id: Directory ID
+
+        Raises:
+            ValueError: Directory was not found.
+
+        Returns:
+            Snapshot of the directory settings
+        """
+        with ThreadPoolExecutor(max_workers=min(2, MAX_WORKERS)) as executor:
+            directory = executor.submit(get_directory_alias_and_sso_enabled_status, directory_id)
+            topics = executor.submit(get_registered_topics, directory_id)
+        alias_and_sso_enabled = directory.result()
+        if alias_and_sso_enabled is None:
+            raise ValueError(f"Directory '{directory_id}' was not found.")
+        alias, sso_enabled = alias_and_sso_enabled
+        # Directories without an alias report their ID as the alias
+        if alias == directory_id:
+            alias = ""
+        logger.info(f"existing_alias={alias} --- existing_sso_status={sso_enabled}")
+        return cls(directory_id, alias, sso_enabled, topics.result())
+
+
+def run_in_parallel(*steps: Callable[[], None]) -> None:
+    """Run independent steps at the same time, and raise the first error after all of them are done.
+
+    Args:
+        steps: Functions that take no arguments
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(len(steps), MAX_WORKERS))) as executor:
+        futures = [executor.submit(step) for step in steps]
+    for future in futures:
+        future.result()
+
+
+def register_directory_monitoring_topic(directory_id: str, topic: str, registered_topics: List[str]) -> None:
     """Register SNS topic for directory monitoring.
 
     Args:
         directory_id: Directory ID
         topic: SNS topic name
+        registered_topics: Existing SNS Topics configured for directory monitoring
     """
-    registered_topics: list = get_registered_topics(directory_id)
     if topic not in registered_topics:
         response = ds_client.register_event_topic(DirectoryId=directory_id, TopicName=topic)
         logger.info(f"Directory Monitoring registered with Topic '{topic}'")
         logger.debug(f"register_topic_response = {json.dumps(response, default=str)}")
 
 
-def deregister_directory_monitoring_topic(directory_id: str, topic: str) -> None:
+def deregister_directory_monitoring_topic(directory_id: str, topic: str, registered_topics: List[str]) -> None:
     """Deregister SNS topic for directory monitoring.
 
     Args:
         directory_id: Directory ID
         topic: SNS topic name
+        registered_topics: Existing SNS Topics configured for directory monitoring
     """
-    registered_topics: list = get_registered_topics(directory_id)
     for registered_topic in registered_topics:
         if topic == registered_topic:
             response = ds_client.deregister_event_topic(DirectoryId=directory_id, TopicName=registered_topic)
@@ -156,6 +210,154 @@ def disable_directory_sso(directory_id: str, existing_sso_enabled: bool) -> None
         logger.info("Directory was already disabled for SSO")
 
 
+@dataclass(frozen=True)
+class DirectoryConfig:
+    """Desired settings of a directory."""
+
+    directory_id: str
+    alias: str
+    sso_enabled: bool
+    topics: List[str]
+
+    @classmethod
+    def from_properties(cls, properties: Dict[str, Any]) -> DirectoryConfig:
+        """Read the settings of a directory from an item of the 'Directories' property.
+
+        Args:
+            properties: DirectoryId, and optionally DirectoryAlias, EnableDirectorySSO, and DirectoryMonitoringTopicNames
+
+        Returns:
+            Desired settings of the directory
+        """
+        topics = properties.get("DirectoryMonitoringTopicNames", [])
+        if isinstance(topics, str):
+            topics = [topics]
+        return cls(
+            directory_id=properties["DirectoryId"],
+            alias=properties.get("DirectoryAlias", ""),
+            sso_enabled=properties.get("EnableDirectorySSO", "No") == "Yes",
+            topics=list(dict.fromkeys(topics)),
+        )
+
+
+def get_directory_configs(properties: Dict[str, Any]) -> Dict[str, DirectoryConfig]:
+    """Get the desired settings of each directory from the resource properties.
+
+    Without a 'Directories' property, the single directory of the DirectoryId, CreateDirectoryAlias, DirectoryAlias,
+    EnableDirectorySSO, and DirectoryMonitoringTopicName properties is used.
+
+    Args:
+        properties: Resource properties
+
+    Raises:
+        ValueError: The same directory is configured more than once.
+
+    Returns:
+        Desired settings by Directory ID
+    """
+    if "Directories" in properties:
+        configs = [DirectoryConfig.from_properties(directory) for directory in properties["Directories"]]
+    else:
+        create_alias = properties.get("CreateDirectoryAlias", "No") == "Yes"
+        configs = [
+            DirectoryConfig.from_properties(
+                {
+                    "DirectoryId": properties["DirectoryId"],
+                    "DirectoryAlias": properties.get("DirectoryAlias", "") if create_alias else "",
+                    "EnableDirectorySSO": properties.get("EnableDirectorySSO", "No"),
+                    "DirectoryMonitoringTopicNames": [properties["DirectoryMonitoringTopicName"]],
+                }
+            )
+        ]
+    directory_configs = {config.directory_id: config for config in configs}
+    if len(directory_configs) != len(configs):
+        raise ValueError("Each directory can only be configured once in the 'Directories' property.")
+    return directory_configs
+
+
+def reconcile_directory(directory_id: str, desired: Union[DirectoryConfig, None], previous: Union[DirectoryConfig, None]) -> List[str]:
+    """Apply the differences between the desired and the actual settings of a directory.
+
+    Topics that were previously configured, but are no longer desired, are deregistered. Without desired settings, the
+    previously configured topics are deregistered and SSO is disabled, as when the resource is deleted.
+
+    Args:
+        directory_id: Directory ID
+        desired: Desired settings, or None to remove the settings
+        previous: Previously configured settings, if any
+
+    Returns:
+        Changes made to the directory
+    """
+    snapshot = DirectorySnapshot.fetch(directory_id)
+    previous_topics = previous.topics if previous else []
+    desired_topics = desired.topics if desired else []
+    register = [topic for topic in desired_topics if topic not in snapshot.topics]
+    deregister = [topic for topic in previous_topics if topic in snapshot.topics and topic not in desired_topics]
+    sso_enabled = desired.sso_enabled if desired else False
+    changes = [f"RegisteredTopic={topic}" for topic in register] + [f"DeregisteredTopic={topic}" for topic in deregister]
+
+    def configure_alias_and_sso() -> None:
+        # Directory SSO needs the directory alias, so it is configured after it
+        if desired and desired.alias:
+            create_directory_alias(directory_id, desired.alias, snapshot.alias)
+        if sso_enabled:
+            enable_directory_sso(directory_id, snapshot.sso_enabled)
+        else:
+            disable_directory_sso(directory_id, snapshot.sso_enabled)
+
+    if desired and desired.alias and not snapshot.alias:
+        changes.append(f"CreatedAlias={desired.alias}")
+    if sso_enabled != snapshot.sso_enabled:
+        changes.append("EnabledSSO" if sso_enabled else "DisabledSSO")
+    if not desired and snapshot.alias:
+        logger.info("Directory Alias by design cannot be modified. Skipped!")
+
+    # Directory Monitoring, and Directory Alias & SSO
+    run_in_parallel(
+        *[lambda topic=topic: register_directory_monitoring_topic(directory_id, topic, snapshot.topics) for topic in register],
+        *[lambda topic=topic: deregister_directory_monitoring_topic(directory_id, topic, snapshot.topics) for topic in deregister],
+        configure_alias_and_sso,
+    )
+    return changes
+
+
+def reconcile_directories(desired: Dict[str, DirectoryConfig], previous: Dict[str, DirectoryConfig]) -> None:
+    """Reconcile MAX_WORKERS directories at a time, and report the changes made to each of them in the response data.
+
+    Args:
+        desired: Desired settings by Directory ID
+        previous: Previously configured settings by Directory ID
+
+    Raises:
+        RuntimeError: Some of the directories could not be configured.
+    """
+    directory_ids = list(desired) + [directory_id for directory_id in previous if directory_id not in desired]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            directory_id: executor.submit(reconcile_directory, directory_id, desired.get(directory_id), previous.get(directory_id))
+            for directory_id in directory_ids
+        }
+
+    results: Dict[str, str] = {}
+    failures: Dict[str, str] = {}
+    for directory_id, future in futures.items():
+        try:
+            results[directory_id] = ", ".join(future.result()) or "Unchanged"
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            failures[directory_id] = results[directory_id] = f"Failed: {error}"
+    logger.info(f"directory_results = {json.dumps(results)}")
+
+    # Keep the response within the 4,096 byte limit; the full results are in the log
+    if len(json.dumps(results)) > MAX_RESULTS_BYTES:
+        changed = sum(result != "Unchanged" for result in results.values())
+        results = {"Changed": str(changed - len(failures)), "Unchanged": str(len(results) - changed), "Failed": str(len(failures))}
+    helper.Data.update(results)
+
+    if failures:
+        raise RuntimeError(f"Failed to configure {len(failures)} of {len(directory_ids)} directories: {json.dumps(failures)}")
+
+
 @helper.create
 @helper.update
 def create_and_update(event, _):
@@ -168,32 +370,18 @@ def create_and_update(event, _):
     """
     logger.info(f"{event['RequestType']} Event")
     logger.info(f"REQUEST RECEIVED: {json.dumps(event, default=str)}")
-    directory_id: str = event["ResourceProperties"]["DirectoryId"]
-    create_alias: str = event["ResourceProperties"]["CreateDirectoryAlias"]
-    enable_sso: str = event["ResourceProperties"]["EnableDirectorySSO"]
-    alias: str = event["ResourceProperties"]["DirectoryAlias"]
-    topic: str = event["ResourceProperties"]["DirectoryMonitoringTopicName"]
-    # Directory Monitoring
-    register_directory_monitoring_topic(directory_id, topic)
-    # Existing Alias & SSO Status
-    existing_alias, existing_sso_status = get_directory_alias_and_sso_enabled_status(directory_id)
-    logger.info(f"existing_alias={existing_alias} --- existing_sso_status={existing_sso_status}")
-    # Directory Alias
-    if create_alias == "Yes":
-        create_directory_alias(directory_id, alias, existing_alias)
-        helper.Data.update({"AliasUrl": f"https://{alias}.awsapps.com"})
-    else:
-        helper.Data.update({"AliasUrl": ""})
-    # Directory SSO
-    if enable_sso == "Yes":
-        enable_directory_sso(directory_id, existing_sso_status)
-    else:
-        disable_directory_sso(directory_id, existing_sso_status)
+    properties = event["ResourceProperties"]
+    desired = get_directory_configs(properties)
+    previous = get_directory_configs(event["OldResourceProperties"]) if event["RequestType"] == "Update" else {}
+    reconcile_directories(desired, previous)
+    if "Directories" not in properties:
+        alias = next(iter(desired.values())).alias
+        helper.Data.update({"AliasUrl": f"https://{alias}.awsapps.com" if alias else ""})
 
 
 @helper.delete
 def delete(event, _):
-    """Delete Event from AWS CloudFormation. Deletes the ADConnector Directory.
+    """Delete Event from AWS CloudFormation. Removes the settings from the directories.
 
     Args:
         event: event data
@@ -202,17 +390,7 @@ def delete(event, _):
     """
     logger.info("Delete Event")
     logger.info(f"REQUEST RECEIVED: {json.dumps(event, default=str)}")
-    directory_id: str = event["ResourceProperties"]["DirectoryId"]
-    topic: str = event["ResourceProperties"]["DirectoryMonitoringTopicName"]
-    # Directory Monitoring
-    deregister_directory_monitoring_topic(directory_id, topic)
-    # Existing Alias & SSO Status
-    existing_alias, existing_sso_status = get_directory_alias_and_sso_enabled_status(directory_id)
-    # Directory Alias
-    if existing_alias:
-        logger.info("Directory Alias by design cannot be modified. Skipped!")
-    # Directory SSO
-    disable_directory_sso(directory_id, existing_sso_status)
+    reconcile_directories({}, get_directory_configs(event["ResourceProperties"]))
 
 
 def lambda_handler(event, context):
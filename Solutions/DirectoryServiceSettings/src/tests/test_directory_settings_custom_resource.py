@@ -0,0 +1,120 @@
+"""Tests for the directory reconciliation in the directory_settings_custom_resource.py module."""
+
+import os
+import sys
+
+import pytest
+from botocore.stub import Stubber
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# pylint: disable=wrong-import-position
+import directory_settings_custom_resource as resource  # noqa: E402
+
+
+@pytest.fixture(name="ds")
+def fixture_ds(monkeypatch):
+    "Stub the ds client, with one call at a time so that calls are made in order"
+    monkeypatch.setattr(resource, "MAX_WORKERS", 1)
+    monkeypatch.setattr(resource.helper, "Data", {})
+    with Stubber(resource.ds_client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def add_snapshot(ds, directory_id, alias="", sso_enabled=False, topics=()):
+    "Expect the calls that read the settings of a directory"
+    description = {
+        "DirectoryId": directory_id,
+        "Alias": alias or directory_id,
+        "SsoEnabled": sso_enabled,
+    }
+    ds.add_response(
+        "describe_directories",
+        {"DirectoryDescriptions": [description]},
+        {"DirectoryIds": [directory_id]},
+    )
+    ds.add_response(
+        "describe_event_topics",
+        {"EventTopics": [{"DirectoryId": directory_id, "TopicName": topic} for topic in topics]},
+        {"DirectoryId": directory_id},
+    )
+
+
+def directory(directory_id, alias="", sso="No", topics=()):
+    "Build an item of the Directories property"
+    return {
+        "DirectoryId": directory_id,
+        "DirectoryAlias": alias,
+        "EnableDirectorySSO": sso,
+        "DirectoryMonitoringTopicNames": list(topics),
+    }
+
+
+def test_only_the_differences_are_applied(ds):
+    event = {
+        "RequestType": "Create",
+        "ResourceProperties": {
+            "Directories": [
+                directory("d-1", alias="one", sso="Yes", topics=["a", "b"]),
+                directory("d-2", topics=["a", "b"]),
+            ],
+        },
+    }
+    add_snapshot(ds, "d-1", alias="one", sso_enabled=True, topics=["a", "b"])
+    add_snapshot(ds, "d-2", sso_enabled=True, topics=["a"])
+    ds.add_response("register_event_topic", {}, {"DirectoryId": "d-2", "TopicName": "b"})
+    ds.add_response("disable_sso", {}, {"DirectoryId": "d-2"})
+
+    resource.create_and_update(event, None)
+
+    assert resource.helper.Data == {"d-1": "Unchanged", "d-2": "RegisteredTopic=b, DisabledSSO"}
+
+
+def test_update_removes_topics_and_directories_that_are_no_longer_configured(ds):
+    event = {
+        "RequestType": "Update",
+        "ResourceProperties": {"Directories": [directory("d-1", topics=["a"])]},
+        "OldResourceProperties": {
+            "Directories": [
+                directory("d-1", topics=["a", "b"]),
+                directory("d-2", sso="Yes", topics=["a"]),
+            ],
+        },
+    }
+    add_snapshot(ds, "d-1", topics=["a", "b", "other"])
+    ds.add_response("deregister_event_topic", {}, {"DirectoryId": "d-1", "TopicName": "b"})
+    add_snapshot(ds, "d-2", alias="two", sso_enabled=True, topics=["a"])
+    ds.add_response("deregister_event_topic", {}, {"DirectoryId": "d-2", "TopicName": "a"})
+    ds.add_response("disable_sso", {}, {"DirectoryId": "d-2"})
+
+    resource.create_and_update(event, None)
+
+    assert resource.helper.Data == {
+        "d-1": "DeregisteredTopic=b",
+        "d-2": "DeregisteredTopic=a, DisabledSSO",
+    }
+
+
+def test_failed_directories_are_reported_after_the_others_are_reconciled(ds):
+    event = {
+        "RequestType": "Create",
+        "ResourceProperties": {
+            "Directories": [directory("d-1", alias="new"), directory("d-2", topics=["a"])],
+        },
+    }
+    add_snapshot(ds, "d-1", alias="old")
+    add_snapshot(ds, "d-2")
+    ds.add_response("register_event_topic", {}, {"DirectoryId": "d-2", "TopicName": "a"})
+
+    with pytest.raises(RuntimeError, match="Failed to configure 1 of 2 directories"):
+        resource.create_and_update(event, None)
+
+    assert resource.helper.Data["d-1"].startswith("Failed: Directory already has a different alias")
+    assert resource.helper.Data["d-2"] == "RegisteredTopic=a"
+
+
+def test_directories_can_only_be_configured_once():
+    with pytest.raises(ValueError):
+        resource.get_directory_configs({"Directories": [directory("d-1"), directory("d-1")]})
@@ -0,0 +1,545 @@
+"""
+Benchmark macro and custom resource handlers on synthetic inputs.
+
+Each scenario builds a large event for one handler and runs the handler on
+it in a fresh Python process, so that nothing is cached from a previous
+run, and reports how long the handler took. For example:
+
+    python scripts/benchmark_macros.py count-5000
+
+With --ref, the same scenarios also run against the handler code at a git
+revision, so a change can be compared with the code before it:
+
+    python scripts/benchmark_macros.py --ref HEAD~1 count-5000
+
+With --memory, one more run reports the peak resident set size of the
+process that ran the handler, and what it was before the handler was called.
+"""
+
+import argparse
+import base64
+import contextlib
+import http.server
+import importlib
+import io
+import itertools
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLOUDFORMATION = os.path.join(ROOT, "CloudFormation")
+
+
+def count_event(copies, collision=False):
+    """
+    Return an event for the Count macro with one resource copied many times,
+    and with a collision, another resource with the name of the second copy
+    """
+    event = {
+        "requestId": "benchmark",
+        "templateParameterValues": {},
+        "fragment": {
+            "Resources": {
+                "Bucket": {
+                    "Type": "AWS::S3::Bucket",
+                    "Count": copies,
+                    "Properties": {
+                        "BucketName": "bucket-%d",
+                        "Tags": [
+                            {"Key": "Copy", "Value": "%d"},
+                            {"Key": "Team", "Value": "benchmark"},
+                        ],
+                        "LifecycleConfiguration": {
+                            "Rules": [{"Id": "expire", "Status": "Enabled", "ExpirationInDays": 30}]
+                        },
+                    },
+                }
+            }
+        },
+    }
+    if collision:
+        event["fragment"]["Resources"]["Bucket2"] = {"Type": "AWS::S3::Bucket"}
+    return event
+
+
+def pyplate_event(copies, lines):
+    "Return an event for the PyPlate macro with the same snippet in many places"
+    snippet = "#!PyPlate\n" + "\n".join(
+        f"value{line} = sum(range({line})) + len(params)" for line in range(lines)
+    ) + "\noutput = value0"
+    return {
+        "requestId": "benchmark",
+        "templateParameterValues": {},
+        "accountId": "123456789012",
+        "region": "us-east-1",
+        "fragment": {
+            "Resources": {
+                f"Queue{index}": {
+                    "Type": "AWS::SQS::Queue",
+                    "Properties": {"DelaySeconds": snippet},
+                }
+                for index in range(copies)
+            }
+        },
+    }
+
+
+def explode_event(resources, entries):
+    """
+    Return an event for the Explode macro with many resources exploded over
+    a mapping with many entries
+    """
+    return {
+        "requestId": "benchmark",
+        "fragment": {
+            "Mappings": {
+                "Subnets": {
+                    f"Subnet{entry}": {
+                        "Cidr": f"10.0.{entry}.0/24",
+                        "Zone": f"us-east-1{'abc'[entry % 3]}",
+                        "Size": entry,
+                    }
+                    for entry in range(entries)
+                }
+            },
+            "Resources": {
+                f"Instance{index}": {
+                    "Type": "AWS::EC2::Instance",
+                    "ExplodeMap": "Subnets",
+                    "Properties": {
+                        "AvailabilityZone": "!Explode Zone",
+                        "VolumeSize": "!Explode Size",
+                        "Tags": [
+                            {"Key": "Name", "Value": f"instance-{index}-!Explode Cidr"},
+                            {"Key": "Team", "Value": "benchmark"},
+                        ],
+                        "BlockDeviceMappings": [
+                            {"DeviceName": f"/dev/sd{letter}", "Ebs": {"VolumeType": "gp3"}}
+                            for letter in "bcdefgh"
+                        ],
+                        "UserData": {"Fn::Base64": "#!/bin/bash\necho setup\n" * 20},
+                    },
+                }
+                for index in range(resources)
+            },
+        },
+    }
+
+
+REGION_ACCOUNT = "us-west-2:123456789012"
+
+
+def roles_event(roles):
+    "Return an event for the ExecutionRoleBuilder macro with many roles"
+    return {
+        "requestId": "benchmark",
+        "fragment": {
+            "Resources": {
+                f"Role{index}": {
+                    "Type": "AWS::IAM::Role",
+                    "Properties": {
+                        "Type": "Lambda",
+                        "Name": f"ExecutionRole{index}",
+                        "Permissions": [
+                            {"ReadOnly": f"arn:aws:s3:::bucket{index}"},
+                            {"ReadWrite": f"arn:aws:dynamodb:{REGION_ACCOUNT}:table/t{index}"},
+                            {"ReadOnly": f"arn:aws:ssm:{REGION_ACCOUNT}:parameter/app{index}/*"},
+                            {"ReadOnly": f"arn:aws:kms:{REGION_ACCOUNT}:key/key{index}"},
+                        ],
+                    },
+                }
+                for index in range(roles)
+            }
+        },
+    }
+
+
+def s3_object_events(objects):
+    "Return events for Custom::S3Object resources that each write one object"
+    return [
+        {
+            "RequestType": "Create",
+            "ResourceType": "Custom::S3Object",
+            "ResourceProperties": {
+                "Target": {"Bucket": "bucket", "Key": f"object{index}"},
+                "Body": f"content {index}",
+            },
+        }
+        for index in range(objects)
+    ]
+
+
+def s3_object_set_events(objects):
+    "Return the event for a Custom::S3ObjectSet resource that writes many objects"
+    return [
+        {
+            "RequestType": "Create",
+            "ResourceType": "Custom::S3ObjectSet",
+            "LogicalResourceId": "Objects",
+            "ResourceProperties": {
+                "Target": {"Bucket": "bucket"},
+                "Objects": {f"object{index}": {"Body": f"content {index}"}
+                            for index in range(objects)},
+            },
+        }
+    ]
+
+
+def s3_content_events(**source):
+    "Return the event for a Custom::S3Object resource that writes content from a source"
+    return [
+        {
+            "RequestType": "Create",
+            "ResourceType": "Custom::S3Object",
+            "ResourceProperties": dict(source, Target={"Bucket": "bucket", "Key": "content"}),
+        }
+    ]
+
+
+def serve_content(size):
+    """
+    Serve size bytes from a local HTTP server in the background, generated
+    as they are sent, and return the URL
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        "Sends size bytes in response to any GET"
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            "Send the content a megabyte at a time"
+            self.send_response(200)
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            chunk = bytes(1024 * 1024)
+            for start in range(0, size, len(chunk)):
+                self.wfile.write(chunk[:size - start])
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            "Don't log requests"
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/content"
+
+
+# Time each request to the S3 stand-in takes, like a round trip to S3
+S3_LATENCY = 0.005
+
+
+class S3StandIn:
+    """
+    Stand-in for an S3 client that waits S3_LATENCY on each request and keeps
+    only the size of each object, so that it doesn't add to the memory used
+    """
+
+    class NoSuchKey(Exception):
+        "Raised for objects that don't exist"
+
+    class ClientError(Exception):
+        "Raised by head_object for objects that don't exist"
+        response = {"Error": {"Code": "404"}}
+
+    def __init__(self):
+        self.exceptions = SimpleNamespace(NoSuchKey=self.NoSuchKey, ClientError=self.ClientError)
+        self.sizes = {}
+
+    def put_object(self, Bucket, Key, Body, **_):  # pylint: disable=invalid-name
+        "Store the size of an object"
+        time.sleep(S3_LATENCY)
+        self.sizes[(Bucket, Key)] = len(Body)
+        return {}
+
+    def get_object(self, Key, **_):  # pylint: disable=invalid-name
+        "Objects can't be read back"
+        time.sleep(S3_LATENCY)
+        raise self.NoSuchKey(Key)
+
+    def head_object(self, Key, **_):  # pylint: disable=invalid-name
+        "Objects have no metadata to compare with"
+        time.sleep(S3_LATENCY)
+        raise self.ClientError(Key)
+
+    def create_multipart_upload(self, **_):
+        "Start a multipart upload"
+        time.sleep(S3_LATENCY)
+        return {"UploadId": "upload"}
+
+    def upload_part(self, Bucket, Key, PartNumber, Body, **_):  # pylint: disable=invalid-name
+        "Add the size of a part to its object"
+        time.sleep(S3_LATENCY)
+        self.sizes[(Bucket, Key)] = self.sizes.get((Bucket, Key), 0) + len(Body)
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, **_):
+        "Finish a multipart upload"
+        time.sleep(S3_LATENCY)
+        return {}
+
+    def abort_multipart_upload(self, **_):
+        "Abandon a multipart upload"
+        time.sleep(S3_LATENCY)
+        return {}
+
+
+def invoke_handler(module, event):
+    "Invoke a macro handler"
+    module.handler(event, None)
+
+
+def invoke_s3_handler(module, events):
+    """
+    Invoke the S3Objects resource handler on each of a list of events, one
+    after the other as for separate resources, with the S3 stand-in and
+    without sending the responses to CloudFormation
+    """
+    module.s3_client = S3StandIn()
+    module.send = lambda *args, **kwargs: None
+    for event in events:
+        module.handler(event, None)
+
+
+def getfromjson_event(search):
+    "Return an event for the getfromjson custom resource reading a document from S3"
+    return {
+        "RequestType": "Create",
+        "ResourceProperties": {"json_data_source": "s3://bucket/document.json", "search": search},
+    }
+
+
+# Size of the document getfromjson reads
+JSON_DOCUMENT_SIZE = 100 * 1000 * 1000
+
+
+class JsonDocument(io.RawIOBase):
+    """
+    JSON document of about size bytes, a list of items followed by an
+    "answer", generated as it is read so that it takes no memory of its own
+    """
+
+    ITEM = json.dumps({"name": "item", "tags": ["a", "b"], "props": {"x": 1.5}}).encode()
+
+    def __init__(self, size):
+        super().__init__()
+        block = (b", " + self.ITEM) * 1000
+        self.chunks = itertools.chain(
+            [b'{"items": [' + self.ITEM],
+            itertools.repeat(block, size // len(block)),
+            [b'], "answer": 42}'],
+        )
+        self.pending = b""
+
+    def readable(self):
+        "The document can be read"
+        return True
+
+    def readinto(self, buffer):
+        "Fill buffer with the next part of the document"
+        if not self.pending:
+            self.pending = next(self.chunks, b"")
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def invoke_getfromjson(module, event):
+    "Invoke the getfromjson handler, with a stand-in for S3 that returns the document"
+    s3_client = SimpleNamespace(
+        get_object=lambda **_: {"Body": io.BufferedReader(JsonDocument(JSON_DOCUMENT_SIZE))}
+    )
+    module._get_client = lambda service: s3_client  # pylint: disable=protected-access
+    if not module.lambda_handler(event, None):
+        raise RuntimeError("getfromjson failed")
+
+
+def invoke_getfromjson_load(module, event):
+    "Look the value up after loading the whole document, as inline json_data is"
+    document = json.load(io.BufferedReader(JsonDocument(JSON_DOCUMENT_SIZE)))
+    module._traverse(  # pylint: disable=protected-access
+        data_from_json=document, search=event["ResourceProperties"]["search"]
+    )
+
+
+COUNT = "MacrosExamples/Count/src"
+EXPLODE = "MacrosExamples/Explode/lambda"
+S3_OBJECTS = "MacrosExamples/S3Objects/lambda"
+GETFROMJSON = "CustomResources/getfromjson/src"
+
+# name: (directory of the handler under CloudFormation, module, function
+#        building the event, function invoking the handler, invocations)
+SCENARIOS = {
+    "count-5000": (COUNT, "index", lambda: count_event(5000), invoke_handler, 1),
+    "count-50000": (COUNT, "index", lambda: count_event(50000), invoke_handler, 1),
+    "count-collision": (
+        COUNT, "index", lambda: count_event(50000, collision=True), invoke_handler, 1
+    ),
+    # More resources, and more entries in the mapping they are exploded over
+    "explode-100x20": (EXPLODE, "explode", lambda: explode_event(100, 20), invoke_handler, 1),
+    "explode-100x200": (EXPLODE, "explode", lambda: explode_event(100, 200), invoke_handler, 1),
+    "explode-1000x200": (EXPLODE, "explode", lambda: explode_event(1000, 200), invoke_handler, 1),
+    # Invoked twice, to show a cold and a warm invocation
+    "pyplate-500": (
+        "MacrosExamples/PyPlate", "handler", lambda: pyplate_event(500, 60), invoke_handler, 2
+    ),
+    "roles-500": (
+        "MacrosExamples/ExecutionRoleBuilder/lambda", "index", lambda: roles_event(500),
+        invoke_handler, 1,
+    ),
+    # The same objects written by one resource each, and by one object set
+    "s3-objects-1000": (
+        S3_OBJECTS, "resource", lambda: s3_object_events(1000), invoke_s3_handler, 1
+    ),
+    "s3-objectset-1000": (
+        S3_OBJECTS, "resource", lambda: s3_object_set_events(1000), invoke_s3_handler, 1
+    ),
+    # Large objects, to compare memory use with --memory
+    "s3-url-512mb": (
+        S3_OBJECTS, "resource",
+        lambda: s3_content_events(URL=serve_content(512 * 1024 * 1024)), invoke_s3_handler, 1,
+    ),
+    "s3-base64-64mb": (
+        S3_OBJECTS, "resource",
+        lambda: s3_content_events(Base64Body=base64.b64encode(bytes(64 * 1024 * 1024)).decode()),
+        invoke_s3_handler, 1,
+    ),
+    # The last value and one near the start of a 100 MB document, streamed,
+    # and the last value after loading the whole document
+    "getfromjson-stream-last": (
+        GETFROMJSON, "getfromjson", lambda: getfromjson_event('["answer"]'),
+        invoke_getfromjson, 1,
+    ),
+    "getfromjson-stream-first": (
+        GETFROMJSON, "getfromjson", lambda: getfromjson_event('["items"][0]["name"]'),
+        invoke_getfromjson, 1,
+    ),
+    "getfromjson-load-last": (
+        GETFROMJSON, "getfromjson", lambda: getfromjson_event('["answer"]'),
+        invoke_getfromjson_load, 1,
+    ),
+}
+
+
+def source_directory(directory, ref, tempdir):
+    "Return a directory with the handler's modules, checked out at ref if given"
+    path = os.path.join(CLOUDFORMATION, directory)
+    if ref is None:
+        return path
+    checkout = os.path.join(tempdir, directory)
+    os.makedirs(checkout, exist_ok=True)
+    for name in os.listdir(path):
+        if not name.endswith(".py"):
+            continue
+        shown = subprocess.run(
+            ["git", "-C", path, "show", f"{ref}:./{name}"],
+            capture_output=True, text=True, check=False,
+        )
+        # Modules added after ref are left out
+        if shown.returncode == 0:
+            with open(os.path.join(checkout, name), "w", encoding="utf-8") as f:
+                f.write(shown.stdout)
+    return checkout
+
+
+def peak_rss_mb():
+    "Return the peak resident set size of this process so far"
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def child(args):
+    "Import the handler and time its invocations on the scenario's events"
+    _, module_name, build_event, invoke, invocations = SCENARIOS[args.scenario]
+    # Handlers that create boto3 clients on import need a region
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    sys.path.insert(0, args.source)
+    # Handlers can have the name of a standard library module that is
+    # already imported, such as resource
+    sys.modules.pop(module_name, None)
+    module = importlib.import_module(module_name)
+
+    result = {"invocations_ms": []}
+    for _ in range(invocations):
+        event = build_event()
+        # The handlers print progress, which would dominate the timing
+        if args.memory:
+            result["before_mb"] = peak_rss_mb()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            invoke(module, event)
+            elapsed = time.perf_counter() - start
+        result["invocations_ms"].append(elapsed * 1000)
+    if args.memory:
+        result["peak_mb"] = peak_rss_mb()
+    print("BENCHMARK " + json.dumps(result))
+
+
+def run(scenario, source, memory=False):
+    "Run a scenario in a fresh process and return its result"
+    command = [sys.executable, __file__, "--child", "--source", source, scenario]
+    if memory:
+        command.append("--memory")
+    process = subprocess.run(command, capture_output=True, text=True, check=False)
+    for line in process.stdout.splitlines():
+        if line.startswith("BENCHMARK "):
+            return json.loads(line[len("BENCHMARK "):])
+    raise RuntimeError(f"{scenario} failed with the code in {source}:\n{process.stderr}")
+
+
+def report(args, scenario, source, label):
+    "Print the timings of a scenario's invocations over several runs"
+    results = [run(scenario, source) for _ in range(args.runs)]
+    for index in range(len(results[0]["invocations_ms"])):
+        times = [result["invocations_ms"][index] for result in results]
+        print(f"  {label:<12} invocation {index + 1}  median {statistics.median(times):8.1f}ms"
+              f"  min {min(times):8.1f}ms")
+    if args.memory:
+        result = run(scenario, source, memory=True)
+        print(f"  {label:<12} peak RSS      {result['peak_mb']:8.1f}MB"
+              f"  before the handler {result['before_mb']:8.1f}MB")
+
+
+def main():
+    "Parse the arguments and report on each scenario"
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "scenario", nargs="*", help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)"
+    )
+    parser.add_argument("--ref", help="git revision to compare the working tree with")
+    parser.add_argument("--memory", action="store_true", help="report peak RSS")
+    parser.add_argument(
+        "--runs", type=int, default=5, help="number of runs of each scenario (default: 5)"
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--source", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    unknown = set(args.scenario) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.child:
+        args.scenario = args.scenario[0]
+        child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        for scenario in args.scenario or SCENARIOS:
+            directory = SCENARIOS[scenario][0]
+            print(scenario)
+            if args.ref:
+                report(args, scenario, source_directory(directory, args.ref, tempdir), args.ref)
+            report(args, scenario, source_directory(directory, None, tempdir), "working tree")
+
+
+if __name__ == "__main__":
+    main()
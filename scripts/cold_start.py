@@ -0,0 +1,198 @@
+"""
+Measure the cold start of Lambda handler modules.
+
+Each run imports the module in a fresh Python process, so that nothing is
+already imported or cached, and reports how long the import took and, given
+an event, how long the first (cold) and second (warm) invocations of the
+handler took. For example:
+
+    python scripts/cold_start.py --offline --fake-module cfnresponse \\
+        --env STACK_NAME=test --event event.json IoT/reset_function.py
+
+With --offline, AWS API calls aren't sent and return an empty response, so
+that clients are still created and the handler runs without credentials.
+With --top, one more run lists the imports that take the longest.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+LABELS = (
+    ("import_ms", "import"),
+    ("first_ms", "first invocation"),
+    ("warm_ms", "warm invocation"),
+)
+
+
+def offline():
+    "Make every AWS API call return an empty response without sending it"
+    # pylint: disable=import-outside-toplevel
+    from botocore.awsrequest import AWSResponse
+    from botocore.client import ClientCreator
+
+    create_client = ClientCreator.create_client
+
+    def empty_response(**_):
+        return AWSResponse(None, 200, {}, None), {}
+
+    def create_offline_client(self, *args, **kwargs):
+        client = create_client(self, *args, **kwargs)
+        client.meta.events.register_first("before-call.*.*", empty_response)
+        return client
+
+    ClientCreator.create_client = create_offline_client
+
+
+def lambda_context(name):
+    "Return a stand-in for the Lambda context object"
+    return SimpleNamespace(
+        function_name=name,
+        function_version="$LATEST",
+        invoked_function_arn=f"arn:aws:lambda:us-east-1:123456789012:function:{name}",
+        memory_limit_in_mb=128,
+        aws_request_id="cold-start",
+        log_group_name=f"/aws/lambda/{name}",
+        log_stream_name="cold-start",
+        get_remaining_time_in_millis=lambda: 300000,
+    )
+
+
+def invoke(handler, event, context):
+    "Invoke the handler and return the time it took and any error"
+    start = time.perf_counter()
+    error = None
+    try:
+        handler(event, context)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        error = f"{type(e).__name__}: {e}"
+    return (time.perf_counter() - start) * 1000, error
+
+
+def child(args):
+    "Import the module and invoke its handler once cold and once warm"
+    for name in args.fake_module:
+        sys.modules[name] = mock.MagicMock()
+
+    path = os.path.abspath(args.module[0])
+    sys.path.insert(0, os.path.dirname(path))
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    start = time.perf_counter()
+    # Counted as part of the import, since the module would import botocore
+    if args.offline:
+        offline()
+    module = importlib.import_module(name)
+    result = {"import_ms": (time.perf_counter() - start) * 1000}
+
+    if args.event:
+        with open(args.event, encoding="utf-8") as f:
+            event = json.load(f)
+        default = "handler" if hasattr(module, "handler") else "lambda_handler"
+        handler = getattr(module, args.handler or default)
+        context = lambda_context(name)
+        result["first_ms"], result["error"] = invoke(handler, event, context)
+        result["warm_ms"], _ = invoke(handler, event, context)
+
+    # Handlers may print, so mark the result line
+    print("COLD_START " + json.dumps(result))
+
+
+def run(args, module, importtime=False):
+    "Run the module in a fresh process and return its result and import log"
+    env = dict(os.environ)
+    env.setdefault("AWS_REGION", "us-east-1")
+    env.setdefault("AWS_DEFAULT_REGION", env["AWS_REGION"])
+    env.update(item.split("=", 1) for item in args.env)
+
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += [__file__, "--child", module]
+    for name in args.fake_module:
+        command += ["--fake-module", name]
+    if args.offline:
+        command.append("--offline")
+    if args.event:
+        command += ["--event", args.event]
+    if args.handler:
+        command += ["--handler", args.handler]
+
+    process = subprocess.run(
+        command, env=env, capture_output=True, text=True, check=False
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith("COLD_START "):
+            return json.loads(line[len("COLD_START "):]), process.stderr
+    raise RuntimeError(f"{module} failed:\n{process.stderr}")
+
+
+def slowest_imports(log, top):
+    "Return the top-level imports with the largest cumulative import times"
+    imports = []
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, package = line[len("import time:"):].split("|")
+        # Nested imports are indented below the import that triggered them
+        if not package.startswith("  "):
+            imports.append((int(cumulative) / 1000, package.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    "Parse the arguments and report on each module"
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("module", nargs="+", help="path of a handler module")
+    parser.add_argument("--event", help="JSON file with an event to invoke the handler with")
+    parser.add_argument("--handler", help="handler name (default: handler or lambda_handler)")
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="NAME=VALUE",
+        help="environment variable for the module",
+    )
+    parser.add_argument(
+        "--fake-module", action="append", default=[], metavar="NAME",
+        help="module to replace with a mock, such as cfnresponse",
+    )
+    parser.add_argument(
+        "--offline", action="store_true", help="return empty responses instead of calling AWS"
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="number of cold starts to measure (default: 5)"
+    )
+    parser.add_argument("--top", type=int, default=0, help="list this many of the slowest imports")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    for module in args.module:
+        results = [run(args, module)[0] for _ in range(args.runs)]
+        print(module)
+        for key, label in LABELS:
+            if key in results[0]:
+                times = [result[key] for result in results]
+                median = statistics.median(times)
+                print(f"  {label:<17} median {median:8.1f}ms  min {min(times):8.1f}ms")
+        if results[0].get("error"):
+            print(f"  handler raised {results[0]['error']}")
+        if args.top:
+            _, log = run(args, module, importtime=True)
+            print("  slowest imports:")
+            for cumulative, package in slowest_imports(log, args.top):
+                print(f"    {cumulative:8.1f}ms  {package}")
+
+
+if __name__ == "__main__":
+    main()